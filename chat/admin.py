@@ -1,26 +1,51 @@
 from django.contrib import admin
-from .models import Room, Message, PrivateMessage, UserProfile
+from django.db.models import Q
+from .models import Room, Message, PrivateMessage, UserProfile, ArchiveSegment
+from .search import build_match, is_available, match_ids
+
+
+class FullTextSearchMixin:
+    """
+    Recherche admin via l'index FTS5 pour content (au lieu d'un LIKE '%x%'
+    sur toute la table); les autres search_fields restent en LIKE.
+    """
+    fts_fallback_fields = []
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not is_available() or build_match(search_term) is None:
+            return super().get_search_results(request, queryset, search_term)
+        by_username = queryset.filter(self.fallback_filter(search_term))
+        by_content = queryset.filter(pk__in=match_ids(queryset.model, search_term))
+        return by_content | by_username, False
+
+    def fallback_filter(self, search_term):
+        q = Q()
+        for field in self.fts_fallback_fields:
+            q |= Q(**{f'{field}__icontains': search_term})
+        return q
 
 
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
-    list_display = ['name', 'created_by', 'created_at']
+    list_display = ['name', 'created_by', 'created_at', 'retention_days']
     search_fields = ['name', 'description']
     list_filter = ['created_at']
 
 
 @admin.register(Message)
-class MessageAdmin(admin.ModelAdmin):
+class MessageAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['user', 'room', 'content', 'timestamp']
     list_filter = ['room', 'timestamp']
     search_fields = ['content', 'user__username']
+    fts_fallback_fields = ['user__username']
 
 
 @admin.register(PrivateMessage)
-class PrivateMessageAdmin(admin.ModelAdmin):
+class PrivateMessageAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['sender', 'receiver', 'content', 'timestamp', 'is_read']
     list_filter = ['timestamp', 'is_read']
     search_fields = ['content', 'sender__username', 'receiver__username']
+    fts_fallback_fields = ['sender__username', 'receiver__username']
 
 
 @admin.register(UserProfile)
@@ -28,3 +53,10 @@ class UserProfileAdmin(admin.ModelAdmin):
     list_display = ['user', 'is_online', 'last_seen']
     list_filter = ['is_online']
     search_fields = ['user__username']
+
+
+@admin.register(ArchiveSegment)
+class ArchiveSegmentAdmin(admin.ModelAdmin):
+    list_display = ['path', 'offset', 'count', 'first_ts', 'last_ts', 'created_at']
+    list_filter = ['room']
+    search_fields = ['path', 'pair_key']
@@ -4,3 +4,30 @@ from django.apps import AppConfig
 class ChatConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chat'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+        from .metrics import install_db_wrapper
+        post_migrate.connect(ensure_search_index, sender=self)
+        post_migrate.connect(ensure_blob_triggers, sender=self)
+        connection_created.connect(install_db_wrapper)
+
+
+def ensure_search_index(sender, using, **kwargs):
+    # Une migration qui reconstruit chat_message (SQLite) supprime les triggers FTS
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+    from .search import INDEX_MIGRATION, ensure_index
+    if INDEX_MIGRATION in MigrationRecorder(connections[using]).applied_migrations():
+        ensure_index(using)
+
+
+def ensure_blob_triggers(sender, using, **kwargs):
+    # Idem pour les triggers de comptage des références aux blobs
+    from django.db import connections
+    from django.db.migrations.recorder import MigrationRecorder
+    from .blobs import TRIGGERS_MIGRATION, ensure_triggers
+    if TRIGGERS_MIGRATION in MigrationRecorder(connections[using]).applied_migrations():
+        ensure_triggers(using)
@@ -0,0 +1,377 @@
+"""
+Archivage des anciens messages hors de la base (rétention par salon).
+
+Les messages plus anciens que la durée de rétention (Room.retention_days,
+sinon ROOM_RETENTION_DAYS; PRIVATE_RETENTION_DAYS pour les conversations
+privées) sont déplacés, par lots, dans des fichiers NDJSON compressés:
+
+    ARCHIVE_ROOT/rooms/<id salon>/<AAAA-MM>.ndjson.gz
+    ARCHIVE_ROOT/private/<id1>-<id2>/<AAAA-MM>.ndjson.gz
+
+Chaque lot est ajouté en fin de fichier comme un membre gzip indépendant
+(fichier en ajout seul, jamais réécrit) et décrit par une ligne
+ArchiveSegment: position et longueur dans le fichier, premier et dernier
+(timestamp, id). Les fichiers des messages archivés restent référencés par
+ArchivedFile (compteurs de blobs.py, droits de media.py).
+
+Écriture du membre (fsync), création de l'index et suppression des messages
+se font dans la même transaction: après une coupure, un membre écrit mais
+non indexé est ignoré (on lit par position), les messages sont toujours en
+base.
+
+Lecture (history.py): quand la pagination dépasse le plus ancien message en
+base, les segments nécessaires sont décompressés (cache LRU) et leurs lignes
+réhydratées en instances Message / PrivateMessage non enregistrées
+(attribut archived=True).
+
+Limite: la recherche plein texte (search.py) n'indexe que la base. La
+suppression d'un message archivé déclenche les triggers *_fts_ad: ses
+lignes quittent l'index et /search/ ne les trouve plus (la réponse le
+signale par includes_archived=False).
+"""
+import gzip
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedFile, ArchiveSegment, Conversation, Message, PrivateMessage, Room
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+# Segments décompressés gardés en mémoire (par processus)
+CACHED_SEGMENTS = 32
+
+_cache = OrderedDict()
+
+
+def to_micros(timestamp):
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def from_micros(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def archive_path(relative_path):
+    return os.path.join(settings.ARCHIVE_ROOT, relative_path)
+
+
+def segment_path(message, month):
+    if isinstance(message, Message):
+        return f'rooms/{message.room_id}/{month}.ndjson.gz'
+    return f"private/{message.pair_key.replace(':', '-')}/{month}.ndjson.gz"
+
+
+# ---------- Écriture ----------
+def room_record(msg):
+    return {
+        'id': msg.id, 'ts': to_micros(msg.timestamp), 'seq': msg.seq,
+        'room': msg.room_id, 'user': msg.user_id, 'username': msg.user.username,
+        'content': msg.content, 'image': msg.image.name if msg.image else '',
+        'file': msg.file.name if msg.file else '',
+        'image_width': msg.image_width, 'image_height': msg.image_height,
+        'image_variants': msg.image_variants,
+    }
+
+
+def private_record(msg):
+    return {
+        'id': msg.id, 'ts': to_micros(msg.timestamp), 'pair_key': msg.pair_key,
+        'sender': msg.sender_id, 'receiver': msg.receiver_id,
+        'content': msg.content, 'image': msg.image.name if msg.image else '',
+        'file': msg.file.name if msg.file else '',
+        'image_width': msg.image_width, 'image_height': msg.image_height,
+        'image_variants': msg.image_variants,
+        # Un message archivé est considéré comme lu (voir archive_private)
+        'is_read': True,
+    }
+
+
+def referenced_files(record):
+    # Les miniatures suivent leur original (blobs.delete_blob_files, media.can_access)
+    return [name for name in (record['image'], record['file']) if name]
+
+
+def _append_member(relative_path, records):
+    """Ajoute un membre gzip en fin de fichier. Renvoie (position, longueur)."""
+    data = ''.join(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n' for record in records)
+    member = gzip.compress(data.encode(), compresslevel=9)
+    path = archive_path(relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'ab') as f:
+        offset = f.seek(0, os.SEEK_END)
+        f.write(member)
+        f.flush()
+        os.fsync(f.fileno())
+    return offset, len(member)
+
+
+def write_segments(messages, to_record):
+    """
+    Archive des messages d'un même salon ou d'une même conversation (ordre
+    chronologique): un segment par mois. À appeler dans une transaction.
+    """
+    by_month = OrderedDict()
+    for message in messages:
+        by_month.setdefault(message.timestamp.strftime('%Y-%m'), []).append(message)
+
+    segments = []
+    for month, month_messages in by_month.items():
+        first, last = month_messages[0], month_messages[-1]
+        records = [to_record(message) for message in month_messages]
+        relative_path = segment_path(first, month)
+        offset, length = _append_member(relative_path, records)
+        segment = ArchiveSegment.objects.create(
+            room_id=getattr(first, 'room_id', None),
+            pair_key=getattr(first, 'pair_key', ''),
+            path=relative_path, offset=offset, length=length, count=len(records),
+            first_ts=first.timestamp, first_id=first.id,
+            last_ts=last.timestamp, last_id=last.id,
+        )
+        # Avant la suppression des messages: les blobs ne passent jamais à 0 référence
+        ArchivedFile.objects.bulk_create([
+            ArchivedFile(segment=segment, name=name)
+            for record in records for name in referenced_files(record)
+        ])
+        segments.append(segment)
+    return segments
+
+
+def retention_cutoff(days, now=None):
+    if not days:
+        return None
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archive_room(room, now=None, batch_size=None, dry_run=False):
+    """Archive les messages du salon plus anciens que sa rétention. Renvoie le nombre de messages."""
+    days = room.retention_days if room.retention_days is not None else settings.ROOM_RETENTION_DAYS
+    cutoff = retention_cutoff(days, now)
+    if cutoff is None:
+        return 0
+    old = Message.objects.filter(room=room, timestamp__lt=cutoff)
+    if dry_run:
+        return old.count()
+
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    archived = 0
+    while True:
+        # Un lot par transaction: verrou d'écriture court, reprise possible
+        with transaction.atomic():
+            batch = list(old.select_related('user').order_by('timestamp', 'id')[:batch_size])
+            if not batch:
+                return archived
+            write_segments(batch, room_record)
+            Message.objects.filter(pk__in=[message.pk for message in batch]).delete()
+        archived += len(batch)
+
+
+def archive_private(pair_key, now=None, batch_size=None, dry_run=False):
+    """
+    Archive les anciens messages d'une conversation privée. Le dernier message
+    reste en base (aperçu de la boîte de réception); les non lus archivés
+    sont décomptés de Conversation.
+    """
+    cutoff = retention_cutoff(settings.PRIVATE_RETENTION_DAYS, now)
+    if cutoff is None:
+        return 0
+    conversation = Conversation.objects.filter(pair_key=pair_key).first()
+    old = PrivateMessage.objects.filter(pair_key=pair_key, timestamp__lt=cutoff)
+    if conversation and conversation.last_message_id:
+        old = old.exclude(pk=conversation.last_message_id)
+    if dry_run:
+        return old.count()
+
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    archived = 0
+    while True:
+        with transaction.atomic():
+            batch = list(old.order_by('timestamp', 'id')[:batch_size])
+            if not batch:
+                return archived
+            write_segments(batch, private_record)
+            unread = {}
+            for message in batch:
+                if not message.is_read:
+                    key = (message.receiver_id, message.sender_id)
+                    unread[key] = unread.get(key, 0) + 1
+            for (reader_id, peer_id), count in unread.items():
+                Conversation.mark_read(reader_id, peer_id, count)
+            PrivateMessage.objects.filter(pk__in=[message.pk for message in batch]).delete()
+        archived += len(batch)
+
+
+def archive_all(now=None, batch_size=None, dry_run=False):
+    """Applique la rétention à tous les salons et conversations. Renvoie (salon, privé)."""
+    rooms = 0
+    for room in Room.objects.only('id', 'retention_days').iterator():
+        rooms += archive_room(room, now, batch_size, dry_run)
+
+    private = 0
+    cutoff = retention_cutoff(settings.PRIVATE_RETENTION_DAYS, now)
+    if cutoff is not None:
+        # order_by() vide: sinon Meta.ordering (timestamp) entre dans le DISTINCT
+        pair_keys = PrivateMessage.objects.filter(
+            timestamp__lt=cutoff
+        ).order_by().values_list('pair_key', flat=True).distinct()
+        for pair_key in list(pair_keys):
+            private += archive_private(pair_key, now, batch_size, dry_run)
+    return rooms, private
+
+
+def delete_private_archive(pair_key):
+    """Suppression d'une conversation: index, références de fichiers et fichiers d'archive."""
+    segments = ArchiveSegment.objects.filter(pair_key=pair_key)
+    paths = set(segments.values_list('path', flat=True))
+    segments.delete()
+    for relative_path in paths:
+        _cache_discard(relative_path)
+        try:
+            os.remove(archive_path(relative_path))
+        except FileNotFoundError:
+            pass
+
+
+def unreferenced_files(min_age_hours=1):
+    """
+    Fichiers d'archive sans segment (salon supprimé, premier lot interrompu
+    avant l'index), non modifiés depuis min_age_hours: un lot en cours a pu
+    écrire son membre sans avoir encore créé son segment.
+    """
+    known = set(ArchiveSegment.objects.values_list('path', flat=True).distinct())
+    limit = timezone.now().timestamp() - min_age_hours * 3600
+    for directory, _, filenames in os.walk(settings.ARCHIVE_ROOT):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            relative_path = os.path.relpath(path, settings.ARCHIVE_ROOT)
+            if relative_path not in known and os.path.getmtime(path) < limit:
+                yield relative_path
+
+
+# ---------- Lecture ----------
+def _cache_discard(relative_path):
+    for key in [key for key in _cache if key[0] == relative_path]:
+        del _cache[key]
+
+
+def read_segment(segment):
+    """Lignes d'un segment (liste de dict), décompressé une fois puis gardé en cache."""
+    key = (segment.path, segment.offset, segment.length)
+    records = _cache.get(key)
+    if records is not None:
+        _cache.move_to_end(key)
+        return records
+    with open(archive_path(segment.path), 'rb') as f:
+        f.seek(segment.offset)
+        data = gzip.decompress(f.read(segment.length))
+    records = [json.loads(line) for line in data.splitlines()]
+    _cache[key] = records
+    if len(_cache) > CACHED_SEGMENTS:
+        _cache.popitem(last=False)
+    return records
+
+
+def room_segments(room_id):
+    return ArchiveSegment.objects.filter(room_id=room_id)
+
+
+def private_segments(pair_key):
+    return ArchiveSegment.objects.filter(pair_key=pair_key)
+
+
+def _set_loaded(instance):
+    # Se comporte comme une ligne lue en base (pk, comparaisons), sans en être une
+    instance._state.adding = False
+    instance._state.db = 'default'
+    instance.archived = True
+    return instance
+
+
+def rehydrate_room(records):
+    """Instances Message (non enregistrées); auteurs chargés en une requête."""
+    users = User.objects.select_related('profile').in_bulk({record['user'] for record in records})
+    messages = []
+    for record in records:
+        user = users.get(record['user'])
+        if user is None:
+            # Comme en base: les messages d'un utilisateur supprimé disparaissent
+            continue
+        message = Message(
+            id=record['id'], room_id=record['room'], user=user, seq=record['seq'],
+            content=record['content'], image=record['image'] or None, file=record['file'] or None,
+            image_width=record['image_width'], image_height=record['image_height'],
+            image_variants=record['image_variants'], timestamp=from_micros(record['ts']),
+        )
+        messages.append(_set_loaded(message))
+    return messages
+
+
+def rehydrate_private(records):
+    users = User.objects.in_bulk({record['sender'] for record in records} | {record['receiver'] for record in records})
+    messages = []
+    for record in records:
+        sender, receiver = users.get(record['sender']), users.get(record['receiver'])
+        if sender is None or receiver is None:
+            continue
+        message = PrivateMessage(
+            id=record['id'], sender=sender, receiver=receiver, pair_key=record['pair_key'],
+            content=record['content'], image=record['image'] or None, file=record['file'] or None,
+            image_width=record['image_width'], image_height=record['image_height'],
+            image_variants=record['image_variants'], timestamp=from_micros(record['ts']),
+            is_read=record['is_read'],
+        )
+        messages.append(_set_loaded(message))
+    return messages
+
+
+def read_before(segments, rehydrate, cursor=None, limit=50, since=None):
+    """
+    Jusqu'à `limit` messages archivés juste avant cursor (timestamp, id), les
+    plus récents si cursor est None, postérieurs à since. Ordre chronologique.
+    """
+    if cursor:
+        ts, pk = cursor
+        segments = segments.filter(Q(first_ts__lt=ts) | Q(first_ts=ts, first_id__lt=pk))
+        key = (to_micros(ts), pk)
+    if since:
+        segments = segments.filter(last_ts__gt=since)
+        since_micros = to_micros(since)
+
+    page = []
+    for segment in segments.order_by('-first_ts', '-first_id').iterator(chunk_size=8):
+        records = [
+            record for record in read_segment(segment)
+            if (not cursor or (record['ts'], record['id']) < key)
+            and (not since or record['ts'] > since_micros)
+        ]
+        page = rehydrate(records) + page
+        if len(page) >= limit:
+            break
+    return page[-limit:] if limit else []
+
+
+def read_after(segments, rehydrate, cursor, limit=50, since=None):
+    """Jusqu'à `limit` messages archivés juste après cursor, en ordre chronologique."""
+    ts, pk = cursor
+    segments = segments.filter(Q(last_ts__gt=ts) | Q(last_ts=ts, last_id__gt=pk))
+    key = (to_micros(ts), pk)
+    if since:
+        segments = segments.filter(last_ts__gt=since)
+        since_micros = to_micros(since)
+
+    page = []
+    for segment in segments.order_by('first_ts', 'first_id').iterator(chunk_size=8):
+        records = [
+            record for record in read_segment(segment)
+            if (record['ts'], record['id']) > key and (not since or record['ts'] > since_micros)
+        ]
+        page += rehydrate(records)
+        if len(page) >= limit:
+            break
+    return page[:limit]
@@ -0,0 +1,151 @@
+"""
+Écriture différée (write-behind) des messages, activée par MESSAGE_WRITE_BEHIND.
+
+Les consumers confient leur message à un batcher par processus. Une tâche de
+fond l'insère avec les autres en un seul bulk_create, dans UNE transaction,
+toutes les MESSAGE_BATCH_WINDOW_MS ms ou dès MESSAGE_BATCH_MAX_ROWS lignes.
+Sur SQLite, un lot ne coûte donc qu'un fsync au lieu d'un par message.
+Chaque consumer n'attend que sa propre ligne (id, seq) avant de diffuser.
+
+Durabilité:
+- un message n'est diffusé ni acquitté qu'après le commit de son lot: un
+  arrêt brutal ne perd que des messages jamais confirmés au client;
+- en cas d'échec du lot, chaque ligne est réessayée seule, pour qu'une ligne
+  invalide n'entraîne pas les autres; l'appelant reçoit l'exception sinon;
+- à l'arrêt du processus (atexit), la file restante est écrite de façon
+  synchrone; flush() permet de la vider explicitement.
+"""
+import asyncio
+import atexit
+from collections import deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .models import Message, PrivateMessage
+
+
+def write_messages(instances):
+    """Insère un lot mixte (messages de salon et privés) dans une transaction."""
+    room_messages = [m for m in instances if isinstance(m, Message)]
+    private_messages = [m for m in instances if isinstance(m, PrivateMessage)]
+    with transaction.atomic():
+        if room_messages:
+            Message.bulk_insert(room_messages)
+        if private_messages:
+            PrivateMessage.bulk_insert(private_messages)
+    return instances
+
+
+def _reset(instance):
+    """Remet une instance dans l'état « à créer » après un lot annulé."""
+    instance.pk = None
+    instance._state.adding = True
+    if isinstance(instance, Message):
+        instance.seq = 0
+
+
+class MessageBatcher:
+
+    def __init__(self, enabled=None, window_ms=None, max_rows=None):
+        self._enabled = enabled
+        self.window = (window_ms if window_ms is not None else settings.MESSAGE_BATCH_WINDOW_MS) / 1000
+        self.max_rows = max_rows or settings.MESSAGE_BATCH_MAX_ROWS
+        self._pending = deque()  # (instance, future)
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._full = None
+        self._writing = None
+
+    @property
+    def enabled(self):
+        return settings.MESSAGE_WRITE_BEHIND if self._enabled is None else self._enabled
+
+    async def save(self, instance):
+        """Crée le message (par lot si activé) et le renvoie avec son id."""
+        if not self.enabled:
+            await database_sync_to_async(instance.save)()
+            return instance
+
+        self._ensure_running()
+        future = self._loop.create_future()
+        self._pending.append((instance, future))
+        self._wakeup.set()
+        if len(self._pending) >= self.max_rows:
+            self._full.set()
+        return await future
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wakeup = asyncio.Event()
+            self._full = asyncio.Event()
+            self._writing = asyncio.Lock()
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Laisse le lot se remplir pendant la fenêtre, sauf s'il est déjà plein
+            if len(self._pending) < self.max_rows:
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            await self._write_next()
+
+    def _take_batch(self):
+        batch = [self._pending.popleft() for _ in range(min(self.max_rows, len(self._pending)))]
+        if len(self._pending) < self.max_rows:
+            self._full.clear()
+        if not self._pending:
+            self._wakeup.clear()
+        return batch
+
+    async def _write_next(self):
+        # Un seul lot en écriture à la fois (SQLite: un seul écrivain)
+        async with self._writing:
+            batch = self._take_batch()
+            if batch:
+                await self._write(batch)
+
+    async def _write(self, batch):
+        try:
+            await database_sync_to_async(write_messages)([instance for instance, _ in batch])
+        except Exception:
+            # Lot annulé: chaque ligne est réessayée seule
+            for instance, future in batch:
+                _reset(instance)
+                try:
+                    await database_sync_to_async(write_messages)([instance])
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(instance)
+            return
+        for instance, future in batch:
+            if not future.done():
+                future.set_result(instance)
+
+    async def flush(self):
+        """Écrit immédiatement tout ce qui est en file."""
+        if self._writing is None:
+            return
+        while self._pending:
+            await self._write_next()
+
+    def flush_pending_sync(self):
+        """Arrêt du processus: écrit la file restante sans boucle asyncio."""
+        batch = list(self._pending)
+        self._pending.clear()
+        if batch:
+            write_messages([instance for instance, _ in batch])
+
+
+message_batcher = MessageBatcher()
+atexit.register(message_batcher.flush_pending_sync)
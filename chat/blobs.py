@@ -0,0 +1,152 @@
+"""
+Comptage des références aux blobs (storage.py) et ramasse-miettes.
+
+Les colonnes qui référencent un fichier (REFERENCES) portent des triggers
+SQL qui ajustent chat_blob.ref_count à l'insertion, à la suppression et à la
+modification d'une ligne. Comme pour l'index FTS (search.py), les triggers
+couvrent aussi bulk_create, les update() / delete() de QuerySet et les
+suppressions en cascade, sans signal Django: la suppression d'un salon ne
+charge pas ses messages en mémoire.
+
+Triggers créés sous SQLite uniquement; ensure_triggers() (post_migrate) les
+recrée après une migration qui reconstruit une table. recount() recalcule
+tous les compteurs depuis les tables (autres bases, ou vérification).
+"""
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+
+from .models import ArchivedFile, Blob, Message, PrivateMessage, UserProfile
+
+# Migration qui crée les triggers: avant elle (ou après son annulation), rien à maintenir
+TRIGGERS_MIGRATION = ('chat', '0020_blob')
+
+REFERENCES = {
+    'chat_message': ('image', 'file'),
+    'chat_privatemessage': ('image', 'file'),
+    'chat_userprofile': ('avatar',),
+    # Messages archivés (archive.py, migration 0022_archive)
+    'chat_archivedfile': ('name',),
+}
+
+REFERENCING_FIELDS = [
+    (Message, 'image'), (Message, 'file'),
+    (PrivateMessage, 'image'), (PrivateMessage, 'file'),
+    (UserProfile, 'avatar'),
+    (ArchivedFile, 'name'),
+]
+
+
+def trigger_sql(table, columns):
+    """DDL des triggers de comptage d'une table (idempotent)."""
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    has_new = ' OR '.join(f"new.{column} != ''" for column in columns)
+    has_old = ' OR '.join(f"old.{column} != ''" for column in columns)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_blob_ai AFTER INSERT ON {table} "
+        f"WHEN {has_new} BEGIN "
+        f"UPDATE chat_blob SET ref_count = ref_count + 1 WHERE name IN ({new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_blob_ad AFTER DELETE ON {table} "
+        f"WHEN {has_old} BEGIN "
+        f"UPDATE chat_blob SET ref_count = ref_count - 1 WHERE name IN ({old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_blob_au AFTER UPDATE OF {', '.join(columns)} ON {table} "
+        f"WHEN {has_old} OR {has_new} BEGIN "
+        f"UPDATE chat_blob SET ref_count = ref_count - 1 WHERE name IN ({old}); "
+        f"UPDATE chat_blob SET ref_count = ref_count + 1 WHERE name IN ({new}); END",
+    ]
+
+
+def ensure_triggers(using='default'):
+    """Crée les triggers manquants. Renvoie True si un compteur a dû être recalculé."""
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        existing = {row[0] for row in cursor.fetchall()}
+        tables = set(conn.introspection.table_names(cursor))
+        missing = False
+        for table, columns in REFERENCES.items():
+            if table not in tables:
+                # Migration de la table pas encore appliquée (ou annulée)
+                continue
+            expected = {f'{table}_blob_ai', f'{table}_blob_ad', f'{table}_blob_au'}
+            missing = missing or not expected <= existing
+            for statement in trigger_sql(table, columns):
+                cursor.execute(statement)
+    if missing:
+        # Des lignes ont pu changer sans trigger: compteurs recalculés
+        recount(using)
+    return missing
+
+
+def recount(using='default'):
+    """Recalcule ref_count de tous les blobs. Renvoie le nombre de compteurs corrigés."""
+    counts = {}
+    for model, field in REFERENCING_FIELDS:
+        names = model.objects.using(using).exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+        for name in names.values_list(field, flat=True).iterator():
+            counts[name] = counts.get(name, 0) + 1
+
+    changed = []
+    for blob in Blob.objects.using(using).only('name', 'ref_count').iterator():
+        count = counts.get(blob.name, 0)
+        if blob.ref_count != count:
+            blob.ref_count = count
+            changed.append(blob)
+    Blob.objects.using(using).bulk_update(changed, ['ref_count'], batch_size=500)
+    return len(changed)
+
+
+def delete_blob_files(name):
+    """Fichier du blob et ses miniatures (thumbnails.py)."""
+    from .thumbnails import variant_base
+    default_storage.delete(name)
+    base = variant_base(name)
+    for size in settings.THUMBNAIL_SIZES:
+        for extension in ('webp', 'jpg'):
+            default_storage.delete(f'{base}_{size}.{extension}')
+
+
+def collect_garbage(grace_hours=None, dry_run=False, now=None):
+    """
+    Supprime les blobs sans référence inutilisés depuis grace_hours (un
+    envoi en cours a enregistré son blob mais pas encore son message).
+    Renvoie (nombre de blobs, octets libérés).
+    """
+    if grace_hours is None:
+        grace_hours = settings.BLOB_GC_GRACE_HOURS
+    cutoff = (now or timezone.now()) - timedelta(hours=grace_hours)
+    orphans = Blob.objects.filter(ref_count__lte=0, last_used_at__lt=cutoff)
+
+    deleted = freed = 0
+    for blob in orphans.iterator():
+        if not dry_run:
+            # Suppression conditionnelle: un doublon a pu réutiliser le blob entre-temps
+            removed, _ = Blob.objects.filter(
+                pk=blob.pk, ref_count__lte=0, last_used_at__lt=cutoff
+            ).delete()
+            if not removed:
+                continue
+            delete_blob_files(blob.name)
+        deleted += 1
+        freed += blob.size
+    return deleted, freed
+
+
+def unmanaged_files():
+    """Fichiers de blobs/ sans ligne Blob (écriture interrompue, base restaurée)."""
+    root = os.path.join(settings.MEDIA_ROOT, 'blobs')
+    known = set(Blob.objects.values_list('name', flat=True))
+    for directory, _, filenames in os.walk(root):
+        if os.path.basename(directory) == 'thumbs':
+            continue
+        for filename in filenames:
+            name = os.path.relpath(os.path.join(directory, filename), settings.MEDIA_ROOT)
+            if name not in known and not filename.endswith('.tmp'):
+                yield name
@@ -0,0 +1,132 @@
+"""
+Encodage JSON partagé par les consumers (trames WebSocket) et les vues
+(JsonResponse de ce module).
+
+JSON_CODEC choisit l'implémentation: 'auto' (orjson s'il est installé,
+sinon json), 'orjson' ou 'json'. Les types que orjson ne connaît pas
+(Decimal, chaînes traduites, dates) passent par DjangoJSONEncoder, comme
+avec le JsonResponse de Django.
+
+Trames pré-encodées: une diffusion de groupe est encodée une fois par
+l'émetteur (event['frame']) et transmise telle quelle par chaque connexion.
+Quand seuls quelques champs diffèrent d'une connexion à l'autre (compteurs de
+non lus), la partie commune est encodée une fois (encode_tail) et complétée
+par connexion (splice_frame) sans repasser par l'encodeur.
+"""
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # dépendance optionnelle
+    orjson = None
+
+_django_encoder = DjangoJSONEncoder()
+
+
+class Backend:
+    def __init__(self, name, dumps, loads):
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+
+
+def _json_backend():
+    encoder = DjangoJSONEncoder(separators=(',', ':'), ensure_ascii=False)
+    return Backend('json', encoder.encode, json.loads)
+
+
+def _orjson_backend():
+    # Dates par DjangoJSONEncoder: même format qu'avec json (millisecondes, 'Z')
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_django_encoder.default, option=option).decode()
+
+    return Backend('orjson', dumps, orjson.loads)
+
+
+def select(name):
+    """Backend pour un nom de JSON_CODEC."""
+    if name == 'json' or (name == 'auto' and orjson is None):
+        return _json_backend()
+    if name in ('orjson', 'auto'):
+        if orjson is None:
+            raise ImportError("JSON_CODEC='orjson' mais orjson n'est pas installé")
+        return _orjson_backend()
+    raise ValueError(f"JSON_CODEC inconnu: {name}")
+
+
+_backend = None
+
+
+def backend():
+    global _backend
+    if _backend is None:
+        _backend = select(getattr(settings, 'JSON_CODEC', 'auto'))
+    return _backend
+
+
+def use(name):
+    """Change de backend (bancs d'essai). Renvoie le nom du backend actif."""
+    global _backend
+    _backend = select(name)
+    return _backend.name
+
+
+def dumps(obj):
+    """Objet -> texte JSON (str, prêt pour send(text_data=...))."""
+    return backend().dumps(obj)
+
+
+def loads(data):
+    return backend().loads(data)
+
+
+# ---------- Trames pré-encodées ----------
+def framed(event, payload):
+    """Ajoute à l'événement de groupe la trame client encodée une seule fois."""
+    event['frame'] = dumps(payload)
+    return event
+
+
+def encode_tail(payload):
+    """Champs communs à toutes les connexions, encodés une fois: '"a":1,"b":2}'."""
+    return dumps(payload)[1:]
+
+
+def _scalar(value):
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if value is None:
+        return 'null'
+    if isinstance(value, int):
+        return str(value)
+    return dumps(value)
+
+
+def splice_frame(tail, **fields):
+    """Trame = champs propres à la connexion (scalaires) + partie commune pré-encodée."""
+    head = ','.join(f'"{key}":{_scalar(value)}' for key, value in fields.items())
+    if tail == '}':
+        return '{' + head + '}'
+    return '{' + head + ',' + tail
+
+
+# ---------- Vues ----------
+class JsonResponse(HttpResponse):
+    """django.http.JsonResponse encodé par le codec partagé."""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError(
+                "In order to allow non-dict objects to be serialized set the "
+                "safe parameter to False."
+            )
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -1,23 +1,35 @@
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.utils.text import slugify
 from django.contrib.auth.models import User
-from .models import Room, Message, PrivateMessage, Block, MessageRead, HiddenConversation
+from .models import Room, Message, PrivateMessage, RoomReadState, HiddenConversation, Conversation, RelationshipState
+from .unread import unread_counters
+from .presence import PresenceMixin, presence
+from .metrics import MetricsMixin
+from .outbound import OutboundQueueMixin
+from .ratelimit import RateLimitMixin
+from .streams import resumed_frame, room_streams
+from .batching import message_batcher
+from . import codec, history, notifications, outbound, roster
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Q
 
+# Partie constante de la trame unread_update (voir codec.splice_frame)
+UNREAD_UPDATE_TAIL = '"type":"unread_update"}'
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(MetricsMixin, PresenceMixin, RateLimitMixin, OutboundQueueMixin, AsyncWebsocketConsumer):
     """
     Consumer minimal pour room avec suppression persistante et broadcast.
     """
+    metrics_action_key = 'action'
+    metrics_actions = (
+        'heartbeat', 'message', 'remove_member', 'add_member', 'leave_group',
+        'delete_message', 'hide_conversation', 'mark_read', 'resume',
+    )
 
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
-        safe_room_name = slugify(self.room_name)
-        self.room_group_name = f'chat_{safe_room_name}'
+        self.room_group_name = notifications.room_chat_group(self.room_name)
         self.user = self.scope['user']
 
         if not self.user.is_authenticated:
@@ -32,29 +44,20 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
-        members_data = await self.get_members_list_data()
-        # envoie le message de bienvenue
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'members_update',
-                'message': f'{self.user.username} a rejoint le salon',
-                'members_data': members_data
-            }
-        )
+        self.presence_room_id = self.room.id
+        self.presence_group = self.room_group_name
+        # Arrivées / départs diffusés par la présence (presence_update),
+        # la liste des membres ne change pas à la connexion
+        self.presence_connect()
+        await self.load_unread_state()
+        self.outbound_resume()
+
+    def rate_limit_room(self):
+        return self.room.id
 
     async def disconnect(self, close_code):
         if hasattr(self, 'room_group_name'):
-            members_data = await self.get_members_list_data()
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'members_update',
-                    'message': f'{self.user.username} a quitté le salon',
-                    'members_data': members_data
-                }
-            )
-
+            self.presence_disconnect()
             await self.channel_layer.group_discard(
                 self.room_group_name,
                 self.channel_name
@@ -65,49 +68,49 @@ class ChatConsumer(AsyncWebsocketConsumer):
         Attendu: messages JSON avec clé 'action'.
         - {'action':'message', 'message': '...'}
         - {'action':'delete_message', 'message_id': 123}
+        - {'action':'heartbeat'}
+        - {'action':'resume', 'after_seq': 42}  (messages manqués, voir streams.py)
         """
         try:
-            data = json.loads(text_data)
+            data = codec.loads(text_data)
         except Exception as e:
             # message mal formé
-            await self.send(text_data=json.dumps({'type':'error','message':'invalid json'}))
+            await self.send(text_data=codec.dumps({'type':'error','message':'invalid json'}))
+            return
+        self.metrics_record(data)
+        if not isinstance(data, dict):
+            # JSON valide mais pas un objet ([1], "hi", 3...)
+            await self.send(text_data=codec.dumps({'type':'error','message':'invalid json'}))
             return
 
         action = data.get('action')
+        # Toute trame prouve que la connexion est vivante
+        self.presence_heartbeat()
+
+        if action == 'heartbeat':
+            return
+
+        # Seaux par utilisateur et par salon (ratelimit.py)
+        if await self.throttled(action):
+            return
 
         if action == 'message':
             message_content = data.get('message', '').strip()
             if message_content:
                 msg_obj = await self._create_message(message_content)
 
-                # Broadcast du message
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'chat_message',
-                        'id': msg_obj.id,
-                        'username': self.user.username,
-                        'message': msg_obj.content,
-                        'timestamp': msg_obj.timestamp.strftime("%H:%M")
-                    }
-                )
-
-                # Mise à jour des messages non lus pour chaque membre
-                unread_counts = await self.get_unread_counts_for_room()
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'unread_update',
-                        'unread_counts': unread_counts
-                    }
-                )
+                # Broadcast du message (trame encodée une fois), puis mise à
+                # jour des non lus: l'événement ne porte que le nouveau seq,
+                # chaque connexion calcule et reçoit uniquement son propre compteur
+                for event in notifications.room_message_events(msg_obj):
+                    await self.group_send(self.room_group_name, event)
 
 
         elif action == 'remove_member':
             target_username = data.get('username')
             if self.user != self.room.created_by:
                 # Si l'utilisateur n'est PAS l'admin
-                await self.send(text_data=json.dumps({
+                await self.send(text_data=codec.dumps({
                     'type': 'error',
                     'message': "Vous n'avez pas la permission de retirer un membre."
                 }))
@@ -116,26 +119,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
             if target_username:
                 if target_username == self.user.username:
-                    await self.send(text_data=json.dumps({
+                    await self.send(text_data=codec.dumps({
                         'type': 'error',
                         'message': "L'administrateur ne peut pas se retirer lui-même."
                     }))
                     return
+                # Le delta 'removed' est diffusé par le signal (roster.py)
                 success, removed_username = await self.remove_user_from_room_by_username(target_username)
-                if success:
-                    members_data = await self.get_members_list_data()
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'members_update',
-                            'message': f"{removed_username} a été retiré du salon par {self.user.username}.",
-                            'username_removed': removed_username,
-                            'members_data': members_data
-                        }
-                    )
-
-                else:
-                    await self.send(text_data=json.dumps({
+                if not success:
+                    await self.send(text_data=codec.dumps({
                         'type': 'error',
                         'message': f"Impossible de retirer l'utilisateur {target_username}."
                     }))
@@ -145,7 +137,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
             if self.user != self.room.created_by:
                 # Si l'utilisateur n'est PAS l'admin
-                await self.send(text_data=json.dumps({
+                await self.send(text_data=codec.dumps({
                     'type': 'error',
                     'message': "Vous n'avez pas la permission d'ajouter un membre."
                 }))
@@ -153,22 +145,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 return
 
             if target_username:
+                # Le delta 'joined' est diffusé par le signal (roster.py)
                 success, added_username = await self.add_user_to_room_by_username(target_username)
 
-                if success:
-                    # Envoyer la mise à jour à tout le monde
-                    members_data = await self.get_members_list_data()
-                    await self.channel_layer.group_send(
-                        self.room_group_name,
-                        {
-                            'type': 'members_update',
-                            'message': f"{added_username} a été ajouté au salon par {self.user.username}.",
-                            'members_data': members_data
-                        }
-                    )
-                else:
+                if not success:
                     # Envoyer une erreur (ex: utilisateur n'existe pas, ou déjà membre)
-                    await self.send(text_data=json.dumps({
+                    await self.send(text_data=codec.dumps({
                         'type': 'error',
                         'message': f"Impossible d'ajouter l'utilisateur {target_username}."
                     }))
@@ -176,110 +158,129 @@ class ChatConsumer(AsyncWebsocketConsumer):
         elif action == 'leave_group':
 
             if self.user == self.room.created_by:
-                await self.send(text_data=json.dumps({
+                await self.send(text_data=codec.dumps({
                     'type': 'error',
                     'message': "L'administrateur ne peut pas quitter le groupe. Vous devez d'abord le supprimer ou transférer la propriété."
                 }))
                 return
 
-            # Retirer l'utilisateur (self.user) de la DB
+            # Retirer l'utilisateur (self.user) de la DB: le delta 'left'
+            # est diffusé aux autres membres par le signal (roster.py)
             await self.remove_user_from_room()
 
-            # Obtenir la nouvelle liste de membres
-            members_data = await self.get_members_list_data()
-
-            # Envoyer la mise à jour à tous les AUTRES membres
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'members_update',
-                    'message': f"{self.user.username} a quitté le salon.",
-                    'members_data': members_data
-                }
-            )
-
-
             # Envoyer un message juste à l'utilisateur qui part
             # pour lui dire de se rediriger
-            await self.send(text_data=json.dumps({
+            await self.send(text_data=codec.dumps({
                 'type': 'group_left_you',
                 'message': f"Vous avez quitté le salon '{self.room_name}'."
             }))
         elif action == 'delete_message':
             message_id = data.get('message_id')
             if not message_id:
-                await self.send(text_data=json.dumps({'type': 'error', 'message': 'missing message_id'}))
+                await self.send(text_data=codec.dumps({'type': 'error', 'message': 'missing message_id'}))
                 return
 
             # Récupérer le message et vérifier propriétaire
             msg = await self._get_message_by_id(message_id)
             if msg is None:
-                await self.send(text_data=json.dumps({'type': 'error', 'message': 'message not found'}))
+                await self.send(text_data=codec.dumps({'type': 'error', 'message': 'message not found'}))
                 return
 
             if msg.user_id != self.user.id:
-                await self.send(text_data=json.dumps({'type': 'error', 'message': 'not allowed'}))
+                await self.send(text_data=codec.dumps({'type': 'error', 'message': 'not allowed'}))
                 return
 
             # Supprimer en base
             await self._delete_message_by_id(message_id)
 
             # Broadcast suppression à tout le groupe
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'delete_message_event',
-                    'message_id': message_id
-                }
-            )
+            await self.group_send(self.room_group_name, codec.framed(
+                {'type': 'delete_message_event', 'message_id': message_id},
+                {'type': 'delete_message', 'message_id': message_id},
+            ))
         elif action == 'hide_conversation':
             # Créer ou mettre à jour le record HiddenConversation
             await self.hide_conversation_for_user()
 
             # Envoyer confirmation à l'utilisateur
-            await self.send(text_data=json.dumps({
+            await self.send(text_data=codec.dumps({
                 'type': 'conversation_hidden',
                 'message': f"Vous avez supprimé la conversation '{self.room_name}'."
             }))
         elif action == 'mark_read':
+            # Avec message_id: lu jusqu'à ce message; sans: tout le salon est lu
             message_id = data.get('message_id')
-            await self.mark_message_as_read(message_id)
+            unread_count = await self.mark_message_as_read(message_id)
+            await self.send(text_data=codec.dumps({
+                'type': 'unread_update',
+                'room_id': self.room.id,
+                'unread_count': unread_count,
+                'delta': 0
+            }))
+        elif action == 'resume':
+            await self.resume(data.get('after_seq'))
+
+    async def resume(self, after_seq):
+        """
+        Messages après after_seq en une trame 'resumed': tampon du salon, sinon
+        index (room, seq); trop de messages manqués -> trame 'resync'.
+        """
+        if isinstance(after_seq, bool) or not isinstance(after_seq, int) or after_seq < 0:
+            await self.send(text_data=codec.dumps({'type': 'error', 'message': 'invalid after_seq'}))
+            return
+        last_seq, members_version = await self.get_stream_state()
+        frames = room_streams.frames_after(self.room.id, after_seq, last_seq)
+        if frames is None:
+            frames = await self.load_frames_after(after_seq, last_seq)
+        if frames is None:
+            self.outbound_put(outbound.SNAPSHOT, outbound.SNAPSHOT_KEY)
+            return
+        await self.send(text_data=resumed_frame(
+            frames,
+            last_seq=last_seq,
+            members_version=members_version,
+            online_count=presence.online_count(self.room.id),
+        ))
 
     # event handlers (broadcast)
+    # Les trames communes à tout le groupe arrivent encodées (event['frame'],
+    # voir codec.framed): elles sont transmises telles quelles
     async def chat_message(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'message',
-            'id': event['id'],
-            'username': event['username'],
-            'message': event['message'],
-            'timestamp': event['timestamp']
-        }))
+        room_streams.record(event['room_id'], event['seq'], event['id'], event['frame'])
+        await self.send(text_data=event['frame'])
+
+    async def image_ready(self, event):
+        """Miniatures d'une image générées (voir thumbnails.py)"""
+        await self.send(text_data=event['frame'])
+
     async def members_update(self, event):
         """
-            Envoie la mise à jour de la liste des membres et le message au client.
+            Envoie le delta versionné de la liste des membres et le message au client.
+            En cas de saut de version, le client recharge le snapshot (room_members):
+            un delta en attente peut donc être remplacé par le suivant (outbound.py).
         """
-        await self.send(text_data=json.dumps({
-            'type': 'members_update',
-            'id': event.get('id'),
-            'message': event.get('message'),
-            'username_removed': event.get('username_removed'),
-            'members_data': event.get('members_data')
-        }))
+        await self.send_latest('members', event['frame'])
 
     async def delete_message_event(self, event):
-        await self.send(text_data=json.dumps({
-            'type': 'delete_message',
-            'message_id': event['message_id']
-        }))
+        room_streams.forget(self.room.id, event['message_id'])
+        await self.send(text_data=event['frame'])
+
+    async def presence_update(self, event):
+        """Delta de présence coalescé (au plus un par BROADCAST_SECONDS et par salon)."""
+        await self.send(text_data=event['frame'])
 
     async def unread_update(self, event):
         """
-        Envoie les données de messages non lus à chaque client.
+        Envoie à ce client uniquement son propre compteur de non lus,
+        calculé en mémoire à partir du seq porté par l'événement.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'unread_update',
-            'unread_counts': event['unread_counts']
-        }))
+        unread_counters.record_message(event['room_id'], event['seq'], event['sender_id'])
+        await self.send_latest(('unread', event['room_id']), codec.splice_frame(
+            UNREAD_UPDATE_TAIL,
+            room_id=event['room_id'],
+            unread_count=unread_counters.count(event['room_id'], self.user.id),
+            delta=0 if event['sender_id'] == self.user.id else 1,
+        ))
 
     # ---------- DB helpers (sync -> async wrapper) ----------
     @database_sync_to_async
@@ -296,12 +297,13 @@ class ChatConsumer(AsyncWebsocketConsumer):
     def get_unread_messages(self):
         if not self.room:
             return []
-        # tous les messages de la room que l'utilisateur n'a pas lus
+        # tous les messages de la room après le marqueur de lecture de l'utilisateur
+        read_seq = RoomReadState.objects.filter(
+            user=self.user, room=self.room
+        ).values_list('last_read_seq', flat=True).first() or 0
         unread_messages = Message.objects.filter(
-            room=self.room
-        ).exclude(
-            reads__user=self.user
-        ).order_by('timestamp')
+            room=self.room, seq__gt=read_seq
+        ).select_related('user').order_by('seq')
         return [
             {
                 'id': msg.id,
@@ -313,46 +315,58 @@ class ChatConsumer(AsyncWebsocketConsumer):
         ]
 
     @database_sync_to_async
-    def mark_message_as_read(self, message_id):
-        msg = Message.objects.filter(id=message_id, room=self.room).first()
-        if msg:
-            MessageRead.objects.get_or_create(user=self.user, message=msg)
+    def load_unread_state(self):
+        unread_counters.load(self.room.id)
 
     @database_sync_to_async
-    def get_room(self):
+    def get_stream_state(self):
+        return Room.objects.values_list('last_seq', 'members_version').get(pk=self.room.pk)
+
+    @database_sync_to_async
+    def load_frames_after(self, after_seq, last_seq):
+        """Trames des messages manqués depuis la base, None s'ils dépassent RESUME_MAX_MESSAGES."""
+        if last_seq - after_seq > settings.RESUME_MAX_MESSAGES:
+            return None
+        messages = Message.objects.filter(
+            room=self.room, seq__gt=after_seq, seq__lte=last_seq
+        ).select_related('user').order_by('seq')
+        return [codec.dumps(notifications.room_message_payload(msg)) for msg in messages]
+
+    @database_sync_to_async
+    def outbound_snapshot(self):
+        """Trame 'resync' d'un client lent (outbound.py): derniers messages, membres, présence."""
+        page, _ = history.room_history(self.room, self.user)
+        members_version = Room.objects.values_list('members_version', flat=True).get(pk=self.room.pk)
+        return {
+            'type': 'resync',
+            'messages': [history.serialize_room_message(msg) for msg in page],
+            'members_version': members_version,
+            'online_count': presence.online_count(self.room.id),
+        }
+
+    @database_sync_to_async
+    def mark_message_as_read(self, message_id=None):
         """
-        Récupère le salon en ignorant la casse.
+        Avance le marqueur en base et dans le compteur mémoire,
+        puis renvoie le nombre de non lus restant pour l'utilisateur.
         """
-        return Room.objects.select_related('created_by').filter(name__iexact=self.room_name).first()
+        if message_id:
+            seq = Message.objects.filter(id=message_id, room=self.room).values_list('seq', flat=True).first()
+        else:
+            seq = Room.objects.values_list('last_seq', flat=True).get(pk=self.room.pk)
+        if seq:
+            RoomReadState.mark_read(self.user, self.room, seq)
+            unread_counters.mark_read(self.room.id, self.user.id, seq)
+            notifications.notify_room_read(self.user.id, self.room.id, seq)
+        unread_counters.load(self.room.id)
+        return unread_counters.count(self.room.id, self.user.id)
 
     @database_sync_to_async
-    def get_members_list_data(self):
+    def get_room(self):
         """
-        Récupère la liste des membres actuels, le compte, et l'URL de l'avatar.
+        Récupère le salon en ignorant la casse.
         """
-        if not self.room:
-            return {'count': 0, 'members': []}
-
-        # Charger tous les membres et précharger leurs profils (select_related)
-        members = self.room.members.all().select_related('profile')
-
-        members_data_list = []
-        for member in members:
-            avatar_url = None
-
-            if hasattr(member, 'profile'):
-                if member.profile.avatar:
-                    avatar_url = member.profile.avatar.url
-
-            members_data_list.append({
-                'username': member.username,
-                'avatar_url': avatar_url
-            })
-
-        return {
-            'count': len(members_data_list),
-            'members': members_data_list
-        }
+        return Room.objects.select_related('created_by').filter(name__iexact=self.room_name).first()
 
     @database_sync_to_async
     def save_message(self, message_content):
@@ -386,8 +400,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return False, None
         try:
             user_to_remove = User.objects.get(username=target_username)
-            if user_to_remove in self.room.members.all():
-                self.room.members.remove(user_to_remove)
+            if self.room.members.filter(pk=user_to_remove.pk).exists():
+                with roster.change_reason('removed', self.user.username):
+                    self.room.members.remove(user_to_remove)
 
                 print(f"SUCCÈS: {user_to_remove.username} retiré de {self.room.name}")
                 return True, target_username
@@ -407,8 +422,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return False, None
         try:
             user_to_add = User.objects.get(username=target_username)
-            if user_to_add not in self.room.members.all():
-                self.room.members.add(user_to_add)
+            if not self.room.members.filter(pk=user_to_add.pk).exists():
+                with roster.change_reason('added', self.user.username):
+                    self.room.members.add(user_to_add)
                 print(f"SUCCÈS: {user_to_add.username} ajouté à {self.room.name}")
                 return True, target_username
             else:
@@ -422,9 +438,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
         from datetime import datetime
         return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
-    @database_sync_to_async
-    def _create_message(self, content):
-        return Message.objects.create(room=self.room, user=self.user, content=content)
+    async def _create_message(self, content):
+        # Par lots si MESSAGE_WRITE_BEHIND (batching.py), sinon INSERT direct
+        return await message_batcher.save(Message(room=self.room, user=self.user, content=content))
 
     @database_sync_to_async
     def _get_message_by_id(self, message_id):
@@ -438,45 +454,39 @@ class ChatConsumer(AsyncWebsocketConsumer):
     def _delete_message_by_id(self, message_id):
         Message.objects.filter(id=message_id, room=self.room).delete()
 
-    @database_sync_to_async
-    def get_unread_counts_for_room(self):
-        """
-        Renvoie un dict {user_id: unread_count} pour tous les membres de la room,
-        en excluant les messages lus par l'utilisateur ET ceux envoyés par lui-même.
-        """
-        result = {}
-        members = self.room.members.all()
-        for member in members:
-            count = Message.objects.filter(room=self.room).exclude(
-                Q(reads__user=member) | Q(user=member)
-            ).count()
-            result[member.id] = count
-        return result
-
 
-class PrivateChatConsumer(AsyncWebsocketConsumer):
+class PrivateChatConsumer(MetricsMixin, PresenceMixin, RateLimitMixin, OutboundQueueMixin, AsyncWebsocketConsumer):
+    """
+    Conversation privée. L'interlocuteur et l'état de blocage (dans les deux
+    sens) sont résolus une fois à la connexion puis gardés en cache: un envoi
+    ne coûte plus que l'insertion. Le cache est mis à jour par l'événement
+    block_state_changed (signaux de Block), sur les deux connexions.
+    """
+    metrics_action_key = 'type'
+    metrics_default_action = 'message'
+    metrics_actions = ('heartbeat', 'message', 'delete_message', 'check_block')
 
     # VÉRIFICATION DE BLOCAGE
-    @database_sync_to_async
     def check_block_status(self):
         """
-        Vérifie si l'un des deux utilisateurs a bloqué l'autre
+        Vérifie si l'un des deux utilisateurs a bloqué l'autre (cache, sans requête)
         Retourne: (is_blocked, blocker_username)
         """
-        try:
-            other_user = User.objects.get(username=self.other_username)
-
-            # Vérifier si self.user bloque other_user
-            if Block.objects.filter(blocker=self.user, blocked=other_user).exists():
-                return True, self.user.username
-
-            # Vérifier si other_user bloque self.user
-            if Block.objects.filter(blocker=other_user, blocked=self.user).exists():
-                return True, other_user.username
-
-            return False, None
-        except User.DoesNotExist:
+        if self.other_user is None:
             return True, None  # Utilisateur inexistant = blocage
+        if self.relationship.is_blocking:
+            return True, self.user.username
+        if self.relationship.is_blocked_by:
+            return True, self.other_user.username
+        return False, None
+
+    @database_sync_to_async
+    def load_peer_state(self):
+        """Interlocuteur + blocages / signalement (RelationshipState), une seule fois."""
+        self.other_user = User.objects.filter(username=self.other_username).first()
+        self.relationship = RelationshipState()
+        if self.other_user is not None:
+            self.relationship = RelationshipState.load_one(self.user, self.other_user)
 
     async def connect(self):
         self.user = self.scope['user']
@@ -486,14 +496,26 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        # Room unique, neutre
-        users = sorted([self.user.username, self.other_username])
-        self.room_name = f'private_{users[0]}_{users[1]}'
+        await self.load_peer_state()
+        if self.other_user is None:
+            await self.close()
+            return
+
+        # Room unique, neutre (ids: noms de groupe toujours valides)
+        self.room_name = notifications.private_chat_group(self.user.id, self.other_user.id)
 
         await self.channel_layer.group_add(self.room_name, self.channel_name)
         await self.accept()
+        self.presence_connect()
+        self.outbound_resume()
+
+    def rate_limit_room(self):
+        return self.room_name
 
     async def disconnect(self, close_code):
+        if not hasattr(self, 'room_name'):
+            return
+        self.presence_disconnect()
         await self.channel_layer.group_discard(self.room_name, self.channel_name)
 
     async def receive(self, text_data):
@@ -502,16 +524,33 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
         - Envoi message (texte, image, fichier)
         - Suppression message
         """
-        data = json.loads(text_data)
+        try:
+            data = codec.loads(text_data)
+        except Exception:
+            # message mal formé
+            await self.send(text_data=codec.dumps({'type': 'error', 'message': 'invalid json'}))
+            return
+        self.metrics_record(data)
+        if not isinstance(data, dict):
+            # JSON valide mais pas un objet ([1], "hi", 3...)
+            await self.send(text_data=codec.dumps({'type': 'error', 'message': 'invalid json'}))
+            return
         msg_type = data.get('type', 'message')
+        self.presence_heartbeat()
 
+        if msg_type == 'heartbeat':
+            return
+
+        # Seaux par utilisateur et par conversation (ratelimit.py)
+        if await self.throttled(msg_type):
+            return
 
         if msg_type == 'message':
-            is_blocked, blocker = await self.check_block_status()
+            is_blocked, blocker = self.check_block_status()
 
             if is_blocked:
                 # Message bloqué, notifier l'expéditeur
-                await self.send(text_data=json.dumps({
+                await self.send(text_data=codec.dumps({
                     'type': 'error',
                     'message': 'Impossible d\'envoyer le message. Communication bloquée.',
                     'blocked': True
@@ -525,19 +564,10 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
             if content or file_url or image_url:
                 message = await self.save_message(content)
 
-                await self.channel_layer.group_send(
-                    self.room_name,
-                    {
-                        'type': 'private_message',
-                        'id': message.id,
-                        'sender': self.user.username,
-                        'message': message.content,
-                        'timestamp': message.timestamp.strftime("%d/%m %H:%M"),
-                        'file_url': file_url,
-                        'image_url': image_url,
-                        'is_read': message.is_read,
-                    }
-                )
+                payload = notifications.private_message_payload(message)
+                # URLs fournies par le client (fichier envoyé avant par /upload/)
+                payload.update(file_url=file_url, image_url=image_url)
+                await self.group_send(self.room_name, codec.framed({'type': 'private_message'}, payload))
 
         # SUPPRESSION MESSAGE
         elif msg_type == 'delete_message':
@@ -545,19 +575,15 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
             deleted = await self.delete_message(msg_id)
 
             if deleted:
-                await self.channel_layer.group_send(
-                    self.room_name,
-                    {
-                        'type': 'delete_message_event',
-                        'message_id': msg_id
-                    }
-                )
+                await self.group_send(self.room_name, codec.framed(
+                    {'type': 'delete_message_event'}, {'type': 'delete_message', 'message_id': msg_id}
+                ))
 
         # VÉRIFIER STATUT BLOCAGE
         elif msg_type == 'check_block':
-            is_blocked, blocker = await self.check_block_status()
+            is_blocked, blocker = self.check_block_status()
 
-            await self.send(text_data=json.dumps({
+            await self.send(text_data=codec.dumps({
                 'type': 'block_status',
                 'is_blocked': is_blocked,
                 'blocker': blocker
@@ -566,44 +592,162 @@ class PrivateChatConsumer(AsyncWebsocketConsumer):
 
     async def private_message(self, event):
         """
-        Envoi d'un message à TOUS les clients connectés.
-        Ici on renvoie exactement ce que ton JS attend.
+        Envoi d'un message à TOUS les clients connectés: trame déjà encodée
+        par l'émetteur (notifications.private_message_payload).
         """
-        await self.send(text_data=json.dumps({
-            'type': 'message',
-            'id': event['id'],
-            'sender': event['sender'],
-            'message': event['message'],
-            'timestamp': event['timestamp'],
-            'file_url': event.get('file_url'),
-            'image_url': event.get('image_url'),
-            'is_read': event.get('is_read'),
-        }))
+        await self.send(text_data=event['frame'])
+
+    async def image_ready(self, event):
+        """Miniatures d'une image générées (voir thumbnails.py)"""
+        await self.send(text_data=event['frame'])
 
     async def delete_message_event(self, event):
         """
         Broadcast de suppression de message.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'delete_message',
-            'message_id': event['message_id']
+        await self.send(text_data=event['frame'])
+
+
+    async def block_state_changed(self, event):
+        """Blocage ajouté / retiré par l'un des deux: mise à jour du cache et du client."""
+        if event['blocker_id'] == self.user.id:
+            self.relationship.is_blocking = event['is_blocked']
+        elif event['blocker_id'] == self.other_user.id:
+            self.relationship.is_blocked_by = event['is_blocked']
+        is_blocked, blocker = self.check_block_status()
+        await self.send(text_data=codec.dumps({
+            'type': 'block_status',
+            'is_blocked': is_blocked,
+            'blocker': blocker
         }))
 
-
     @database_sync_to_async
-    def save_message(self, content):
-        receiver = User.objects.get(username=self.other_username)
-        return PrivateMessage.objects.create(
+    def outbound_snapshot(self):
+        """Trame 'resync' d'un client lent (outbound.py): derniers messages, sans les marquer lus."""
+        page, _ = history.paginate(history.private_messages_queryset(self.user, self.other_user))
+        return {
+            'type': 'resync',
+            'messages': [history.serialize_private_message(msg) for msg in page],
+        }
+
+    async def save_message(self, content):
+        # Par lots si MESSAGE_WRITE_BEHIND (batching.py), sinon INSERT direct
+        return await message_batcher.save(PrivateMessage(
             sender=self.user,
-            receiver=receiver,
+            receiver=self.other_user,
             content=content
-        )
+        ))
 
     @database_sync_to_async
     def delete_message(self, message_id):
         try:
             msg = PrivateMessage.objects.get(id=message_id, sender=self.user)
             msg.delete()
+            Conversation.message_deleted(msg)
             return True
         except PrivateMessage.DoesNotExist:
-            return False
\ No newline at end of file
+            return False
+
+class NotificationConsumer(MetricsMixin, PresenceMixin, OutboundQueueMixin, AsyncWebsocketConsumer):
+    """
+    Notifications de l'utilisateur connecté (page d'accueil): non lus des salons
+    et des conversations privées, nouvelles conversations, aperçu du dernier message.
+    Remplace le polling; les endpoints *unread-count* ne servent plus qu'en secours.
+    """
+
+    async def connect(self):
+        self.user = self.scope['user']
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+
+        self.user_group_name = notifications.user_group(self.user.id)
+        self.room_ids = set(await self.get_room_ids())
+
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+        for room_id in self.room_ids:
+            await self.channel_layer.group_add(notifications.room_group(room_id), self.channel_name)
+        await self.accept()
+        self.presence_connect()
+        self.outbound_resume()
+
+    async def disconnect(self, close_code):
+        if not hasattr(self, 'user_group_name'):
+            return
+        self.presence_disconnect()
+        await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+        for room_id in self.room_ids:
+            await self.channel_layer.group_discard(notifications.room_group(room_id), self.channel_name)
+
+    async def receive(self, text_data):
+        # Canal descendant uniquement, hormis les heartbeats de présence
+        self.presence_heartbeat()
+
+    # event handlers (broadcast)
+    async def room_notification(self, event):
+        room_id = event['room_id']
+        unread_counters.record_message(room_id, event['seq'], event['sender_id'])
+        is_own = event['sender_id'] == self.user.id
+        # Nom du salon et aperçu pré-encodés (event['tail']), seuls les compteurs sont ajoutés.
+        # Compteur absolu: seul le dernier en attente est envoyé (outbound.py)
+        await self.send_latest(('room_unread', room_id), codec.splice_frame(
+            event['tail'],
+            room_id=room_id,
+            unread_count=unread_counters.count(room_id, self.user.id),
+            delta=0 if is_own else 1,
+        ))
+
+    async def room_read(self, event):
+        unread_counters.mark_read(event['room_id'], self.user.id, event['seq'])
+        await self.send_latest(('room_unread', event['room_id']), codec.dumps({
+            'type': 'room_unread',
+            'room_id': event['room_id'],
+            'unread_count': unread_counters.count(event['room_id'], self.user.id),
+            'delta': 0,
+        }))
+
+    async def private_notification(self, event):
+        await self.send(text_data=codec.dumps({
+            'type': 'private_unread',
+            'user_id': event['peer_id'],
+            'username': event['peer_username'],
+            'unread_count': event['unread_count'],
+            'delta': event['delta'],
+            'new_conversation': event['new_conversation'],
+            'last_message': event['last_message'],
+        }))
+
+    async def private_read(self, event):
+        await self.send(text_data=codec.dumps({
+            'type': 'private_unread',
+            'user_id': event['peer_id'],
+            'unread_count': event['unread_count'],
+            'delta': 0,
+        }))
+
+    async def membership_update(self, event):
+        room_id = event['room_id']
+        group = notifications.room_group(room_id)
+        if event['joined'] and room_id not in self.room_ids:
+            self.room_ids.add(room_id)
+            await self.channel_layer.group_add(group, self.channel_name)
+            await self.load_unread_state([room_id])
+        elif not event['joined'] and room_id in self.room_ids:
+            self.room_ids.discard(room_id)
+            await self.channel_layer.group_discard(group, self.channel_name)
+        await self.send(text_data=codec.dumps({
+            'type': 'membership_update',
+            'room_id': room_id,
+            'joined': event['joined'],
+        }))
+
+    # ---------- DB helpers (sync -> async wrapper) ----------
+    @database_sync_to_async
+    def get_room_ids(self):
+        room_ids = list(self.user.rooms.values_list('id', flat=True))
+        unread_counters.load_many(room_ids)
+        return room_ids
+
+    @database_sync_to_async
+    def load_unread_state(self, room_ids):
+        unread_counters.load_many(room_ids)
@@ -0,0 +1,181 @@
+"""
+Historique paginé par curseur (keyset) sur (timestamp, id).
+
+Un curseur est "<microsecondes depuis epoch>-<id>" : il est opaque pour le
+client, exact (pas d'arrondi flottant) et indépendant du fuseau horaire.
+Chaque page coûte une requête, quelle que soit sa position dans l'historique.
+
+Les messages archivés (archive.py) précèdent tous ceux restés en base: une
+page qui atteint le début de la base est complétée depuis les segments
+d'archive, et un curseur `after` situé dans l'archive y est lu d'abord. Le
+client ne voit pas la différence (mêmes curseurs, mêmes champs).
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+from . import archive
+from .models import Message, PrivateMessage, HiddenConversation, Conversation
+from .notifications import notify_private_read
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(timestamp, pk):
+    micros = (timestamp - EPOCH) // timedelta(microseconds=1)
+    return f'{micros}-{pk}'
+
+
+def decode_cursor(cursor):
+    """Renvoie (timestamp, id) ou None si le curseur est absent ou invalide."""
+    if not cursor:
+        return None
+    try:
+        micros, pk = cursor.split('-', 1)
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (TypeError, ValueError):
+        return None
+
+
+def clamp_limit(limit, default=DEFAULT_PAGE_SIZE):
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def paginate(queryset, before=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Renvoie (objets en ordre chronologique, has_more).
+    - before: les `limit` objets juste avant le curseur (défaut: les plus récents)
+    - after: les `limit` objets juste après le curseur
+    has_more indique s'il reste des objets dans la direction demandée.
+    """
+    if after:
+        ts, pk = after
+        page = list(
+            queryset.filter(Q(timestamp__gt=ts) | Q(timestamp=ts, id__gt=pk))
+            .order_by('timestamp', 'id')[:limit + 1]
+        )
+        return page[:limit], len(page) > limit
+
+    if before:
+        ts, pk = before
+        queryset = queryset.filter(Q(timestamp__lt=ts) | Q(timestamp=ts, id__lt=pk))
+    page = list(queryset.order_by('-timestamp', '-id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+    return page, has_more
+
+
+def paginate_archived(queryset, segments, rehydrate, before=None, after=None,
+                      limit=DEFAULT_PAGE_SIZE, since=None):
+    """
+    Comme paginate(), en continuant dans l'archive au-delà du plus ancien
+    message en base. Les segments ne sont lus que si la page les atteint.
+    """
+    if after:
+        archived = archive.read_after(segments, rehydrate, after, limit + 1, since)
+        if len(archived) > limit:
+            return archived[:limit], True
+        if archived:
+            after = (archived[-1].timestamp, archived[-1].id)
+        page, has_more = paginate(queryset, after=after, limit=limit - len(archived))
+        return archived + page, has_more
+
+    page, has_more = paginate(queryset, before=before, limit=limit)
+    if has_more:
+        return page, has_more
+    missing = limit - len(page)
+    cursor = (page[0].timestamp, page[0].id) if page else before
+    older = archive.read_before(segments, rehydrate, cursor, missing + 1, since)
+    return older[-missing:] + page if missing else page, len(older) > missing
+
+
+def hidden_since(room, user):
+    """Date à laquelle user a masqué le salon (HiddenConversation), ou None."""
+    return HiddenConversation.objects.filter(
+        user=user, room=room
+    ).values_list('hidden_at', flat=True).first()
+
+
+def room_messages_queryset(room, user, hidden_at=None):
+    """Messages du salon visibles par user (après HiddenConversation.hidden_at)."""
+    queryset = Message.objects.filter(room=room).select_related('user', 'user__profile')
+    if hidden_at is None:
+        hidden_at = hidden_since(room, user)
+    if hidden_at:
+        queryset = queryset.filter(timestamp__gt=hidden_at)
+    return queryset
+
+
+def room_history(room, user, before=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    hidden_at = hidden_since(room, user)
+    return paginate_archived(
+        room_messages_queryset(room, user, hidden_at), archive.room_segments(room.id),
+        archive.rehydrate_room, before=before, after=after, limit=limit, since=hidden_at,
+    )
+
+
+def serialize_room_message(msg):
+    profile = getattr(msg.user, 'profile', None)
+    return {
+        'id': msg.id,
+        'seq': msg.seq,
+        'cursor': encode_cursor(msg.timestamp, msg.id),
+        'username': msg.user.username,
+        'avatar_url': profile.avatar.url if profile and profile.avatar else None,
+        'message': msg.content,
+        **msg.image_payload(),
+        'file_url': msg.file.url if msg.file else '',
+        'timestamp': msg.timestamp.strftime("%H:%M"),
+        # Message archivé (archive.py): lecture seule, pas de suppression
+        'archived': getattr(msg, 'archived', False),
+    }
+
+
+def private_messages_queryset(user, other_user):
+    """Messages des deux sens d'une conversation privée (index pair_key, timestamp, id)."""
+    return PrivateMessage.objects.filter(
+        pair_key=PrivateMessage.make_pair_key(user, other_user)
+    ).select_related('sender', 'receiver')
+
+
+def private_history(user, other_user, before=None, after=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Renvoie (messages, has_more) et marque comme lus uniquement les messages
+    reçus par user dans la fenêtre renvoyée.
+    """
+    page, has_more = paginate_archived(
+        private_messages_queryset(user, other_user),
+        archive.private_segments(PrivateMessage.make_pair_key(user, other_user)),
+        archive.rehydrate_private, before=before, after=after, limit=limit,
+    )
+    unread_ids = [msg.id for msg in page if msg.receiver_id == user.id and not msg.is_read]
+    if unread_ids:
+        updated = PrivateMessage.objects.filter(id__in=unread_ids, is_read=False).update(is_read=True)
+        Conversation.mark_read(user, other_user, updated)
+        conversation = Conversation.objects.filter(
+            pair_key=PrivateMessage.make_pair_key(user, other_user)
+        ).first()
+        notify_private_read(user.id, other_user.id, conversation.unread_for(user) if conversation else 0)
+    return page, has_more
+
+
+def serialize_private_message(msg):
+    return {
+        'id': msg.id,
+        'cursor': encode_cursor(msg.timestamp, msg.id),
+        'sender': msg.sender.username,
+        'message': msg.content,
+        **msg.image_payload(),
+        'file_url': msg.file.url if msg.file else '',
+        'timestamp': msg.timestamp.strftime("%d/%m %H:%M"),
+        'is_read': msg.is_read,
+        'archived': getattr(msg, 'archived', False),
+    }
@@ -0,0 +1,116 @@
+"""
+Traitement des images partagées, exécuté dans les processus du pool de
+thumbnails.py. Module sans Django (seulement Pillow): les processus sont
+lancés en 'spawn' et n'importent que ce module.
+
+Les blobs (storage.py) ne sont jamais réécrits: l'EXIF est retiré avant le
+calcul du hash (strip_exif, appelé par uploads.py), les miniatures ne font
+que lire l'original.
+"""
+import io
+import os
+
+from PIL import Image, ImageOps
+
+JPEG_QUALITY = 80
+WEBP_QUALITY = 78
+# Ré-encodage sans métadonnées: formats sûrs à ré-encoder
+STRIPPABLE_FORMATS = {'JPEG', 'PNG', 'WEBP'}
+
+
+def _save_atomic(image, path, **params):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    image.save(tmp_path, **params)
+    os.replace(tmp_path, path)
+
+
+def _flatten(image):
+    """RGB pour le JPEG: la transparence devient un fond blanc."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def strip_metadata(image, path):
+    """
+    Enregistre l'image dans path (chemin ou fichier) sans EXIF (position GPS, appareil...),
+    orientation appliquée aux pixels. Un JPEG non pivoté garde ses tables de
+    quantification (quality='keep'): pas de perte supplémentaire.
+    """
+    fmt = image.format
+    orientation = image.getexif().get(0x0112, 1)
+    params = {'format': fmt}
+    if fmt == 'JPEG':
+        params['quality'] = 'keep' if orientation == 1 else 92
+        if 'icc_profile' in image.info:
+            params['icc_profile'] = image.info['icc_profile']
+    elif fmt == 'WEBP':
+        params['lossless'] = image.info.get('lossless', False)
+        params['quality'] = 90
+    transposed = ImageOps.exif_transpose(image)
+    output = image if orientation == 1 else transposed
+    if isinstance(path, str):
+        _save_atomic(output, path, **params)
+    else:
+        output.save(path, **params)
+    return transposed
+
+
+def strip_exif(source, target=None):
+    """
+    Image source (chemin ou octets) sans EXIF. Renvoie None si elle n'en a
+    pas (ou format non ré-encodable, image animée); sinon l'écrit dans
+    target (chemin, éventuellement celui de la source) et renvoie target,
+    ou renvoie les octets si target est None.
+    """
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+        if (getattr(image, 'is_animated', False) or image.format not in STRIPPABLE_FORMATS
+                or not image.getexif()):
+            return None
+        image.load()
+        if target is not None:
+            strip_metadata(image, target)
+            return target
+        output = io.BytesIO()
+        strip_metadata(image, output)
+        return output.getvalue()
+
+
+def render_variants(source_path, target_base, sizes):
+    """
+    Génère <target_base>_<taille>.webp et .jpg pour chaque taille (côté max)
+    plus petite que l'image, sans modifier l'original.
+    Renvoie {'width', 'height', 'sizes'} (dimensions après orientation).
+    """
+    with Image.open(source_path) as image:
+        if getattr(image, 'is_animated', False):
+            # GIF / WebP animés: pas de miniature fixe, l'original reste affiché
+            return {'width': image.width, 'height': image.height, 'sizes': []}
+
+        width, height = image.size
+        if image.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            width, height = height, width
+
+        if image.format == 'JPEG' and sizes:
+            # Décodage JPEG à l'échelle réduite (1/2, 1/4, 1/8) suffisante
+            image.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+
+        os.makedirs(os.path.dirname(target_base), exist_ok=True)
+        generated = []
+        for size in sorted(sizes, reverse=True):
+            if max(width, height) <= size:
+                continue
+            # Réductions successives: de la plus grande à la plus petite
+            image = image.copy()
+            image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+            _save_atomic(image, f'{target_base}_{size}.webp', format='WEBP', quality=WEBP_QUALITY, method=4)
+            _save_atomic(_flatten(image), f'{target_base}_{size}.jpg', format='JPEG',
+                         quality=JPEG_QUALITY, optimize=True, progressive=True)
+            generated.append(size)
+    return {'width': width, 'height': height, 'sizes': sorted(generated)}
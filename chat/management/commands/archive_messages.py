@@ -0,0 +1,51 @@
+"""
+Déplace les messages plus anciens que la rétention (Room.retention_days,
+ROOM_RETENTION_DAYS, PRIVATE_RETENTION_DAYS) dans les archives compressées
+(voir chat/archive.py), par lots de ARCHIVE_BATCH_SIZE messages, une
+transaction par lot: interruptible et relançable. À lancer périodiquement (cron).
+
+    python manage.py archive_messages [--dry-run] [--batch-size 1000]
+    python manage.py archive_messages --room général
+    python manage.py archive_messages --prune   # fichiers d'archive sans segment
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat import archive
+from chat.models import Room
+
+
+class Command(BaseCommand):
+    help = "Archive les anciens messages hors de la base selon la rétention de chaque salon"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Compte les messages sans les archiver")
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--room', help="Un seul salon (nom)")
+        parser.add_argument('--prune', action='store_true',
+                            help="Supprime les fichiers d'archive qui ne sont plus indexés (salons supprimés)")
+
+    def handle(self, *args, **options):
+        dry_run, batch_size = options['dry_run'], options['batch_size']
+        verb = "à archiver" if dry_run else "archivé(s)"
+
+        if options['room']:
+            room = Room.objects.filter(name__iexact=options['room']).first()
+            if not room:
+                raise CommandError(f"Salon introuvable: {options['room']}")
+            count = archive.archive_room(room, batch_size=batch_size, dry_run=dry_run)
+            self.stdout.write(self.style.SUCCESS(f"{room.name}: {count} message(s) {verb}"))
+        else:
+            rooms, private = archive.archive_all(batch_size=batch_size, dry_run=dry_run)
+            self.stdout.write(self.style.SUCCESS(
+                f"{rooms} message(s) de salon et {private} message(s) privé(s) {verb}"
+            ))
+
+        if options['prune']:
+            pruned = 0
+            for relative_path in archive.unreferenced_files():
+                if not dry_run:
+                    os.remove(archive.archive_path(relative_path))
+                pruned += 1
+            self.stdout.write(f"{pruned} fichier(s) d'archive sans segment {'à supprimer' if dry_run else 'supprimé(s)'}")
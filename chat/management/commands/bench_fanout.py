@@ -0,0 +1,285 @@
+"""
+Banc de charge de la diffusion WebSocket: --clients connexions (consumers
+réels, via channels.testing.WebsocketCommunicator) réparties sur --rooms
+salons, ou par paires pour les conversations privées. Les messages sont
+envoyés par les clients eux-mêmes au débit --rate.
+
+Mesures, par type (room = ChatConsumer, private = PrivateChatConsumer):
+- débit d'envoi et de livraison, pertes;
+- latence de bout en bout envoi -> réception, par destinataire (p50/p95/p99);
+- requêtes SQL par message (toutes connexions, threads compris);
+- mémoire Python par connexion (tracemalloc pendant l'ouverture).
+
+Les résultats sont écrits en JSON dans --output (révision git, réglages,
+couche de canaux) pour comparer les versions. Base SQLite temporaire.
+
+    python manage.py bench_fanout --clients 200 --rooms 10 --rate 200 --messages 2000
+    python manage.py bench_fanout --kind private --write-behind --output fanout-wb.json
+"""
+import asyncio
+import gc
+import itertools
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from chat.models import Room, UserProfile
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class QueryCounter:
+    """Compte les requêtes de toutes les connexions (une par thread)."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def reset(self):
+        with self._lock:
+            count, self.count = self.count, 0
+        return count
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Débit, latence, requêtes et mémoire de la diffusion WebSocket (salons et messages privés)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=['room', 'private', 'both'], default='both')
+        parser.add_argument('--clients', type=int, default=100, help="Connexions WebSocket simulées")
+        parser.add_argument('--rooms', type=int, default=10, help="Salons (type room)")
+        parser.add_argument('--messages', type=int, default=1000, help="Messages envoyés par type")
+        parser.add_argument('--rate', type=float, default=200, help="Messages par seconde (0 = sans limite)")
+        parser.add_argument('--drain-timeout', type=float, default=10, help="Attente max des livraisons")
+        parser.add_argument('--write-behind', action='store_true', help="Active l'écriture par lots")
+        parser.add_argument('--output', default='bench_fanout.json', help="Fichier JSON des résultats")
+
+    def handle(self, *args, **options):
+        if options['clients'] < 2:
+            options['clients'] = 2
+        settings.MESSAGE_WRITE_BEHIND = options['write_behind']
+        # Le banc mesure la diffusion: pas de limitation de débit (ratelimit.py)
+        settings.RATE_LIMITS = {}
+        kinds = ['room', 'private'] if options['kind'] == 'both' else [options['kind']]
+
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_fanout_')
+        os.close(fd)
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = tmp_path
+        counter = QueryCounter()
+        connection_created.connect(counter.install)
+        try:
+            call_command('migrate', verbosity=0)
+            counter.install(connections['default'])
+            results = []
+            for kind in kinds:
+                plan = self.setup_room_clients(options) if kind == 'room' else self.setup_private_clients(options)
+                results.append(asyncio.run(self.run_kind(kind, plan, options, counter)))
+        finally:
+            connection_created.disconnect(counter.install)
+            connections['default'].close()
+            os.unlink(tmp_path)
+
+        report = {
+            'benchmark': 'fanout',
+            'created_at': timezone.now().isoformat(),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'channel_layer': settings.CHANNEL_LAYERS['default']['BACKEND'],
+            'settings': {
+                key: options[key]
+                for key in ('clients', 'rooms', 'messages', 'rate', 'drain_timeout', 'write_behind')
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for result in results:
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{result['kind']:>7}: {result['clients']} clients, "
+                f"{result['sent_per_s']:.0f} msg/s envoyés, {result['delivered_per_s']:.0f} livraisons/s, "
+                f"pertes {result['lost']}\n"
+                f"         latence p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} ms, "
+                f"{result['queries_per_message']} requêtes/message, "
+                f"{result['memory_per_connection_kb']} Ko/connexion"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Résultats écrits dans {options['output']}"))
+
+    # ---------- Données ----------
+    def create_users(self, prefix, count):
+        users = []
+        for i in range(count):
+            user, _ = User.objects.get_or_create(username=f'{prefix}{i}')
+            UserProfile.objects.get_or_create(user=user)
+            users.append(user)
+        return users
+
+    def setup_room_clients(self, options):
+        """[(user, chemin, groupe)] : clients répartis en round-robin sur les salons."""
+        users = self.create_users('fanout_room_', options['clients'])
+        rooms = []
+        for i in range(options['rooms']):
+            room, _ = Room.objects.get_or_create(name=f'fanout-{i}', defaults={'created_by': users[0]})
+            rooms.append(room)
+        plan = []
+        for i, user in enumerate(users):
+            room = rooms[i % len(rooms)]
+            room.members.add(user)
+            plan.append((user, f'/ws/chat/room/{room.name}/', room.name))
+        return plan
+
+    def setup_private_clients(self, options):
+        """Paires (2k, 2k+1), chacun connecté à la conversation de l'autre."""
+        users = self.create_users('fanout_pm_', options['clients'] - options['clients'] % 2)
+        plan = []
+        for a, b in zip(users[::2], users[1::2]):
+            pair = f'{a.id}-{b.id}'
+            plan.append((a, f'/ws/chat/private/{b.username}/', pair))
+            plan.append((b, f'/ws/chat/private/{a.username}/', pair))
+        return plan
+
+    # ---------- Mesure ----------
+    async def run_kind(self, kind, plan, options, counter):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from chat.batching import message_batcher
+        from chat.routing import websocket_urlpatterns
+
+        application = URLRouter(websocket_urlpatterns)
+
+        # Ouverture des connexions, mémoire mesurée par tracemalloc
+        gc.collect()
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        clients = []
+        for user, path, group in plan:
+            communicator = WebsocketCommunicator(application, path)
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect(timeout=10)
+            if not connected:
+                raise RuntimeError(f"Connexion refusée: {path}")
+            clients.append((communicator, group))
+        gc.collect()
+        memory_per_connection = (tracemalloc.get_traced_memory()[0] - memory_before) / len(clients)
+        tracemalloc.stop()
+
+        group_sizes = {}
+        for _, group in clients:
+            group_sizes[group] = group_sizes.get(group, 0) + 1
+
+        sent_at = {}
+        latencies = []
+        expected = 0
+        done = asyncio.Event()
+
+        async def reader(communicator):
+            # Sans délai: receive_from annule l'application à l'expiration
+            while True:
+                data = json.loads(await communicator.receive_from(timeout=None))
+                if data.get('type') != 'message':
+                    continue
+                started = sent_at.get(data['message'])
+                if started is not None:
+                    latencies.append(time.perf_counter() - started)
+                    if len(latencies) >= expected and len(sent_at) == options['messages']:
+                        done.set()
+
+        readers = [asyncio.create_task(reader(communicator)) for communicator, _ in clients]
+        await asyncio.sleep(0.1)
+        counter.reset()
+
+        key = 'action' if kind == 'room' else 'type'
+        senders = itertools.cycle(clients)
+        started = time.perf_counter()
+        for i in range(options['messages']):
+            if options['rate']:
+                delay = started + i / options['rate'] - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            communicator, group = next(senders)
+            content = f'bench-{kind}-{i}'
+            expected += group_sizes[group]
+            sent_at[content] = time.perf_counter()
+            await communicator.send_to(text_data=json.dumps({key: 'message', 'message': content}))
+        send_seconds = time.perf_counter() - started
+
+        try:
+            await asyncio.wait_for(done.wait(), options['drain_timeout'])
+        except asyncio.TimeoutError:
+            pass
+        total_seconds = time.perf_counter() - started
+        await message_batcher.flush()
+        queries = counter.reset()
+
+        for task in readers:
+            task.cancel()
+        await asyncio.gather(*readers, return_exceptions=True)
+        for communicator, _ in clients:
+            await communicator.disconnect()
+
+        return {
+            'kind': kind,
+            'clients': len(clients),
+            'groups': len(group_sizes),
+            'messages': options['messages'],
+            'expected_deliveries': expected,
+            'delivered': len(latencies),
+            'lost': expected - len(latencies),
+            'send_seconds': round(send_seconds, 3),
+            'total_seconds': round(total_seconds, 3),
+            'sent_per_s': round(options['messages'] / send_seconds, 1) if send_seconds else None,
+            'delivered_per_s': round(len(latencies) / total_seconds, 1) if total_seconds else None,
+            'latency_ms': {
+                'p50': ms(percentile(latencies, 50)),
+                'p95': ms(percentile(latencies, 95)),
+                'p99': ms(percentile(latencies, 99)),
+                'max': ms(max(latencies) if latencies else None),
+            },
+            'queries': queries,
+            'queries_per_message': round(queries / options['messages'], 2),
+            'memory_per_connection_kb': round(memory_per_connection / 1024, 1),
+        }
@@ -0,0 +1,152 @@
+"""
+Micro-banc de l'encodage des diffusions: coût CPU d'un message de salon
+(chat_message + unread_update) selon la taille du groupe, pour:
+- per_recipient: l'ancien chemin, chaque connexion reconstruit son dict et
+  appelle json.dumps (reproduit ici comme référence);
+- pre_encoded: la trame est encodée une fois par l'émetteur (codec.framed),
+  les handlers réels de ChatConsumer la transmettent telle quelle et ne
+  complètent que leur compteur de non lus (codec.splice_frame).
+
+Chaque mode est mesuré avec chaque codec disponible (json, orjson). Ni base
+ni couche de canaux: les handlers sont appelés directement, send() ne fait
+que compter les octets. Temps CPU du processus (time.process_time).
+
+    python manage.py bench_frames --sizes 1,10,100,1000 --messages 200
+"""
+import asyncio
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from chat import codec, notifications
+from chat.consumers import ChatConsumer
+from chat.models import Message, Room
+
+ROOM_ID = 1
+
+
+class Recipient(ChatConsumer):
+    """ChatConsumer sans connexion: send() compte les octets envoyés."""
+
+    def __init__(self, user):
+        self.user = user
+        self.sent_bytes = 0
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        self.sent_bytes += len(text_data)
+
+
+class LegacyRecipient(Recipient):
+    """Handlers d'avant les trames pré-encodées: un json.dumps par connexion."""
+
+    async def chat_message(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'message',
+            'id': event['id'],
+            'username': event['username'],
+            'message': event['message'],
+            'timestamp': event['timestamp'],
+            'image_url': event.get('image_url'),
+            'thumbnail_url': event.get('thumbnail_url'),
+            'thumbnail_srcset': event.get('thumbnail_srcset'),
+            'image_width': event.get('image_width'),
+            'image_height': event.get('image_height'),
+            'file_url': event.get('file_url'),
+        }))
+
+    async def unread_update(self, event):
+        from chat.unread import unread_counters
+        unread_counters.record_message(event['room_id'], event['seq'], event['sender_id'])
+        await self.send(text_data=json.dumps({
+            'type': 'unread_update',
+            'room_id': event['room_id'],
+            'unread_count': unread_counters.count(event['room_id'], self.user.id),
+            'delta': 0 if event['sender_id'] == self.user.id else 1
+        }))
+
+
+def legacy_events(message):
+    payload = notifications.room_message_payload(message)
+    return [
+        {**payload, 'type': 'chat_message'},
+        {'type': 'unread_update', 'room_id': ROOM_ID, 'seq': message.seq, 'sender_id': message.user_id},
+    ]
+
+
+class Command(BaseCommand):
+    help = "Coût CPU par message diffusé selon la taille du groupe (trames pré-encodées vs par connexion)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,100,1000', help="Tailles de groupe, séparées par des virgules")
+        parser.add_argument('--messages', type=int, default=200, help="Messages par mesure")
+        parser.add_argument('--content-length', type=int, default=200, help="Longueur du texte des messages")
+        parser.add_argument('--json', action='store_true', help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        codecs = ['json'] + (['orjson'] if codec.orjson is not None else [])
+        previous = codec.backend().name
+        results = []
+        try:
+            for size in sizes:
+                users = [User(id=i + 1, username=f'membre{i}') for i in range(size)]
+                results.append(self.measure('per_recipient', 'json', users, options))
+                for name in codecs:
+                    codec.use(name)
+                    results.append(self.measure('pre_encoded', name, users, options))
+        finally:
+            codec.use(previous)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(f"{'membres':>8} {'mode':<14} {'codec':<7} {'µs/message':>11} {'µs/destinataire':>16} {'Ko envoyés':>11}")
+        for row in results:
+            self.stdout.write(
+                f"{row['group_size']:>8} {row['mode']:<14} {row['codec']:<7} "
+                f"{row['us_per_message']:>11.1f} {row['us_per_recipient']:>16.2f} {row['kb_sent']:>11.1f}"
+            )
+
+    def measure(self, mode, codec_name, users, options):
+        legacy = mode == 'per_recipient'
+        recipients = [(LegacyRecipient if legacy else Recipient)(user) for user in users]
+        room = Room(id=ROOM_ID, name='banc')
+        author = users[0]
+        content = ('Lorem ipsum dolor sit amet, é ü ✓ ' * 20)[:options['content_length']]
+        now = timezone.now()
+        messages = [
+            Message(id=i + 1, room=room, user=author, content=content, timestamp=now, seq=i + 1)
+            for i in range(options['messages'])
+        ]
+
+        async def run():
+            for message in messages:
+                # Côté émetteur: construction des événements (et encodage unique)
+                events = legacy_events(message) if legacy else notifications.room_message_events(message)
+                # Côté couche de canaux: chaque connexion reçoit chaque événement
+                for event in events:
+                    handler = event['type']
+                    for recipient in recipients:
+                        await getattr(recipient, handler)(event)
+
+        loop = asyncio.new_event_loop()
+        try:
+            started = time.process_time()
+            loop.run_until_complete(run())
+            elapsed = time.process_time() - started
+        finally:
+            loop.close()
+
+        count = len(messages)
+        return {
+            'group_size': len(users),
+            'mode': mode,
+            'codec': codec_name,
+            'messages': count,
+            'us_per_message': elapsed / count * 1e6,
+            'us_per_recipient': elapsed / count / len(users) * 1e6,
+            'kb_sent': sum(recipient.sent_bytes for recipient in recipients) / 1024,
+        }
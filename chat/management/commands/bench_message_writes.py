@@ -0,0 +1,135 @@
+"""
+Compare le débit d'écriture des messages avec et sans écriture différée
+(chat/batching.py): --senders expéditeurs concurrents envoient chacun
+--messages messages, en attendant leur id comme les consumers.
+
+Par défaut, la mesure se fait sur une base SQLite temporaire (migrée) pour ne
+pas toucher aux données; --use-default-db utilise la base configurée.
+
+    python manage.py bench_message_writes --senders 50 --messages 20
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from chat.batching import MessageBatcher
+from chat.models import Room, Message, PrivateMessage
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class Command(BaseCommand):
+    help = "Débit d'écriture des messages: INSERT direct vs lots (write-behind)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--senders', type=int, default=50)
+        parser.add_argument('--messages', type=int, default=20, help="Messages par expéditeur")
+        parser.add_argument('--window-ms', type=int, default=5)
+        parser.add_argument('--max-rows', type=int, default=100)
+        parser.add_argument('--private', action='store_true', help="Messages privés au lieu d'un salon")
+        parser.add_argument('--use-default-db', action='store_true')
+        parser.add_argument('--json', action='store_true', help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        tmp_path = None
+        if not options['use_default_db']:
+            fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_messages_')
+            os.close(fd)
+            connections['default'].close()
+            connections['default'].settings_dict['NAME'] = tmp_path
+            call_command('migrate', verbosity=0)
+
+        try:
+            room, users = self.setup_data(options['senders'])
+            results = [
+                self.run_mode(room, users, options, batched=False),
+                self.run_mode(room, users, options, batched=True),
+            ]
+        finally:
+            if tmp_path:
+                connections['default'].close()
+                os.unlink(tmp_path)
+
+        direct, batched = results
+        report = {
+            'senders': options['senders'],
+            'messages_per_sender': options['messages'],
+            'kind': 'private' if options['private'] else 'room',
+            'window_ms': options['window_ms'],
+            'max_rows': options['max_rows'],
+            'results': results,
+            'speedup': round(batched['msgs_per_s'] / direct['msgs_per_s'], 2) if direct['msgs_per_s'] else None,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"{options['senders']} expéditeurs x {options['messages']} messages ({report['kind']})"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['mode']:>8}: {result['msgs_per_s']:>9.1f} msg/s  "
+                f"latence p50={result['latency_ms']['p50']} ms p95={result['latency_ms']['p95']} ms"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Accélération: x{report['speedup']}"))
+
+    def setup_data(self, senders):
+        users = []
+        for i in range(senders + 1):
+            user, _ = User.objects.get_or_create(username=f'bench_writer_{i}')
+            users.append(user)
+        room, _ = Room.objects.get_or_create(name='bench-writes', defaults={'created_by': users[0]})
+        return room, users
+
+    def run_mode(self, room, users, options, batched):
+        batcher = MessageBatcher(
+            enabled=batched, window_ms=options['window_ms'], max_rows=options['max_rows']
+        )
+        model = PrivateMessage if options['private'] else Message
+        before = model.objects.count()
+        latencies = []
+
+        def build(sender, i):
+            if options['private']:
+                return PrivateMessage(sender=sender, receiver=users[-1], content=f'bench {i}')
+            return Message(room=room, user=sender, content=f'bench {i}')
+
+        async def sender_loop(sender):
+            for i in range(options['messages']):
+                started = time.perf_counter()
+                message = await batcher.save(build(sender, i))
+                assert message.pk is not None
+                latencies.append(time.perf_counter() - started)
+
+        async def run():
+            await asyncio.gather(*(sender_loop(user) for user in users[:options['senders']]))
+            await batcher.flush()
+
+        started = time.perf_counter()
+        asyncio.run(run())
+        elapsed = time.perf_counter() - started
+
+        written = model.objects.count() - before
+        return {
+            'mode': 'batched' if batched else 'direct',
+            'written': written,
+            'seconds': round(elapsed, 3),
+            'msgs_per_s': round(written / elapsed, 1) if elapsed else 0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50) * 1000, 2),
+                'p95': round(percentile(latencies, 95) * 1000, 2),
+            },
+        }
@@ -0,0 +1,147 @@
+"""
+Mesure la recherche plein texte (chat/search.py, FTS5) face au LIKE '%x%'
+qu'utilisait l'admin, sur --messages messages générés (1 million par défaut).
+
+Le texte suit une distribution de Zipf sur un vocabulaire synthétique: on
+mesure un terme rare, un terme fréquent, un préfixe et deux mots combinés.
+La mesure se fait sur une base SQLite temporaire (migrée), supprimée ensuite.
+
+    python manage.py bench_search --messages 1000000 --json
+"""
+import itertools
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from chat.models import Room, Message
+from chat.search import search_messages
+
+SYLLABLES = ['ba', 'ko', 'ri', 'te', 'lu', 'mo', 'sa', 'ne', 'vi', 'da', 'po', 'ze', 'chu', 'fa', 'gi']
+
+
+def vocabulary(size, rng):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words, key=lambda w: (rng.random(), w))
+
+
+class Command(BaseCommand):
+    help = "Latence de la recherche FTS5 vs LIKE '%x%' sur un grand volume de messages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1_000_000)
+        parser.add_argument('--rooms', type=int, default=50)
+        parser.add_argument('--vocabulary', type=int, default=20_000)
+        parser.add_argument('--repeat', type=int, default=5, help="Mesures par requête (médiane)")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--json', action='store_true', help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3', prefix='bench_search_')
+        os.close(fd)
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = tmp_path
+        try:
+            call_command('migrate', verbosity=0)
+            user, words, load_seconds = self.setup_data(options)
+            queries = {
+                'rare': words[-1],
+                'common': words[0],
+                'prefix': words[len(words) // 100][:4],
+                'two_words': f'{words[1]} {words[50]}',
+            }
+            results = [self.measure(user, name, term, options['repeat']) for name, term in queries.items()]
+        finally:
+            connections['default'].close()
+            os.unlink(tmp_path)
+
+        report = {
+            'messages': options['messages'],
+            'rooms': options['rooms'],
+            'vocabulary': options['vocabulary'],
+            'load_seconds': round(load_seconds, 1),
+            'results': results,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"{options['messages']} messages indexés en {report['load_seconds']} s"
+        )
+        for result in results:
+            self.stdout.write(
+                f"{result['query']:>10} ({result['term']!r}): "
+                f"FTS {result['fts_ms']:>8.2f} ms  LIKE {result['like_ms']:>9.2f} ms  "
+                f"x{result['speedup']}"
+            )
+
+    def setup_data(self, options):
+        rng = random.Random(options['seed'])
+        user = User.objects.create(username='bench_search')
+        rooms = [Room.objects.create(name=f'bench-search-{i}', created_by=user) for i in range(options['rooms'])]
+        user.rooms.add(*rooms)
+
+        words = vocabulary(options['vocabulary'], rng)
+        # Zipf: le mot de rang r apparaît avec une fréquence en 1/r
+        cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+        room_ids = [room.id for room in rooms]
+        start = timezone.now() - timedelta(days=365)
+
+        started = time.perf_counter()
+        with connections['default'].cursor() as cursor:
+            cursor.execute('PRAGMA synchronous = OFF')
+            chunk = 10_000
+            for first in range(0, options['messages'], chunk):
+                rows = []
+                for i in range(first, min(first + chunk, options['messages'])):
+                    content = ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(3, 15)))
+                    rows.append((rng.choice(room_ids), user.id, content, start + timedelta(seconds=i * 30), i + 1))
+                # Les triggers FTS indexent chaque ligne comme en production
+                cursor.executemany(
+                    'INSERT INTO chat_message (room_id, user_id, content, timestamp, seq) VALUES (%s, %s, %s, %s, %s)',
+                    rows,
+                )
+            cursor.execute('PRAGMA synchronous = FULL')
+        return user, words, time.perf_counter() - started
+
+    def measure(self, user, name, term, repeat):
+        def fts():
+            search_messages(user, term)
+
+        def like():
+            # Ancienne recherche: LIKE sur le contenu, dans les salons de l'utilisateur
+            qs = Message.objects.filter(room__members=user)
+            for word in term.split():
+                qs = qs.filter(content__icontains=word)
+            list(qs.order_by('-id')[:20])
+
+        fts_ms = self.median_ms(fts, repeat)
+        like_ms = self.median_ms(like, repeat)
+        return {
+            'query': name,
+            'term': term,
+            'matches': Message.objects.filter(content__icontains=term.split()[0]).count(),
+            'fts_ms': fts_ms,
+            'like_ms': like_ms,
+            'speedup': round(like_ms / fts_ms, 1) if fts_ms else None,
+        }
+
+    def median_ms(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return round(statistics.median(timings), 2)
@@ -0,0 +1,230 @@
+"""
+Vérifie que group_send traverse les frontières de processus et mesure la
+latence de livraison.
+
+Le coordinateur lance le serveur pub/sub local (ou utilise --redis-url), puis
+démarre --workers processus qui hébergent chacun --clients connexions
+WebSocket (consumer ASGI de test, même forme d'événement que ChatConsumer),
+et enfin un processus émetteur qui fait --count group_send. Chaque processus
+obtient sa couche via settings (CHANNEL_LAYER / CHANNEL_REDIS_URL).
+
+    python manage.py channel_layer_check --workers 2 --clients 5 --count 200
+    python manage.py channel_layer_check --backend memory   # 0 livraison attendue
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.pubsub_server import PubSubServer
+
+GROUP = 'channel_layer_check'
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = "Mesure la diffusion group_send entre plusieurs processus ASGI"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backend', choices=['redis_pubsub', 'redis', 'memory'], default='redis_pubsub')
+        parser.add_argument('--redis-url', help="Serveur existant (sinon serveur pub/sub local)")
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--clients', type=int, default=1, help="Connexions WebSocket par worker")
+        parser.add_argument('--count', type=int, default=200)
+        parser.add_argument('--rate', type=float, default=500, help="Messages par seconde (0 = sans limite)")
+        parser.add_argument('--timeout', type=float, default=10)
+        parser.add_argument('--json', action='store_true', help="Sortie JSON")
+        # Usage interne: rôle des sous-processus
+        parser.add_argument('--role', choices=['coordinator', 'receiver', 'sender'], default='coordinator')
+
+    def handle(self, *args, **options):
+        role = options['role']
+        if role == 'receiver':
+            asyncio.run(self.run_receiver(options))
+        elif role == 'sender':
+            asyncio.run(self.run_sender(options))
+        else:
+            self.run_coordinator(options)
+
+    # ---------- Sous-processus ----------
+    def emit(self, kind, payload=None):
+        line = kind if payload is None else f'{kind} {json.dumps(payload)}'
+        self.stdout.write(line)
+        self.stdout.flush()
+
+    async def run_receiver(self, options):
+        from channels.generic.websocket import AsyncWebsocketConsumer
+        from channels.testing import WebsocketCommunicator
+
+        class ProbeConsumer(AsyncWebsocketConsumer):
+            async def connect(self):
+                await self.channel_layer.group_add(GROUP, self.channel_name)
+                await self.accept()
+
+            async def disconnect(self, close_code):
+                await self.channel_layer.group_discard(GROUP, self.channel_name)
+
+            async def chat_message(self, event):
+                await self.send(text_data=json.dumps({
+                    'type': 'message',
+                    'id': event['id'],
+                    'sent_at': event['sent_at'],
+                }))
+
+        communicators = []
+        for _ in range(options['clients']):
+            communicator = WebsocketCommunicator(ProbeConsumer.as_asgi(), '/ws/probe/')
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise CommandError("Connexion WebSocket refusée")
+            communicators.append(communicator)
+        self.emit('READY')
+
+        latencies = []
+        deadline = time.monotonic() + options['timeout']
+
+        async def drain(communicator):
+            received = 0
+            while received < options['count']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    data = json.loads(await communicator.receive_from(timeout=remaining))
+                except asyncio.TimeoutError:
+                    # receive_from annule l'application à l'expiration
+                    return received
+                latencies.append(time.time() - data['sent_at'])
+                received += 1
+            await communicator.disconnect()
+            return received
+
+        received = await asyncio.gather(*(drain(c) for c in communicators))
+        self.emit('RESULT', {'received': sum(received), 'latencies': latencies})
+
+    async def run_sender(self, options):
+        from channels.layers import get_channel_layer
+
+        channel_layer = get_channel_layer()
+        interval = 1 / options['rate'] if options['rate'] else 0
+        started = time.monotonic()
+        for i in range(options['count']):
+            await channel_layer.group_send(GROUP, {
+                'type': 'chat_message',
+                'id': i,
+                'sent_at': time.time(),
+            })
+            if interval:
+                delay = started + (i + 1) * interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+        # Laisse le temps aux PUBLISH en tampon de partir avant la sortie
+        await asyncio.sleep(0.2)
+        self.emit('SENT', {'count': options['count'], 'seconds': time.monotonic() - started})
+
+    # ---------- Coordinateur ----------
+    def start_local_server(self):
+        loop = asyncio.new_event_loop()
+        server = PubSubServer(port=0)
+        loop.run_until_complete(server.start())
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        return server
+
+    def spawn(self, role, options, env):
+        return subprocess.Popen(
+            [
+                sys.executable, str(settings.BASE_DIR / 'manage.py'), 'channel_layer_check',
+                '--role', role,
+                '--clients', str(options['clients']),
+                '--count', str(options['count']),
+                '--rate', str(options['rate']),
+                '--timeout', str(options['timeout']),
+            ],
+            env=env, stdout=subprocess.PIPE, text=True,
+        )
+
+    def read_line(self, process, kind):
+        for line in process.stdout:
+            if line.startswith(kind):
+                payload = line[len(kind):].strip()
+                return json.loads(payload) if payload else {}
+        raise CommandError(f"Le sous-processus {process.pid} s'est arrêté sans {kind}")
+
+    def run_coordinator(self, options):
+        backend = options['backend']
+        redis_url = options['redis_url']
+        if backend != 'memory' and not redis_url:
+            if backend == 'redis':
+                raise CommandError("--backend redis nécessite --redis-url (le serveur local ne gère pas Lua)")
+            server = self.start_local_server()
+            redis_url = f'redis://127.0.0.1:{server.port}/0'
+
+        env = dict(os.environ, CHANNEL_LAYER=backend, CHANNEL_REDIS_URL=redis_url or '')
+        receivers = [self.spawn('receiver', options, env) for _ in range(options['workers'])]
+        try:
+            for process in receivers:
+                self.read_line(process, 'READY')
+            # Les SUBSCRIBE sont envoyés sans attendre l'accusé de réception
+            time.sleep(0.2)
+            sender = self.spawn('sender', options, env)
+            sent = self.read_line(sender, 'SENT')
+            sender.wait()
+            results = [self.read_line(process, 'RESULT') for process in receivers]
+        finally:
+            for process in receivers:
+                if process.poll() is None:
+                    process.wait(timeout=options['timeout'] + 5)
+
+        latencies = [value for result in results for value in result['latencies']]
+        expected = options['count'] * options['workers'] * options['clients']
+        report = {
+            'backend': backend,
+            'redis_url': redis_url,
+            'workers': options['workers'],
+            'clients_per_worker': options['clients'],
+            'sent': sent['count'],
+            'send_seconds': round(sent['seconds'], 3),
+            'expected': expected,
+            'delivered': sum(result['received'] for result in results),
+            'latency_ms': {
+                name: round(value * 1000, 3) if value is not None else None
+                for name, value in (
+                    ('p50', percentile(latencies, 50)),
+                    ('p95', percentile(latencies, 95)),
+                    ('p99', percentile(latencies, 99)),
+                    ('max', max(latencies) if latencies else None),
+                )
+            },
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"Backend: {backend} ({redis_url or 'en mémoire'})")
+        self.stdout.write(
+            f"Processus: {options['workers']} workers x {options['clients']} connexions + 1 émetteur"
+        )
+        self.stdout.write(f"Livrés: {report['delivered']}/{expected}")
+        latency = report['latency_ms']
+        self.stdout.write(
+            f"Latence inter-processus (ms): p50={latency['p50']} p95={latency['p95']} "
+            f"p99={latency['p99']} max={latency['max']}"
+        )
+        if report['delivered'] == expected:
+            self.stdout.write(self.style.SUCCESS("group_send traverse les processus"))
+        else:
+            self.stdout.write(self.style.WARNING("Livraison incomplète entre processus"))
@@ -0,0 +1,56 @@
+"""
+Affiche les plans des chemins chauds (voir chat/query_plans.py) sur une base
+SQLite temporaire et échoue (code 1) si l'un d'eux régresse. Les mêmes
+vérifications tournent dans `python manage.py test chat`.
+
+    python manage.py check_query_plans [--verbose] [--json]
+"""
+import json
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from chat.query_plans import QueryPlanChecker, QueryPlanError
+
+
+class Command(BaseCommand):
+    help = "Vérifie par EXPLAIN QUERY PLAN que les requêtes des chemins chauds utilisent un index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose', action='store_true', help="Affiche tous les plans")
+        parser.add_argument('--json', action='store_true', help="Sortie JSON")
+
+    def handle(self, *args, **options):
+        fd, tmp_path = tempfile.mkstemp(suffix='.sqlite3', prefix='query_plans_')
+        os.close(fd)
+        connections['default'].close()
+        connections['default'].settings_dict['NAME'] = tmp_path
+        try:
+            call_command('migrate', verbosity=0)
+            report = QueryPlanChecker().run()
+        except QueryPlanError as e:
+            raise CommandError(str(e))
+        finally:
+            connections['default'].close()
+            os.unlink(tmp_path)
+
+        failures = [(s['scenario'], v) for s in report for v in s['violations']]
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            for scenario in report:
+                status = self.style.ERROR('ÉCHEC') if scenario['violations'] else self.style.SUCCESS('ok')
+                self.stdout.write(f"{scenario['scenario']:<38} {scenario['queries']:>3} requêtes  {status}")
+                if options['verbose']:
+                    for query in scenario['plans']:
+                        self.stdout.write(f"    {query['sql'][:120]}")
+                        for line in query['plan']:
+                            self.stdout.write(f"        {line}")
+                for violation in scenario['violations']:
+                    self.stdout.write(f"    {violation['problem']}: {violation['sql'][:160]}")
+                    self.stdout.write(f"        {' | '.join(violation['plan'])}")
+        if failures:
+            raise CommandError(f"{len(failures)} requête(s) sans index adapté")
@@ -0,0 +1,17 @@
+"""
+Supprime les envois par morceaux abandonnés (sans activité depuis
+UPLOAD_EXPIRY_HOURS) et leurs fichiers partiels. À lancer périodiquement (cron).
+
+    python manage.py clean_uploads
+"""
+from django.core.management.base import BaseCommand
+
+from chat.uploads import expire_uploads
+
+
+class Command(BaseCommand):
+    help = "Supprime les envois de fichiers par morceaux expirés"
+
+    def handle(self, *args, **options):
+        expired = expire_uploads()
+        self.stdout.write(self.style.SUCCESS(f"{expired} envoi(s) expiré(s) supprimé(s)"))
@@ -0,0 +1,67 @@
+"""
+Ramasse-miettes du stockage par contenu (chat/storage.py, chat/blobs.py):
+supprime les blobs sans référence inutilisés depuis BLOB_GC_GRACE_HOURS,
+avec leurs miniatures.
+
+    python manage.py collect_blobs [--dry-run] [--grace-hours 24]
+    python manage.py collect_blobs --recount   # recalcule les compteurs d'abord
+    python manage.py collect_blobs --adopt     # range les fichiers d'avant le stockage par contenu
+"""
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from chat import blobs
+from chat.storage import BLOB_PREFIX
+
+
+class Command(BaseCommand):
+    help = "Supprime les fichiers (blobs) qui ne sont plus référencés par aucun message ni avatar"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Affiche sans supprimer")
+        parser.add_argument('--grace-hours', type=float, default=None)
+        parser.add_argument('--recount', action='store_true',
+                            help="Recalcule les compteurs depuis les tables (bases sans triggers)")
+        parser.add_argument('--adopt', action='store_true',
+                            help="Déplace les anciens fichiers (chat_files/, avatars/...) dans le stockage par contenu")
+
+    def handle(self, *args, **options):
+        if options['adopt']:
+            adopted, removed = self.adopt(options['dry_run'])
+            self.stdout.write(f"{adopted} référence(s) rangée(s), {removed} ancien(s) fichier(s) supprimé(s)")
+        if options['recount'] or options['adopt']:
+            fixed = blobs.recount()
+            self.stdout.write(f"{fixed} compteur(s) corrigé(s)")
+
+        deleted, freed = blobs.collect_garbage(options['grace_hours'], dry_run=options['dry_run'])
+        verb = "à supprimer" if options['dry_run'] else "supprimé(s)"
+        self.stdout.write(self.style.SUCCESS(f"{deleted} blob(s) {verb}, {freed / 1024 / 1024:.1f} Mo"))
+
+        unmanaged = list(blobs.unmanaged_files())
+        if unmanaged:
+            self.stdout.write(f"{len(unmanaged)} fichier(s) sans Blob dans {BLOB_PREFIX}/ (non supprimés):")
+            for name in unmanaged[:20]:
+                self.stdout.write(f"    {name}")
+
+    def adopt(self, dry_run):
+        """Chaque fichier hors blobs/ est haché, stocké (dédupliqué) puis la ligne repointée."""
+        adopted = removed = 0
+        for model, field in blobs.REFERENCING_FIELDS:
+            rows = (model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True})
+                    .exclude(**{f'{field}__startswith': f'{BLOB_PREFIX}/'}))
+            for pk, old_name in rows.values_list('pk', field).iterator():
+                if not default_storage.exists(old_name):
+                    self.stderr.write(f"{model.__name__} {pk}: {old_name} introuvable")
+                    continue
+                adopted += 1
+                if dry_run:
+                    continue
+                with default_storage.open(old_name, 'rb') as f:
+                    new_name = default_storage.save(old_name, File(f, name=old_name))
+                # Le trigger de mise à jour compte la nouvelle référence
+                model.objects.filter(pk=pk, **{field: old_name}).update(**{field: new_name})
+                if not any(m.objects.filter(**{f: old_name}).exists() for m, f in blobs.REFERENCING_FIELDS):
+                    default_storage.delete(old_name)
+                    removed += 1
+        return adopted, removed
@@ -0,0 +1,71 @@
+"""
+Génère les miniatures des images déjà en base (messages de salon et privés
+sans image_variants), avec le même pool de processus que les nouveaux envois.
+--strip-metadata retire d'abord l'EXIF des images stockées avant son retrait
+à l'envoi: chacune devient un nouveau blob (thumbnails.strip_stored_image).
+
+    python manage.py generate_thumbnails [--force] [--strip-metadata] [--workers 4]
+"""
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chat import thumbnails
+from chat.models import Message, PrivateMessage
+
+
+class Command(BaseCommand):
+    help = "Génère les miniatures (WebP/JPEG) et les dimensions des images partagées"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Régénère aussi les images déjà traitées")
+        parser.add_argument('--strip-metadata', action='store_true',
+                            help="Retire l'EXIF des images déjà stockées (nouveaux blobs)")
+        parser.add_argument('--workers', type=int, default=None, help="Processus (défaut: THUMBNAIL_WORKERS)")
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or settings.THUMBNAIL_WORKERS
+        started = time.perf_counter()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            if options['strip_metadata']:
+                self.strip_metadata(executor)
+            for model in (Message, PrivateMessage):
+                queryset = model.objects.exclude(image='').exclude(image__isnull=True)
+                if not options['force']:
+                    queryset = queryset.filter(image_variants__isnull=True)
+                futures = {}
+                for message in queryset.only('pk', 'image').iterator():
+                    future = thumbnails.submit(message, executor)
+                    if future is not None:
+                        futures[future] = (message.pk, message.image.name)
+                for future in as_completed(futures):
+                    pk, image_name = futures[future]
+                    try:
+                        thumbnails.store(model, pk, image_name, future.result())
+                        done += 1
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f"{model.__name__} {pk} ({image_name}): {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{done} image(s) traitée(s), {failed} erreur(s) en {time.perf_counter() - started:.1f} s"
+        ))
+
+    def strip_metadata(self, executor):
+        names = set()
+        for model in (Message, PrivateMessage):
+            names.update(
+                model.objects.exclude(image='').exclude(image__isnull=True)
+                .values_list('image', flat=True).distinct().iterator()
+            )
+        stripped = 0
+        for name in sorted(names):
+            try:
+                if thumbnails.strip_stored_image(name, executor):
+                    stripped += 1
+            except Exception as e:
+                self.stderr.write(f"{name}: {e}")
+        self.stdout.write(f"{stripped} image(s) sans EXIF sur {len(names)}")
@@ -0,0 +1,24 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from chat.pubsub_server import PubSubServer
+
+
+class Command(BaseCommand):
+    help = "Lance un serveur PUBLISH/SUBSCRIBE local compatible Redis (CHANNEL_LAYER=redis_pubsub)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=6379)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.serve(options['host'], options['port']))
+
+    async def serve(self, host, port):
+        server = await PubSubServer(host, port).start()
+        self.stdout.write(f'Serveur pub/sub à l\'écoute sur redis://{host}:{server.port}/0')
+        try:
+            await server.serve_forever()
+        except asyncio.CancelledError:
+            pass
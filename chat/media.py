@@ -0,0 +1,229 @@
+"""
+Service des fichiers de MEDIA_ROOT avec contrôle d'accès (vue serve_media).
+
+Accès: fichier d'un message de salon (salon public ou dont l'utilisateur est
+membre), d'un message privé (expéditeur ou destinataire), archivé ou non
+(archive.py), ou avatar (tout utilisateur connecté). Les miniatures (thumbnails.py) suivent les droits de
+l'image d'origine. Les colonnes de fichiers ont des index partiels (> '')
+pour que ces vérifications restent des recherches par index.
+
+Réponse:
+- ETag fort: le SHA-256 du nom pour un blob, sinon mtime + taille;
+  If-None-Match -> 304;
+- Range (un seul intervalle) -> 206, If-Range respecté: lecture/avance
+  rapide des vidéos et sons;
+- blobs (nom = hash du contenu, jamais réécrits: l'EXIF est retiré avant le
+  stockage, voir uploads.py) en cache long, `immutable`. Leurs miniatures,
+  régénérables (generate_thumbnails --force), sont revalidées;
+- octets transmis sans boucle Python: en-tête X-Accel-Redirect / X-Sendfile
+  si MEDIA_ACCEL_REDIRECT est réglé (nginx, Apache), sinon FileResponse,
+  que les serveurs WSGI envoient par os.sendfile (wsgi.file_wrapper).
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils.http import http_date
+
+from .models import ArchivedFile, Blob, Message, PrivateMessage, UserProfile
+from .storage import BLOB_PREFIX
+
+IMMUTABLE_CACHE = 'private, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'private, no-cache'
+
+# Affichés dans la page; tout le reste est proposé en téléchargement
+INLINE_TYPES = ('image/png', 'image/jpeg', 'image/gif', 'image/webp', 'application/pdf')
+INLINE_PREFIXES = ('video/', 'audio/')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOB_RE = re.compile(rf'^{BLOB_PREFIX}/[0-9a-f]{{2}}/(?P<sha256>[0-9a-f]{{64}})(?:\.\w+)?$')
+THUMBNAIL_RE = re.compile(r'^(?P<directory>.+)/thumbs/(?P<stem>[^/]+)_\d+\.(?:webp|jpg)$')
+
+# Dossiers servis (upload_to des champs et blobs); jamais uploads_tmp/
+SERVED_DIRECTORIES = (BLOB_PREFIX, 'chat_images', 'chat_files', 'private_images', 'private_files', 'avatars')
+
+
+# ---------- Droits ----------
+def _references(fields, name):
+    # Le terme "> ''" reprend la condition des index partiels: SQLite les utilise
+    query = Q()
+    for field in fields:
+        query |= Q(**{field: name, f'{field}__gt': ''})
+    return query
+
+
+def can_access_original(user, name):
+    if UserProfile.objects.filter(avatar=name, avatar__gt='').exists():
+        return True
+    if Message.objects.filter(_references(('image', 'file'), name)).filter(
+        Q(room__is_private=False) | Q(room__members=user)
+    ).exists():
+        return True
+    if PrivateMessage.objects.filter(_references(('image', 'file'), name)).filter(
+        Q(sender=user) | Q(receiver=user)
+    ).exists():
+        return True
+    # Messages archivés (archive.py): mêmes règles, via le segment
+    return ArchivedFile.objects.filter(name=name).filter(
+        Q(segment__room__is_private=False) | Q(segment__room__members=user)
+        | Q(segment__pair_key__startswith=f'{user.pk}:') | Q(segment__pair_key__endswith=f':{user.pk}')
+    ).exists()
+
+
+def original_names(thumbnail_name):
+    """Images d'origine possibles d'une miniature (<dossier>/thumbs/<nom>_<taille>.<ext>)."""
+    match = THUMBNAIL_RE.match(thumbnail_name)
+    if not match:
+        return []
+    base = f"{match['directory']}/{match['stem']}"
+    if match['directory'].startswith(f'{BLOB_PREFIX}/'):
+        # Parcours de la clé primaire: blobs/aa/<hash>.* ('.' < '/')
+        return list(Blob.objects.filter(name__gt=f'{base}.', name__lt=f'{base}/').values_list('name', flat=True))
+    # Anciens fichiers (avant le stockage par contenu): rares, préfixe sans index
+    names = set()
+    for model in (Message, PrivateMessage):
+        names.update(model.objects.filter(image__startswith=f'{base}.').values_list('image', flat=True)[:10])
+    return list(names)
+
+
+def can_access(user, name):
+    if not user.is_authenticated:
+        return False
+    if '/thumbs/' in name:
+        return any(can_access_original(user, original) for original in original_names(name))
+    return can_access_original(user, name)
+
+
+# ---------- Réponse ----------
+def make_etag(name, stat):
+    match = BLOB_RE.match(name)
+    if match:
+        return f'"{match["sha256"]}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # Comparaison faible pour If-None-Match (RFC 9110): W/ ignoré
+    return etag in (tag.strip().removeprefix('W/') for tag in header.split(','))
+
+
+def parse_range(header, size):
+    """(début, fin incluse) d'un intervalle unique, None si absent ou multiple, False si hors fichier."""
+    match = RANGE_RE.match(header.replace(' ', '')) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        # bytes=-N: les N derniers octets
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+class FileRange:
+    """
+    Fichier limité à un intervalle: lu par blocs par les serveurs ASGI, ou
+    envoyé par os.sendfile depuis la position courante du descripteur
+    (wsgi.file_wrapper, borné par Content-Length).
+    """
+
+    def __init__(self, f, start, length):
+        self.f = f
+        self.name = f.name
+        self.remaining = length
+        f.seek(start)
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def close(self):
+        self.f.close()
+
+
+def content_headers(response, name, content_type, stat, etag):
+    response['Content-Type'] = content_type
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = IMMUTABLE_CACHE if BLOB_RE.match(name) else REVALIDATE_CACHE
+    response['Accept-Ranges'] = 'bytes'
+    response['X-Content-Type-Options'] = 'nosniff'
+    disposition = 'inline' if content_type in INLINE_TYPES or content_type.startswith(INLINE_PREFIXES) else 'attachment'
+    response['Content-Disposition'] = f'{disposition}; filename="{os.path.basename(name)}"'
+
+
+def serve(request, name):
+    name = os.path.normpath(name).replace('\\', '/')
+    if name.startswith(('.', '/')) or name.split('/', 1)[0] not in SERVED_DIRECTORIES:
+        raise Http404
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    # 404 plutôt que 403: ne révèle pas l'existence du fichier
+    if not can_access(request.user, name):
+        raise Http404
+
+    etag = make_etag(name, stat)
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        response = HttpResponse(status=304)
+        content_headers(response, name, content_type, stat, etag)
+        del response['Content-Type']
+        return response
+
+    if settings.MEDIA_ACCEL_REDIRECT:
+        # Le serveur web lit le fichier et gère lui-même Range et If-None-Match
+        response = HttpResponse()
+        content_headers(response, name, content_type, stat, etag)
+        if settings.MEDIA_ACCEL_HEADER == 'X-Sendfile':
+            response['X-Sendfile'] = path
+        else:
+            response[settings.MEDIA_ACCEL_HEADER] = settings.MEDIA_ACCEL_REDIRECT + name
+        return response
+
+    byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    if_range = request.headers.get('If-Range')
+    if byte_range is not None and if_range and if_range.strip() != etag:
+        # Le fichier a changé depuis la première partie: on renvoie tout
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+
+    f = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f)
+        content_headers(response, name, content_type, stat, etag)
+        response['Content-Length'] = str(stat.st_size)
+        return response
+
+    start, end = byte_range
+    response = FileResponse(FileRange(f, start, end - start + 1), status=206)
+    content_headers(response, name, content_type, stat, etag)
+    response['Content-Length'] = str(end - start + 1)
+    response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    return response
@@ -0,0 +1,301 @@
+"""
+Instrumentation au format Prometheus, en mémoire par processus (comme
+unread.py et presence.py): chaque worker expose ses propres valeurs sur
+/metrics et Prometheus les interroge un par un.
+
+- MetricsMiddleware: durée, statut et requêtes SQL de chaque vue;
+- MetricsMixin (consumers): durée et requêtes SQL de chaque action reçue,
+  durée de chaque group_send, connexions ouvertes par classe de consumer;
+- files d'envoi (outbound.py): trames en attente, abandonnées, clients lents;
+- actions refusées par la limitation de débit (ratelimit.py);
+- db_execute_wrapper: posé sur chaque connexion (signal connection_created),
+  compte les requêtes et leur durée dans le contexte courant (requête HTTP ou
+  trame WebSocket). Le contexte est une contextvar, que database_sync_to_async
+  propage au thread qui exécute la requête.
+
+Coût d'une observation: un perf_counter() et une mise à jour de dict sous
+verrou. Les labels ne prennent que des valeurs bornées (noms de vues,
+actions connues, types d'événements du code).
+"""
+import bisect
+import contextvars
+import threading
+import time
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield f'{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}'
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DURATION_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._values = {}  # labels -> [comptes par bucket (+Inf compris), somme, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def count(self, *label_values):
+        entry = self._values.get(label_values)
+        return entry[2] if entry else 0
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, [list(e[0]), e[1], e[2]]) for labels, e in self._values.items())
+        for label_values, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, ('le', _format_value(float(bound))))
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = _format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {_format_value(total)}'
+            yield f'{self.name}_count{labels} {count}'
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    'chat_http_requests_total', "Requêtes HTTP traitées", ('view', 'method', 'status')))
+HTTP_DURATION = registry.register(Histogram(
+    'chat_http_request_duration_seconds', "Durée des requêtes HTTP", ('view',)))
+HTTP_DB_QUERIES = registry.register(Histogram(
+    'chat_http_request_db_queries', "Requêtes SQL par requête HTTP", ('view',), QUERY_BUCKETS))
+HTTP_DB_DURATION = registry.register(Histogram(
+    'chat_http_request_db_seconds', "Temps SQL par requête HTTP", ('view',)))
+WS_CONNECTIONS = registry.register(Gauge(
+    'chat_ws_connections', "Connexions WebSocket ouvertes", ('consumer',)))
+WS_CONNECTIONS_TOTAL = registry.register(Counter(
+    'chat_ws_connections_total', "Connexions WebSocket acceptées", ('consumer',)))
+WS_RECEIVE_DURATION = registry.register(Histogram(
+    'chat_ws_receive_duration_seconds', "Durée de traitement d'une trame reçue", ('consumer', 'action')))
+WS_RECEIVE_DB_QUERIES = registry.register(Histogram(
+    'chat_ws_receive_db_queries', "Requêtes SQL par trame reçue", ('consumer', 'action'), QUERY_BUCKETS))
+WS_RECEIVE_DB_DURATION = registry.register(Histogram(
+    'chat_ws_receive_db_seconds', "Temps SQL par trame reçue", ('consumer', 'action')))
+WS_GROUP_SEND_DURATION = registry.register(Histogram(
+    'chat_ws_group_send_duration_seconds', "Durée des group_send", ('consumer', 'event')))
+WS_OUTBOUND_QUEUED = registry.register(Gauge(
+    'chat_ws_outbound_queued', "Trames en attente dans les files d'envoi (outbound.py)", ('consumer',)))
+WS_OUTBOUND_DROPPED = registry.register(Counter(
+    'chat_ws_outbound_dropped_total', "Trames abandonnées (coalesced, snapshot, disconnect)", ('consumer', 'reason')))
+WS_SLOW_CONSUMERS = registry.register(Counter(
+    'chat_ws_slow_consumers_total', "Clients lents traités, par politique", ('consumer', 'policy')))
+WS_RATE_LIMITED = registry.register(Counter(
+    'chat_ws_rate_limited_total', "Actions refusées par la limitation de débit (ratelimit.py)", ('consumer', 'action', 'scope')))
+DB_QUERIES = registry.register(Counter(
+    'chat_db_queries_total', "Requêtes SQL par contexte (http, ws, other = tâches de fond)", ('scope',)))
+
+
+# ---------- Requêtes SQL ----------
+class QueryStats:
+    __slots__ = ('scope', 'count', 'seconds', 'closed')
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        # Une tâche créée pendant l'événement hérite de la contextvar:
+        # ses requêtes ultérieures ne doivent plus lui être attribuées
+        self.closed = False
+
+
+_current_stats = contextvars.ContextVar('metrics_query_stats', default=None)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats = _current_stats.get()
+        if stats is not None and not stats.closed:
+            stats.count += 1
+            stats.seconds += time.perf_counter() - started
+            DB_QUERIES.inc(stats.scope)
+        else:
+            DB_QUERIES.inc('other')
+
+
+def install_db_wrapper(sender=None, connection=None, **kwargs):
+    """Receveur de connection_created: une fois par connexion (donc par thread)."""
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
+
+
+def track_queries(scope):
+    stats = QueryStats(scope)
+    return stats, _current_stats.set(stats)
+
+
+def untrack_queries(stats, token):
+    _current_stats.reset(token)
+    stats.closed = True
+
+
+# ---------- HTTP ----------
+class MetricsMiddleware:
+    """À placer en tête de MIDDLEWARE pour mesurer toute la chaîne."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats, token = track_queries('http')
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            untrack_queries(stats, token)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        HTTP_REQUESTS.inc(view, request.method, str(response.status_code))
+        HTTP_DURATION.observe(elapsed, view)
+        HTTP_DB_QUERIES.observe(stats.count, view)
+        HTTP_DB_DURATION.observe(stats.seconds, view)
+        return response
+
+
+# ---------- WebSocket ----------
+class MetricsMixin:
+    """
+    Pour les consumers: metrics_action_key est la clé JSON qui porte l'action
+    ('action', 'type'), metrics_default_action sa valeur si elle est absente.
+    Seules les actions de metrics_actions ont leur propre label, les autres
+    sont comptées dans 'other'. receive() appelle metrics_record() avec la
+    trame qu'il vient de décoder: pas de second décodage pour le label.
+    """
+    metrics_action_key = None
+    metrics_default_action = None
+    metrics_actions = ()
+
+    _metrics_open = False
+    _metrics_label = 'receive'
+
+    def metrics_record(self, data):
+        if not isinstance(data, dict):
+            self._metrics_label = 'invalid'
+            return
+        action = data.get(self.metrics_action_key, self.metrics_default_action)
+        self._metrics_label = action if action in self.metrics_actions else 'other'
+
+    async def accept(self, subprotocol=None, headers=None):
+        await super().accept(subprotocol, headers)
+        if not self._metrics_open:
+            self._metrics_open = True
+            WS_CONNECTIONS.inc(type(self).__name__)
+            WS_CONNECTIONS_TOTAL.inc(type(self).__name__)
+
+    async def websocket_disconnect(self, message):
+        if self._metrics_open:
+            self._metrics_open = False
+            WS_CONNECTIONS.dec(type(self).__name__)
+        await super().websocket_disconnect(message)
+
+    async def websocket_receive(self, message):
+        consumer = type(self).__name__
+        # Trame non décodée par receive() (JSON invalide): 'invalid'
+        self._metrics_label = 'invalid' if self.metrics_action_key and message.get('text') else 'receive'
+        stats, token = track_queries('ws')
+        started = time.perf_counter()
+        try:
+            await super().websocket_receive(message)
+        finally:
+            untrack_queries(stats, token)
+            action = self._metrics_label
+            WS_RECEIVE_DURATION.observe(time.perf_counter() - started, consumer, action)
+            WS_RECEIVE_DB_QUERIES.observe(stats.count, consumer, action)
+            WS_RECEIVE_DB_DURATION.observe(stats.seconds, consumer, action)
+
+    async def group_send(self, group, event):
+        started = time.perf_counter()
+        try:
+            await self.channel_layer.group_send(group, event)
+        finally:
+            WS_GROUP_SEND_DURATION.observe(
+                time.perf_counter() - started, type(self).__name__, event.get('type', 'unknown')
+            )
@@ -0,0 +1,83 @@
+from django.db import migrations
+from django.db.models import Max
+
+
+def backfill_sequences(apps, schema_editor):
+    """
+    Numérote les messages existants par salon (ordre timestamp, id)
+    et initialise Room.last_seq.
+    """
+    Room = apps.get_model('chat', 'Room')
+    Message = apps.get_model('chat', 'Message')
+
+    for room_id in Room.objects.values_list('id', flat=True).iterator():
+        batch = []
+        seq = 0
+        for msg in Message.objects.filter(room_id=room_id).order_by('timestamp', 'id').only('id').iterator():
+            seq += 1
+            msg.seq = seq
+            batch.append(msg)
+            if len(batch) >= 1000:
+                Message.objects.bulk_update(batch, ['seq'])
+                batch = []
+        if batch:
+            Message.objects.bulk_update(batch, ['seq'])
+        Room.objects.filter(id=room_id).update(last_seq=seq)
+
+
+def collapse_message_reads(apps, schema_editor):
+    """
+    Remplace les lignes MessageRead (une par message lu) par un marqueur par
+    (utilisateur, salon): le plus grand seq lu ou envoyé par l'utilisateur.
+    """
+    Message = apps.get_model('chat', 'Message')
+    MessageRead = apps.get_model('chat', 'MessageRead')
+    RoomReadState = apps.get_model('chat', 'RoomReadState')
+
+    watermarks = {}
+    read_rows = MessageRead.objects.values('user_id', 'message__room_id').annotate(seq=Max('message__seq'))
+    sent_rows = Message.objects.values('user_id', 'room_id').annotate(seq=Max('seq'))
+    for row in read_rows:
+        key = (row['user_id'], row['message__room_id'])
+        watermarks[key] = max(watermarks.get(key, 0), row['seq'] or 0)
+    for row in sent_rows:
+        key = (row['user_id'], row['room_id'])
+        watermarks[key] = max(watermarks.get(key, 0), row['seq'] or 0)
+
+    RoomReadState.objects.bulk_create(
+        [
+            RoomReadState(user_id=user_id, room_id=room_id, last_read_seq=seq)
+            for (user_id, room_id), seq in watermarks.items()
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def expand_message_reads(apps, schema_editor):
+    """Retour arrière: recrée une ligne MessageRead par message sous le marqueur."""
+    Message = apps.get_model('chat', 'Message')
+    MessageRead = apps.get_model('chat', 'MessageRead')
+    RoomReadState = apps.get_model('chat', 'RoomReadState')
+
+    for state in RoomReadState.objects.iterator():
+        message_ids = Message.objects.filter(
+            room_id=state.room_id, seq__lte=state.last_read_seq
+        ).values_list('id', flat=True)
+        MessageRead.objects.bulk_create(
+            [MessageRead(user_id=state.user_id, message_id=message_id) for message_id in message_ids],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0010_room_read_state'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_sequences, migrations.RunPython.noop),
+        migrations.RunPython(collapse_message_reads, expand_message_reads),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2025-11-28 10:14
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0011_backfill_room_read_state'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='message',
+            unique_together={('room', 'seq')},
+        ),
+        migrations.DeleteModel(
+            name='MessageRead',
+        ),
+    ]
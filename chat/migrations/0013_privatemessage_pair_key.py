@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2025-11-28 14:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_pair_key(apps, schema_editor):
+    """Une requête UPDATE par couple (expéditeur, destinataire) existant."""
+    PrivateMessage = apps.get_model('chat', 'PrivateMessage')
+    pairs = PrivateMessage.objects.values_list('sender_id', 'receiver_id').distinct()
+    for sender_id, receiver_id in list(pairs):
+        PrivateMessage.objects.filter(sender_id=sender_id, receiver_id=receiver_id).update(
+            pair_key=f'{min(sender_id, receiver_id)}:{max(sender_id, receiver_id)}'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_message_seq_unique_delete_messageread'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='privatemessage',
+            name='pair_key',
+            field=models.CharField(default='', editable=False, max_length=41),
+        ),
+        migrations.RunPython(backfill_pair_key, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='privatemessage',
+            index=models.Index(fields=['pair_key', 'timestamp', 'id'], name='chat_pm_pair_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.7 on 2025-11-29 09:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def build_conversations(apps, schema_editor):
+    """Une Conversation par pair_key existant, avec dernier message et non lus."""
+    PrivateMessage = apps.get_model('chat', 'PrivateMessage')
+    Conversation = apps.get_model('chat', 'Conversation')
+
+    unread = {
+        (row['pair_key'], row['receiver_id']): row['n']
+        for row in PrivateMessage.objects.filter(is_read=False)
+        .values('pair_key', 'receiver_id').annotate(n=Count('id'))
+    }
+
+    conversations = []
+    for row in PrivateMessage.objects.values('pair_key').annotate(last_at=Max('timestamp')):
+        pair_key = row['pair_key']
+        user1_id, user2_id = (int(pk) for pk in pair_key.split(':'))
+        last = PrivateMessage.objects.filter(pair_key=pair_key).order_by('-timestamp', '-id').first()
+        conversations.append(Conversation(
+            pair_key=pair_key,
+            user1_id=user1_id,
+            user2_id=user2_id,
+            last_message_id=last.id,
+            last_message_at=last.timestamp,
+            user1_unread=unread.get((pair_key, user1_id), 0),
+            user2_unread=unread.get((pair_key, user2_id), 0),
+        ))
+    Conversation.objects.bulk_create(conversations, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0013_privatemessage_pair_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pair_key', models.CharField(max_length=41, unique=True)),
+                ('last_message_at', models.DateTimeField(blank=True, null=True)),
+                ('user1_unread', models.PositiveIntegerField(default=0)),
+                ('user2_unread', models.PositiveIntegerField(default=0)),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chat.privatemessage')),
+                ('user1', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_user1', to=settings.AUTH_USER_MODEL)),
+                ('user2', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversations_as_user2', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-last_message_at'],
+                'indexes': [models.Index(fields=['user1', 'last_message_at'], name='chat_conv_user1_last_idx'), models.Index(fields=['user2', 'last_message_at'], name='chat_conv_user2_last_idx')],
+            },
+        ),
+        migrations.RunPython(build_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2025-11-29 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0014_conversation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='members_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
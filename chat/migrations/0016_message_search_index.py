@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# Tables FTS5 à contenu externe + triggers de synchronisation (SQLite uniquement).
+# Voir chat/search.py: ensure_index() recrée ces objets si une migration
+# ultérieure reconstruit chat_message ou chat_privatemessage.
+TABLES = {
+    'chat_message': 'chat_message_fts',
+    'chat_privatemessage': 'chat_privatemessage_fts',
+}
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, fts in TABLES.items():
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"content, content='{table}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF content ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); "
+            f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END"
+        )
+        # Indexe les messages existants
+        schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for fts in TABLES.values():
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0015_room_members_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2025-11-29 14:05
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0016_message_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hiddenconversation',
+            index=models.Index(fields=['user', 'room'], name='chat_hidden_user_room_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'timestamp', 'id'], name='chat_msg_room_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='privatemessage',
+            index=models.Index(fields=['sender', 'receiver', 'timestamp'], name='chat_pm_sender_recv_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='privatemessage',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['receiver', 'sender'], name='chat_pm_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(django.db.models.functions.comparison.Collate('name', 'NOCASE'), name='chat_room_name_ci_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.7 on 2025-11-30 17:40
+
+import django.utils.timezone
+from django.db import migrations, models
+
+# Triggers de comptage des références (SQLite uniquement). Voir chat/blobs.py:
+# ensure_triggers() les recrée si une migration ultérieure reconstruit une table.
+REFERENCES = {
+    'chat_message': ('image', 'file'),
+    'chat_privatemessage': ('image', 'file'),
+    'chat_userprofile': ('avatar',),
+}
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table, columns in REFERENCES.items():
+        new = ', '.join(f'new.{column}' for column in columns)
+        old = ', '.join(f'old.{column}' for column in columns)
+        has_new = ' OR '.join(f"new.{column} != ''" for column in columns)
+        has_old = ' OR '.join(f"old.{column} != ''" for column in columns)
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_blob_ai AFTER INSERT ON {table} "
+            f"WHEN {has_new} BEGIN "
+            f"UPDATE chat_blob SET ref_count = ref_count + 1 WHERE name IN ({new}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_blob_ad AFTER DELETE ON {table} "
+            f"WHEN {has_old} BEGIN "
+            f"UPDATE chat_blob SET ref_count = ref_count - 1 WHERE name IN ({old}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_blob_au AFTER UPDATE OF {', '.join(columns)} ON {table} "
+            f"WHEN {has_old} OR {has_new} BEGIN "
+            f"UPDATE chat_blob SET ref_count = ref_count - 1 WHERE name IN ({old}); "
+            f"UPDATE chat_blob SET ref_count = ref_count + 1 WHERE name IN ({new}); END"
+        )
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for table in REFERENCES:
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_blob_{suffix}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0019_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('sha256', models.CharField(max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('ref_count__lte', 0)), fields=['last_used_at'], name='chat_blob_orphan_idx')],
+            },
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2025-12-01 10:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0020_blob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('image__gt', '')), fields=['image'], name='chat_msg_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('file__gt', '')), fields=['file'], name='chat_msg_file_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='privatemessage',
+            index=models.Index(condition=models.Q(('image__gt', '')), fields=['image'], name='chat_pm_image_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='privatemessage',
+            index=models.Index(condition=models.Q(('file__gt', '')), fields=['file'], name='chat_pm_file_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(condition=models.Q(('avatar__gt', '')), fields=['avatar'], name='chat_profile_avatar_idx'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 5.2.7 on 2025-12-01 10:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Fichiers des messages archivés: comptés comme références aux blobs, avec
+# les mêmes triggers que les tables de messages (voir 0020_blob, chat/blobs.py)
+TABLE = 'chat_archivedfile'
+
+
+def create_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {TABLE}_blob_ai AFTER INSERT ON {TABLE} "
+        f"WHEN new.name != '' BEGIN "
+        f"UPDATE chat_blob SET ref_count = ref_count + 1 WHERE name IN (new.name); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {TABLE}_blob_ad AFTER DELETE ON {TABLE} "
+        f"WHEN old.name != '' BEGIN "
+        f"UPDATE chat_blob SET ref_count = ref_count - 1 WHERE name IN (old.name); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER IF NOT EXISTS {TABLE}_blob_au AFTER UPDATE OF name ON {TABLE} "
+        f"WHEN old.name != '' OR new.name != '' BEGIN "
+        f"UPDATE chat_blob SET ref_count = ref_count - 1 WHERE name IN (old.name); "
+        f"UPDATE chat_blob SET ref_count = ref_count + 1 WHERE name IN (new.name); END"
+    )
+
+
+def drop_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {TABLE}_blob_{suffix}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0021_media_reference_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='retention_days',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchiveSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pair_key', models.CharField(blank=True, max_length=41)),
+                ('path', models.CharField(max_length=255)),
+                ('offset', models.PositiveBigIntegerField()),
+                ('length', models.PositiveBigIntegerField()),
+                ('count', models.PositiveIntegerField()),
+                ('first_ts', models.DateTimeField()),
+                ('first_id', models.BigIntegerField()),
+                ('last_ts', models.DateTimeField()),
+                ('last_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archive_segments', to='chat.room')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('segment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='files', to='chat.archivesegment')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivesegment',
+            index=models.Index(fields=['room', 'first_ts', 'first_id'], name='chat_archive_room_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivesegment',
+            index=models.Index(fields=['pair_key', 'first_ts', 'first_id'], name='chat_archive_pair_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedfile',
+            index=models.Index(fields=['name'], name='chat_archivedfile_name_idx'),
+        ),
+        migrations.RunPython(create_triggers, drop_triggers),
+    ]
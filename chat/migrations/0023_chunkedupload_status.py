@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0022_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'En cours'), ('finalizing', 'Finalisation')], default='uploading', max_length=10),
+        ),
+    ]
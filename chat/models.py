@@ -1,4 +1,9 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Collate, Greatest
+from django.db.models.signals import post_save
 from django.contrib.auth.models import User
 from django.utils import timezone
 
@@ -14,55 +19,347 @@ class Room(models.Model):
     # 🔥 Nouveau champ
     is_private = models.BooleanField(default=False)  # False = Public, True = Privé
 
+    # Dernier numéro de séquence attribué à un message du salon (croissant)
+    last_seq = models.PositiveBigIntegerField(default=0)
+    # Version de la liste des membres, incrémentée à chaque ajout / retrait
+    members_version = models.PositiveIntegerField(default=0)
+    # Rétention en base, en jours (voir archive.py): None = ROOM_RETENTION_DAYS, 0 = jamais archivé
+    retention_days = models.PositiveIntegerField(null=True, blank=True)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # name__iexact (LIKE sans casse sous SQLite): index NOCASE
+            models.Index(Collate('name', 'NOCASE'), name='chat_room_name_ci_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({'Privé' if self.is_private else 'Public'})"
 
     def get_online_count(self):
-        return self.members.count()
+        """Utilisateurs ayant une connexion ouverte sur le salon (voir presence.py)"""
+        from .presence import presence
+        return presence.online_count(self.id)
 
     def unread_count_for_user(self, user):
-        return self.messages.exclude(
-            reads__user=user
-        ).exclude(
-            user=user
-        ).count()
+        """
+        Non lus = séquence du salon - séquence lue par l'utilisateur (une seule requête)
+        """
+        read_seq = RoomReadState.objects.filter(
+            user=user, room=self
+        ).values_list('last_read_seq', flat=True).first() or 0
+        return max(self.last_seq - read_seq, 0)
+
 
+class ImageVariantsMixin:
+    """
+    Miniatures d'un message avec image (champs image_width, image_height,
+    image_variants remplis en tâche de fond par thumbnails.py).
+    image_variants: {'320': {'webp': nom, 'jpeg': nom}, '960': {...}}
+    """
 
-class Message(models.Model):
+    def _variant_url(self, size, fmt):
+        from django.core.files.storage import default_storage
+        return default_storage.url(self.image_variants[size][fmt])
+
+    @property
+    def thumbnail_url(self):
+        """Plus petite miniature JPEG (lue partout), sinon l'original."""
+        if not self.image:
+            return ''
+        if not self.image_variants:
+            return self.image.url
+        return self._variant_url(min(self.image_variants, key=int), 'jpeg')
+
+    @property
+    def thumbnail_srcset(self):
+        """srcset WebP ("url 320w, url 960w"), vide tant que rien n'est généré."""
+        return ', '.join(
+            f'{self._variant_url(size, "webp")} {size}w'
+            for size in sorted(self.image_variants or {}, key=int)
+        )
+
+    def image_payload(self):
+        """Champs image des trames WebSocket et des API d'historique."""
+        return {
+            'image_url': self.image.url if self.image else '',
+            'thumbnail_url': self.thumbnail_url,
+            'thumbnail_srcset': self.thumbnail_srcset,
+            'image_width': self.image_width,
+            'image_height': self.image_height,
+        }
+
+
+class Message(ImageVariantsMixin, models.Model):
     """Message dans un salon de discussion"""
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='messages')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='messages')
     content = models.TextField()
     image = models.ImageField(upload_to='chat_images/', blank=True, null=True)
     file = models.FileField(upload_to='chat_files/', blank=True, null=True)
+    # Dimensions et miniatures de l'image (voir thumbnails.py). Colonnes
+    # nullables: ajoutées par ALTER TABLE, sans reconstruire la table
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_variants = models.JSONField(null=True, blank=True, editable=False)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Numéro de séquence dans le salon (1, 2, 3, ...), attribué à la création
+    seq = models.PositiveBigIntegerField(default=0, editable=False)
     
     class Meta:
         ordering = ['timestamp']
+        unique_together = ('room', 'seq')
+        indexes = [
+            # Historique paginé (timestamp, id) et dernier message par salon
+            models.Index(fields=['room', 'timestamp', 'id'], name='chat_msg_room_ts_idx'),
+            # Droits d'accès aux fichiers (media.py): index partiels, seulement les messages avec fichier
+            models.Index(fields=['image'], condition=Q(image__gt=''), name='chat_msg_image_idx'),
+            models.Index(fields=['file'], condition=Q(file__gt=''), name='chat_msg_file_idx'),
+        ]
     
     def __str__(self):
         return f'{self.user.username}: {self.content[:50]}'
 
+    def save(self, *args, **kwargs):
+        """
+        À la création: incrémente Room.last_seq et récupère la nouvelle valeur
+        dans la même transaction, puis avance le marqueur de lecture de l'auteur
+        s'il avait tout lu: écrire ne marque pas lus les messages précédents.
+        """
+        if not (self._state.adding and not self.seq):
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            Room.objects.filter(pk=self.room_id).update(last_seq=F('last_seq') + 1)
+            self.seq = Room.objects.values_list('last_seq', flat=True).get(pk=self.room_id)
+            super().save(*args, **kwargs)
+            RoomReadState.mark_own_message(self.user_id, self.room_id, self.seq)
 
-class PrivateMessage(models.Model):
+    @classmethod
+    def bulk_insert(cls, messages):
+        """
+        Insère un lot de nouveaux messages en un INSERT (écriture différée,
+        voir batching.py). bulk_create ne passe ni par save() ni par les
+        signaux: seq / last_seq, le marqueur de lecture des auteurs et
+        post_save sont reproduits ici. À appeler dans une transaction.
+        """
+        by_room = {}
+        for message in messages:
+            by_room.setdefault(message.room_id, []).append(message)
+        for room_id, room_messages in by_room.items():
+            count = len(room_messages)
+            Room.objects.filter(pk=room_id).update(last_seq=F('last_seq') + count)
+            last_seq = Room.objects.values_list('last_seq', flat=True).get(pk=room_id)
+            for offset, message in enumerate(room_messages):
+                message.seq = last_seq - count + 1 + offset
+
+        cls.objects.bulk_create(messages)
+
+        # Comme save(): le marqueur d'un auteur ne suit ses messages que s'il
+        # avait tout lu, et s'arrête au premier message d'un autre
+        for room_id, room_messages in by_room.items():
+            read_seqs = dict(RoomReadState.objects.filter(
+                room_id=room_id, user_id__in={message.user_id for message in room_messages}
+            ).values_list('user_id', 'last_read_seq'))
+            advanced = set()
+            for message in room_messages:
+                if read_seqs.get(message.user_id, 0) >= message.seq - 1:
+                    read_seqs[message.user_id] = message.seq
+                    advanced.add(message.user_id)
+            for user_id in advanced:
+                RoomReadState.mark_read(user_id, room_id, read_seqs[user_id])
+
+        for message in messages:
+            post_save.send(sender=cls, instance=message, created=True,
+                           update_fields=None, raw=False, using=cls.objects.db)
+        return messages
+
+
+class PrivateMessage(ImageVariantsMixin, models.Model):
     """Message privé entre deux utilisateurs"""
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     receiver = models.ForeignKey(User, on_delete=models.CASCADE, related_name='received_messages')
     content = models.TextField()
     image = models.ImageField(upload_to='private_images/', blank=True, null=True)
     file = models.FileField(upload_to='private_files/', blank=True, null=True)
+    # Dimensions et miniatures de l'image (voir thumbnails.py). Colonnes
+    # nullables: ajoutées par ALTER TABLE, sans reconstruire la table
+    image_width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    image_variants = models.JSONField(null=True, blank=True, editable=False)
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
+    # Clé de la conversation "petit_id:grand_id", identique dans les deux sens:
+    # permet de lire une conversation avec un seul parcours d'index
+    pair_key = models.CharField(max_length=41, default='', editable=False)
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['pair_key', 'timestamp', 'id'], name='chat_pm_pair_ts_idx'),
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='chat_pm_sender_recv_ts_idx'),
+            # Non lus par destinataire: index partiel, ne contient que les messages non lus
+            models.Index(fields=['receiver', 'sender'], condition=Q(is_read=False), name='chat_pm_unread_idx'),
+            models.Index(fields=['image'], condition=Q(image__gt=''), name='chat_pm_image_idx'),
+            models.Index(fields=['file'], condition=Q(file__gt=''), name='chat_pm_file_idx'),
+        ]
     
     def __str__(self):
         return f'{self.sender.username} to {self.receiver.username}: {self.content[:50]}'
 
+    @staticmethod
+    def make_pair_key(user_a, user_b):
+        """Accepte des instances ou des ids."""
+        a = getattr(user_a, 'pk', user_a)
+        b = getattr(user_b, 'pk', user_b)
+        return f'{min(a, b)}:{max(a, b)}'
+
+    def save(self, *args, **kwargs):
+        if not self.pair_key:
+            self.pair_key = self.make_pair_key(self.sender_id, self.receiver_id)
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
+
+        # Création: message + mise à jour de la conversation dans la même transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            Conversation.record_message(self)
+
+    @classmethod
+    def bulk_insert(cls, messages):
+        """
+        Insère un lot de nouveaux messages en un INSERT (écriture différée,
+        voir batching.py), en reproduisant save() et post_save: pair_key et
+        mise à jour des conversations. À appeler dans une transaction.
+        """
+        for message in messages:
+            if not message.pair_key:
+                message.pair_key = cls.make_pair_key(message.sender_id, message.receiver_id)
+        cls.objects.bulk_create(messages)
+        Conversation.record_messages(messages)
+        for message in messages:
+            post_save.send(sender=cls, instance=message, created=True,
+                           update_fields=None, raw=False, using=cls.objects.db)
+        return messages
+
+
+class Conversation(models.Model):
+    """
+    Conversation privée entre deux utilisateurs (user1.id < user2.id), avec
+    le dernier message et les non lus de chaque participant dénormalisés:
+    la boîte de réception se lit en une requête triée par last_message_at.
+    """
+    pair_key = models.CharField(max_length=41, unique=True)
+    user1 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations_as_user1')
+    user2 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversations_as_user2')
+    last_message = models.ForeignKey(
+        PrivateMessage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    user1_unread = models.PositiveIntegerField(default=0)
+    user2_unread = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-last_message_at']
+        indexes = [
+            models.Index(fields=['user1', 'last_message_at'], name='chat_conv_user1_last_idx'),
+            models.Index(fields=['user2', 'last_message_at'], name='chat_conv_user2_last_idx'),
+        ]
+
+    def __str__(self):
+        return f'Conversation {self.pair_key}'
+
+    @classmethod
+    def for_pair(cls, user_a, user_b):
+        """Renvoie (conversation, created). Accepte des instances ou des ids."""
+        a = getattr(user_a, 'pk', user_a)
+        b = getattr(user_b, 'pk', user_b)
+        return cls.objects.get_or_create(
+            pair_key=PrivateMessage.make_pair_key(a, b),
+            defaults={'user1_id': min(a, b), 'user2_id': max(a, b)}
+        )
+
+    @classmethod
+    def inbox(cls, user):
+        """Conversations de user, la plus récente d'abord (une requête)."""
+        return cls.objects.filter(
+            Q(user1=user) | Q(user2=user), last_message_at__isnull=False
+        ).select_related('user1__profile', 'user2__profile').order_by('-last_message_at')
+
+    @staticmethod
+    def unread_field(user1_id, user_id):
+        """Nom de la colonne de non lus du participant user_id."""
+        return 'user1_unread' if user_id == user1_id else 'user2_unread'
+
+    def peer_of(self, user):
+        return self.user2 if getattr(user, 'pk', user) == self.user1_id else self.user1
+
+    def unread_for(self, user):
+        return getattr(self, self.unread_field(self.user1_id, getattr(user, 'pk', user)))
+
+    @classmethod
+    def record_message(cls, message):
+        """Nouveau message: dernier message + 1 non lu pour le destinataire."""
+        conversation, created = cls.for_pair(message.sender_id, message.receiver_id)
+        field = cls.unread_field(conversation.user1_id, message.receiver_id)
+        cls.objects.filter(pk=conversation.pk).update(**{
+            'last_message': message,
+            'last_message_at': message.timestamp,
+            field: F(field) + 1,
+        })
+        return conversation, created
+
+    @classmethod
+    def record_messages(cls, messages):
+        """
+        Lot de nouveaux messages (ordre chronologique): un UPDATE par
+        conversation au lieu d'un par message.
+        """
+        by_pair = {}
+        for message in messages:
+            by_pair.setdefault(message.pair_key, []).append(message)
+        for pair_messages in by_pair.values():
+            last = pair_messages[-1]
+            conversation, created = cls.for_pair(last.sender_id, last.receiver_id)
+            increments = {}
+            for message in pair_messages:
+                field = cls.unread_field(conversation.user1_id, message.receiver_id)
+                increments[field] = increments.get(field, 0) + 1
+            cls.objects.filter(pk=conversation.pk).update(
+                last_message=last,
+                last_message_at=last.timestamp,
+                **{field: F(field) + count for field, count in increments.items()}
+            )
+
+    @classmethod
+    def mark_read(cls, reader, peer, count):
+        """reader a lu `count` messages de peer."""
+        if count <= 0:
+            return
+        reader_id = getattr(reader, 'pk', reader)
+        peer_id = getattr(peer, 'pk', peer)
+        field = cls.unread_field(min(reader_id, peer_id), reader_id)
+        cls.objects.filter(pair_key=PrivateMessage.make_pair_key(reader_id, peer_id)).update(**{
+            field: Greatest(F(field) - count, Value(0))
+        })
+
+    @classmethod
+    def message_deleted(cls, message):
+        """Après suppression d'un message: corrige non lus et dernier message."""
+        conversation = cls.objects.filter(pair_key=message.pair_key).first()
+        if not conversation:
+            return
+        if not message.is_read:
+            cls.mark_read(message.receiver_id, message.sender_id, 1)
+        if conversation.last_message_id in (None, message.pk):
+            last = PrivateMessage.objects.filter(
+                pair_key=message.pair_key
+            ).exclude(pk=message.pk).order_by('-timestamp', '-id').first()
+            cls.objects.filter(pk=conversation.pk).update(
+                last_message=last,
+                last_message_at=last.timestamp if last else None
+            )
+
 
 class UserProfile(models.Model):
     """Profil utilisateur étendu"""
@@ -73,6 +370,11 @@ class UserProfile(models.Model):
     phone = models.CharField(blank=True, max_length=100)
     is_online = models.BooleanField(default=False)
     last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['avatar'], condition=Q(avatar__gt=''), name='chat_profile_avatar_idx'),
+        ]
     
     def __str__(self):
         return f'{self.user.username} Profile'
@@ -87,30 +389,16 @@ class UserProfile(models.Model):
             is_read=False
         ).count()
 
-    def is_blocking(self, other_user):
-        """Vérifie si self.user bloque other_user"""
-        from django.apps import apps
-        Block = apps.get_model('chat', 'Block')
-        return Block.objects.filter(blocker=self.user, blocked=other_user).exists()
-
-    def is_blocked_by(self, other_user):
-        """Vérifie si self.user est bloqué par other_user"""
-        from django.apps import apps
-        Block = apps.get_model('chat', 'Block')
-        return Block.objects.filter(blocker=other_user, blocked=self.user).exists()
-
-    def has_reported(self, other_user):
-        """Vérifie si self.user a signalé other_user"""
-        from django.apps import apps
-        Report = apps.get_model('chat', 'Report')
-        return Report.objects.filter(reporter=self.user, reported_user=other_user).exists()
-
-    def should_hide_conversation(self, other_user):
+    def relationships(self, peers):
         """
-        Option 2: Cache la conversation si l'utilisateur a SIGNALÉ + BLOQUÉ
+        Blocages / signalements avec plusieurs interlocuteurs en deux requêtes.
+        Renvoie {peer_id: RelationshipState}.
         """
-        return self.is_blocking(other_user) and self.has_reported(other_user)
+        return RelationshipState.load(self.user_id, peers)
 
+    def relationship_with(self, other_user):
+        """État complet avec un interlocuteur (deux requêtes au lieu d'une par indicateur)"""
+        return RelationshipState.load_one(self.user_id, other_user)
 
     def is_blocking(self, other_user):
         """Vérifie si self.user bloque other_user"""
@@ -128,7 +416,58 @@ class UserProfile(models.Model):
         """
         Option 2: Cache la conversation si l'utilisateur a SIGNALÉ + BLOQUÉ
         """
-        return self.is_blocking(other_user) and self.has_reported(other_user)
+        return self.relationship_with(other_user).should_hide_conversation
+
+
+class RelationshipState:
+    """
+    Blocages (dans les deux sens) et signalement entre un utilisateur et un
+    interlocuteur. Chargé en lot par load(): deux requêtes quel que soit le
+    nombre d'interlocuteurs. Utilisable tel quel dans les templates.
+    """
+    __slots__ = ('is_blocking', 'is_blocked_by', 'has_reported')
+
+    def __init__(self, is_blocking=False, is_blocked_by=False, has_reported=False):
+        self.is_blocking = is_blocking
+        self.is_blocked_by = is_blocked_by
+        self.has_reported = has_reported
+
+    @property
+    def should_hide_conversation(self):
+        # Option 2: conversation masquée si l'utilisateur a SIGNALÉ + BLOQUÉ
+        return self.is_blocking and self.has_reported
+
+    @property
+    def can_send_messages(self):
+        return not (self.is_blocking or self.is_blocked_by)
+
+    @classmethod
+    def load(cls, user, peers):
+        """user et peers: instances ou ids. Renvoie {peer_id: RelationshipState}."""
+        user_id = getattr(user, 'pk', user)
+        states = {getattr(peer, 'pk', peer): cls() for peer in peers}
+        if not states:
+            return states
+        peer_ids = list(states)
+
+        for blocker_id, blocked_id in Block.objects.filter(
+            Q(blocker_id=user_id, blocked_id__in=peer_ids) |
+            Q(blocker_id__in=peer_ids, blocked_id=user_id)
+        ).values_list('blocker_id', 'blocked_id'):
+            if blocker_id == user_id:
+                states[blocked_id].is_blocking = True
+            else:
+                states[blocker_id].is_blocked_by = True
+
+        for peer_id in Report.objects.filter(
+            reporter_id=user_id, reported_user_id__in=peer_ids
+        ).values_list('reported_user_id', flat=True):
+            states[peer_id].has_reported = True
+        return states
+
+    @classmethod
+    def load_one(cls, user, peer):
+        return cls.load(user, [peer])[getattr(peer, 'pk', peer)]
 
 
 class Block(models.Model):
@@ -194,15 +533,183 @@ class Report(models.Model):
     def __str__(self):
         return f'{self.reporter.username} signale {self.reported_user.username} - {self.get_reason_display()}'
 
-class MessageRead(models.Model):
-    message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name='reads')
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    read_at = models.DateTimeField(auto_now_add=True)
+class RoomReadState(models.Model):
+    """
+    Marqueur de lecture par (utilisateur, salon): tous les messages dont
+    seq <= last_read_seq sont considérés comme lus.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='room_reads')
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='reads')
+    last_read_seq = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
-        unique_together = ('message', 'user')
+        unique_together = ('user', 'room')
+
+    def __str__(self):
+        return f'{self.user_id} a lu {self.room_id} jusqu\'à {self.last_read_seq}'
+
+    @classmethod
+    def mark_read(cls, user, room, seq=None):
+        """
+        Avance le marqueur jusqu'à `seq` (par défaut: le dernier message du salon).
+        Un seul UPDATE quand la ligne existe; le marqueur ne recule jamais.
+        Accepte des instances ou des ids.
+        """
+        user_id = getattr(user, 'pk', user)
+        room_id = getattr(room, 'pk', room)
+        if seq is None:
+            seq = Room.objects.values_list('last_seq', flat=True).get(pk=room_id)
+
+        updated = cls.objects.filter(user_id=user_id, room_id=room_id).update(
+            last_read_seq=Greatest('last_read_seq', Value(seq)),
+            updated_at=timezone.now()
+        )
+        if not updated:
+            state, created = cls.objects.get_or_create(
+                user_id=user_id, room_id=room_id,
+                defaults={'last_read_seq': seq}
+            )
+            if not created and state.last_read_seq < seq:
+                cls.objects.filter(pk=state.pk).update(last_read_seq=Greatest('last_read_seq', Value(seq)))
+        return seq
+
+    @classmethod
+    def mark_own_message(cls, user, room, seq):
+        """
+        Message `seq` envoyé par user: le marqueur n'avance que si user avait
+        lu jusqu'à seq - 1. Renvoie True si le marqueur a avancé.
+
+        Compromis: un auteur en retard voit son propre message compté dans son
+        badge non lu (le marqueur est un simple seq, sans trace des auteurs au-delà).
+        Le compteur se corrige dès qu'il lit le salon.
+        """
+        user_id = getattr(user, 'pk', user)
+        room_id = getattr(room, 'pk', room)
+        updated = cls.objects.filter(
+            user_id=user_id, room_id=room_id, last_read_seq__gte=seq - 1
+        ).update(last_read_seq=Greatest('last_read_seq', Value(seq)), updated_at=timezone.now())
+        if updated:
+            return True
+        if seq == 1:
+            # Premier message du salon: rien d'autre à lire
+            cls.mark_read(user_id, room_id, seq)
+            return True
+        return False
 
 class HiddenConversation(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
-    hidden_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
\ No newline at end of file
+    hidden_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'room'], name='chat_hidden_user_room_idx'),
+        ]
+
+
+class ChunkedUpload(models.Model):
+    """
+    Envoi de fichier par morceaux en cours (voir uploads.py). Le contenu reçu
+    est dans UPLOAD_TEMP_DIR/<id>.part; received est l'offset confirmé, d'où
+    le client reprend après une coupure. Supprimé une fois le message créé.
+    """
+    UPLOADING = 'uploading'
+    # Réservé par une requête de finalisation: plus de morceaux, pas de seconde finalisation
+    FINALIZING = 'finalizing'
+    STATUS_CHOICES = [(UPLOADING, 'En cours'), (FINALIZING, 'Finalisation')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='uploads')
+    # Destination: un salon ou un destinataire de message privé
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    receiver = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+    content = models.TextField(blank=True)
+    # SHA-256 annoncé par le client (optionnel), vérifié à la finalisation
+    expected_sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=UPLOADING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'{self.user.username}: {self.filename} ({self.received}/{self.size})'
+
+    @property
+    def is_complete(self):
+        return self.received >= self.size
+
+
+class Blob(models.Model):
+    """
+    Fichier stocké par contenu (storage.py): images, fichiers joints et
+    avatars de même contenu partagent un seul fichier blobs/<aa>/<sha256>.<ext>.
+    ref_count est tenu à jour par des triggers SQL sur les tables qui
+    référencent les fichiers (voir blobs.py); un blob sans référence est
+    supprimé par `manage.py collect_blobs` après un délai de grâce.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    sha256 = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Dernier enregistrement du contenu (nouvel envoi ou doublon détecté)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # Candidats au ramasse-miettes: index partiel, seulement les blobs orphelins
+            models.Index(fields=['last_used_at'], name='chat_blob_orphan_idx', condition=Q(ref_count__lte=0)),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.ref_count} réf.)'
+
+
+
+class ArchiveSegment(models.Model):
+    """
+    Lot de messages archivés (voir archive.py): membre gzip NDJSON à la
+    position `offset` du fichier ARCHIVE_ROOT/path. Un salon (room) ou une
+    conversation privée (pair_key); premier et dernier (timestamp, id) pour
+    trouver les segments d'une page d'historique sans les ouvrir.
+    """
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, null=True, blank=True, related_name='archive_segments')
+    pair_key = models.CharField(max_length=41, blank=True)
+    path = models.CharField(max_length=255)
+    offset = models.PositiveBigIntegerField()
+    length = models.PositiveBigIntegerField()
+    count = models.PositiveIntegerField()
+    first_ts = models.DateTimeField()
+    first_id = models.BigIntegerField()
+    last_ts = models.DateTimeField()
+    last_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', 'first_ts', 'first_id'], name='chat_archive_room_idx'),
+            models.Index(fields=['pair_key', 'first_ts', 'first_id'], name='chat_archive_pair_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.path}@{self.offset} ({self.count} messages)'
+
+
+class ArchivedFile(models.Model):
+    """
+    Fichier (image, pièce jointe) d'un message archivé: compté comme une
+    référence au blob (triggers de blobs.py) et vérifié par media.py.
+    """
+    segment = models.ForeignKey(ArchiveSegment, on_delete=models.CASCADE, related_name='files')
+    name = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name'], name='chat_archivedfile_name_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,240 @@
+"""
+Notifications temps réel par utilisateur (consommées par NotificationConsumer).
+
+Groupes:
+- chat_<salon>: connexions ChatConsumer d'un salon (deltas de la liste des membres)
+- private_<id>_<id>: connexions PrivateChatConsumer d'une conversation (blocage)
+- notify_user_<id>: événements propres à un utilisateur (messages privés,
+  lecture, changement d'appartenance à un salon)
+- notify_room_<id>: un seul group_send par message de salon; chaque connexion
+  calcule ensuite son propre compteur de non lus en mémoire (voir unread.py)
+
+Les fonctions notify_* sont synchrones: appelées depuis les signaux, les vues
+ou un database_sync_to_async.
+
+Les événements diffusés à un groupe portent leur trame client déjà encodée
+(codec.framed): une sérialisation par message, quel que soit le nombre de
+connexions. Les *_payload construisent ces trames, pour les consumers aussi.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.utils.text import slugify
+
+from . import codec
+from .models import PrivateMessage, Conversation
+
+PREVIEW_LENGTH = 80
+
+
+def user_group(user_id):
+    return f'notify_user_{user_id}'
+
+
+def room_group(room_id):
+    return f'notify_room_{room_id}'
+
+
+def room_chat_group(room_name):
+    """Groupe des connexions ChatConsumer d'un salon"""
+    return f'chat_{slugify(room_name)}'
+
+
+def private_chat_group(user_id, other_id):
+    """Groupe des connexions PrivateChatConsumer d'une conversation (ids triés)"""
+    low, high = sorted((user_id, other_id))
+    return f'private_{low}_{high}'
+
+
+def _group_send(group, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    async_to_sync(channel_layer.group_send)(group, event)
+
+
+def _preview(content):
+    content = content or ''
+    if len(content) > PREVIEW_LENGTH:
+        return content[:PREVIEW_LENGTH - 1] + '…'
+    return content
+
+
+def notify_room_message(message):
+    """
+    Nouveau message de salon: aperçu + incrément des non lus des membres.
+    Seuls compteur et delta dépendent de la connexion: le reste de la trame
+    (nom du salon, aperçu) est encodé ici, une fois (voir codec.splice_frame).
+    """
+    _group_send(room_group(message.room_id), {
+        'type': 'room_notification',
+        'room_id': message.room_id,
+        'seq': message.seq,
+        'sender_id': message.user_id,
+        'tail': codec.encode_tail({
+            'type': 'room_unread',
+            'room_name': message.room.name,
+            'last_message': {
+                'id': message.id,
+                'username': message.user.username,
+                'preview': _preview(message.content),
+                'timestamp': message.timestamp.strftime("%H:%M"),
+            },
+        }),
+    })
+
+
+def _file_urls(message):
+    return {'file_url': message.file.url if message.file else '', **message.image_payload()}
+
+
+def room_message_payload(message):
+    """Trame 'message' d'un salon (ChatConsumer et envois de fichiers), numérotée par seq (streams.py)."""
+    return {
+        'type': 'message',
+        'id': message.id,
+        'seq': message.seq,
+        'username': message.user.username,
+        'message': message.content,
+        'timestamp': message.timestamp.strftime("%H:%M"),
+        **_file_urls(message),
+    }
+
+
+def private_message_payload(message):
+    """Trame 'message' d'une conversation privée."""
+    return {
+        'type': 'message',
+        'id': message.id,
+        'sender': message.sender.username,
+        'message': message.content,
+        'timestamp': message.timestamp.strftime("%d/%m %H:%M"),
+        'is_read': message.is_read,
+        **_file_urls(message),
+    }
+
+
+def room_message_events(message):
+    """chat_message puis unread_update, dans l'ordre de diffusion."""
+    return [
+        codec.framed(
+            {'type': 'chat_message', 'room_id': message.room_id, 'seq': message.seq, 'id': message.id},
+            room_message_payload(message),
+        ),
+        {
+            'type': 'unread_update',
+            'room_id': message.room_id,
+            'seq': message.seq,
+            'sender_id': message.user_id,
+        },
+    ]
+
+
+def broadcast_room_message(message):
+    """
+    Message créé hors du ChatConsumer (envoi de fichier): même diffusion que
+    l'action 'message' (chat_message puis unread_update) sur le groupe du salon.
+    """
+    group = room_chat_group(message.room.name)
+    for event in room_message_events(message):
+        _group_send(group, event)
+
+
+def broadcast_private_message(message):
+    """Message privé créé hors du PrivateChatConsumer (envoi de fichier)."""
+    _group_send(
+        private_chat_group(message.sender_id, message.receiver_id),
+        codec.framed({'type': 'private_message'}, private_message_payload(message)),
+    )
+
+
+def broadcast_image_ready(message):
+    """Miniatures générées (thumbnails.py): les clients remplacent l'original affiché."""
+    if isinstance(message, PrivateMessage):
+        group = private_chat_group(message.sender_id, message.receiver_id)
+    else:
+        group = room_chat_group(message.room.name)
+    _group_send(group, codec.framed(
+        {'type': 'image_ready'}, {'type': 'image_ready', 'id': message.id, **message.image_payload()}
+    ))
+
+
+def notify_room_read(user_id, room_id, seq):
+    """user_id a lu le salon jusqu'à seq (remet son badge à jour sur ses autres onglets)."""
+    _group_send(user_group(user_id), {
+        'type': 'room_read',
+        'room_id': room_id,
+        'seq': seq,
+    })
+
+
+def notify_private_message(message):
+    """
+    Nouveau message privé: le destinataire reçoit son compteur pour cette
+    conversation (+ new_conversation si c'est le premier message), l'expéditeur
+    reçoit seulement l'aperçu pour ses autres onglets.
+    """
+    is_new = not PrivateMessage.objects.filter(
+        pair_key=message.pair_key
+    ).exclude(pk=message.pk).exists()
+    conversation = Conversation.objects.filter(pair_key=message.pair_key).first()
+    unread_count = conversation.unread_for(message.receiver_id) if conversation else 1
+    last_message = {
+        'id': message.id,
+        'sender': message.sender.username,
+        'preview': _preview(message.content),
+        'timestamp': message.timestamp.strftime("%d/%m %H:%M"),
+    }
+
+    _group_send(user_group(message.receiver_id), {
+        'type': 'private_notification',
+        'peer_id': message.sender_id,
+        'peer_username': message.sender.username,
+        'unread_count': unread_count,
+        'delta': 1,
+        'new_conversation': is_new,
+        'last_message': last_message,
+    })
+    _group_send(user_group(message.sender_id), {
+        'type': 'private_notification',
+        'peer_id': message.receiver_id,
+        'peer_username': message.receiver.username,
+        'unread_count': None,
+        'delta': 0,
+        'new_conversation': is_new,
+        'last_message': last_message,
+    })
+
+
+def notify_private_read(user_id, peer_id, unread_count):
+    """user_id a lu (une partie de) la conversation avec peer_id."""
+    _group_send(user_group(user_id), {
+        'type': 'private_read',
+        'peer_id': peer_id,
+        'unread_count': unread_count,
+    })
+
+
+def notify_members_update(room_name, event):
+    """Delta versionné de la liste des membres (voir roster.py)."""
+    _group_send(room_chat_group(room_name), codec.framed(
+        {'type': 'members_update'}, {**event, 'message': event.get('message')}
+    ))
+
+
+def notify_block_changed(blocker_id, blocked_id, is_blocked):
+    """Blocage ajouté / retiré: les deux côtés mettent à jour leur cache sans requête."""
+    _group_send(private_chat_group(blocker_id, blocked_id), {
+        'type': 'block_state_changed',
+        'blocker_id': blocker_id,
+        'blocked_id': blocked_id,
+        'is_blocked': is_blocked,
+    })
+
+
+def notify_membership(user_id, room_id, joined):
+    """Ajout/retrait d'un salon: la connexion rejoint ou quitte notify_room_<id>."""
+    _group_send(user_group(user_id), {
+        'type': 'membership_update',
+        'room_id': room_id,
+        'joined': joined,
+    })
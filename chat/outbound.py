@@ -0,0 +1,222 @@
+"""
+File d'envoi bornée par connexion WebSocket (OutboundQueueMixin).
+
+Après accept(), send() ne fait qu'ajouter la trame à la file de la connexion;
+une tâche d'écriture par connexion la vide vers le client. Un client qui lit
+lentement n'immobilise plus les handlers du consumer, donc plus la lecture
+de son canal dans la couche de canaux.
+
+- Coalescence: send_latest(clé, trame) remplace la trame de même clé encore
+  en attente (compteurs de non lus, deltas de membres): seul le dernier état
+  part, à la place de la trame la plus récente.
+- Client lent: file pleine (OUTBOUND_QUEUE_SIZE trames) ou à moitié pleine
+  depuis OUTBOUND_SLOW_SECONDS. Selon OUTBOUND_SLOW_POLICY:
+  - 'snapshot': les trames en attente sont abandonnées et remplacées par une
+    trame 'resync' (outbound_snapshot() du consumer: état courant). Après
+    OUTBOUND_MAX_SNAPSHOTS sans que le client ait vidé sa file, on passe à
+    la déconnexion;
+  - 'disconnect': trame 'slow_consumer' avec un jeton de reprise signé, puis
+    fermeture (code 4008). Le client se reconnecte avec ?resume=<jeton> et
+    reçoit la trame 'resync' en premier.
+- Erreur de la tâche d'écriture: fermeture (code 1011), le client se
+  reconnecte et reprend (streams.py).
+
+Le send ASGI n'attend le client que si le serveur applique une contre-pression
+(uvicorn/websockets); sous Daphne les trames s'accumulent dans le tampon de
+Twisted et la file sert surtout à coalescer.
+"""
+import asyncio
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core import signing
+
+from . import codec
+from .metrics import WS_OUTBOUND_DROPPED, WS_OUTBOUND_QUEUED, WS_SLOW_CONSUMERS
+
+POLICY_SNAPSHOT = 'snapshot'
+POLICY_DISCONNECT = 'disconnect'
+SLOW_CONSUMER_CLOSE_CODE = 4008
+WRITER_ERROR_CLOSE_CODE = 1011  # erreur interne: le client se reconnecte
+RESUME_SALT = 'chat.outbound.resume'
+
+# Trame 'resync' construite par la tâche d'écriture au moment de l'envoi
+SNAPSHOT = object()
+SNAPSHOT_KEY = 'resync'
+
+
+# ---------- Jeton de reprise ----------
+def make_resume_token(user_id, path):
+    return signing.dumps({'u': user_id, 'p': path}, salt=RESUME_SALT)
+
+
+def check_resume_token(token, user_id, path):
+    """Jeton signé pour cet utilisateur et cette URL, de moins de OUTBOUND_RESUME_MAX_AGE secondes."""
+    try:
+        data = signing.loads(token, salt=RESUME_SALT, max_age=settings.OUTBOUND_RESUME_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return data.get('u') == user_id and data.get('p') == path
+
+
+# ---------- Consumers ----------
+class OutboundQueueMixin:
+    """
+    À placer avant AsyncWebsocketConsumer. Les consumers redéfinissent
+    outbound_snapshot() (état courant envoyé à la place des trames perdues).
+    Avant accept(), et pour bytes_data / close, send() reste direct.
+    """
+    _outbound_task = None
+    _outbound_closing = False
+
+    async def accept(self, subprotocol=None, headers=None):
+        await super().accept(subprotocol, headers)
+        if self._outbound_task is None:
+            # Entrées [clé, trame]; trame None = remplacée par une plus récente
+            self._outbound = deque()
+            self._outbound_keys = {}
+            self._outbound_live = 0
+            self._outbound_backlog_since = None
+            self._outbound_snapshots = 0
+            self._outbound_ready = asyncio.Event()
+            self._outbound_task = asyncio.ensure_future(self._outbound_writer())
+
+    async def websocket_disconnect(self, message):
+        if self._outbound_task is not None:
+            self._outbound_closing = True
+            self._outbound_task.cancel()
+            self._outbound_discard(None)
+        await super().websocket_disconnect(message)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if self._outbound_task is None or text_data is None or close:
+            await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+        else:
+            self.outbound_put(text_data)
+
+    async def send_latest(self, key, text_data):
+        """Comme send(), mais remplace la trame de même clé encore en attente."""
+        if self._outbound_task is None:
+            await self.send(text_data=text_data)
+        else:
+            self.outbound_put(text_data, key)
+
+    async def outbound_snapshot(self):
+        """État courant du client (dict), envoyé dans une trame 'resync'."""
+        return {'type': 'resync'}
+
+    def outbound_resume(self):
+        """À appeler après accept(): reconnexion après 'slow_consumer' (?resume=<jeton>)."""
+        params = parse_qs(self.scope.get('query_string', b'').decode())
+        token = params.get('resume', [''])[0]
+        if token and check_resume_token(token, self.user.id, self.scope['path']):
+            self.outbound_put(SNAPSHOT, SNAPSHOT_KEY)
+
+    # ---------- File ----------
+    def outbound_put(self, frame, key=None):
+        if self._outbound_closing:
+            return
+        consumer = type(self).__name__
+        if key is not None:
+            previous = self._outbound_keys.pop(key, None)
+            if previous is not None:
+                previous[1] = None
+                self._outbound_live -= 1
+                WS_OUTBOUND_QUEUED.dec(consumer)
+                WS_OUTBOUND_DROPPED.inc(consumer, 'coalesced')
+                if len(self._outbound) > 2 * self._outbound_live + 64:
+                    self._outbound = deque(entry for entry in self._outbound if entry[1] is not None)
+        if self.outbound_is_slow(time.monotonic()):
+            self.outbound_slow()
+            if self._outbound_closing:
+                WS_OUTBOUND_DROPPED.inc(consumer, POLICY_DISCONNECT)
+                return
+        entry = [key, frame]
+        self._outbound.append(entry)
+        if key is not None:
+            self._outbound_keys[key] = entry
+        self._outbound_live += 1
+        WS_OUTBOUND_QUEUED.inc(consumer)
+        self._outbound_ready.set()
+
+    def outbound_is_slow(self, now):
+        size = settings.OUTBOUND_QUEUE_SIZE
+        if self._outbound_live >= size:
+            return True
+        if self._outbound_live * 2 < size:
+            self._outbound_backlog_since = None
+            return False
+        if self._outbound_backlog_since is None:
+            self._outbound_backlog_since = now
+        return now - self._outbound_backlog_since >= settings.OUTBOUND_SLOW_SECONDS
+
+    def outbound_slow(self):
+        consumer = type(self).__name__
+        policy = settings.OUTBOUND_SLOW_POLICY
+        if policy == POLICY_SNAPSHOT and self._outbound_snapshots >= settings.OUTBOUND_MAX_SNAPSHOTS:
+            policy = POLICY_DISCONNECT
+        WS_SLOW_CONSUMERS.inc(consumer, policy)
+        self._outbound_discard(policy)
+        if policy == POLICY_SNAPSHOT:
+            self._outbound_snapshots += 1
+            self.outbound_put(SNAPSHOT, SNAPSHOT_KEY)
+        else:
+            self._outbound_closing = True
+            self._outbound_task.cancel()
+            self._outbound_task = asyncio.ensure_future(self._outbound_disconnect())
+
+    def _outbound_discard(self, reason):
+        dropped = self._outbound_live
+        self._outbound.clear()
+        self._outbound_keys.clear()
+        self._outbound_live = 0
+        self._outbound_backlog_since = None
+        if dropped:
+            WS_OUTBOUND_QUEUED.dec(type(self).__name__, amount=dropped)
+            if reason:
+                WS_OUTBOUND_DROPPED.inc(type(self).__name__, reason, amount=dropped)
+
+    # ---------- Tâches d'écriture ----------
+    async def _outbound_writer(self):
+        consumer = type(self).__name__
+        try:
+            while True:
+                if not self._outbound:
+                    # File vidée: le client a rattrapé son retard
+                    self._outbound_snapshots = 0
+                    self._outbound_ready.clear()
+                    await self._outbound_ready.wait()
+                    continue
+                key, frame = self._outbound.popleft()
+                if frame is None:
+                    continue
+                if key is not None:
+                    del self._outbound_keys[key]
+                self._outbound_live -= 1
+                WS_OUTBOUND_QUEUED.dec(consumer)
+                if frame is SNAPSHOT:
+                    frame = codec.dumps(await self.outbound_snapshot())
+                await super().send(text_data=frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Erreur file d'envoi ({consumer}): {e}")
+            # Sans tâche d'écriture, la connexion ne recevrait plus rien: on la ferme
+            self._outbound_closing = True
+            self._outbound_discard('error')
+            try:
+                await self.close(code=WRITER_ERROR_CLOSE_CODE)
+            except Exception as e:
+                print(f"Erreur fermeture ({consumer}): {e}")
+
+    async def _outbound_disconnect(self):
+        try:
+            await super().send(text_data=codec.dumps({
+                'type': 'slow_consumer',
+                'resume_token': make_resume_token(self.user.id, self.scope['path']),
+            }))
+            await self.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception as e:
+            print(f"Erreur fermeture client lent ({type(self).__name__}): {e}")
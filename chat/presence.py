@@ -0,0 +1,323 @@
+"""
+Présence des utilisateurs, alimentée par les consumers WebSocket.
+
+Chaque connexion s'enregistre à l'ouverture, envoie un heartbeat toutes les
+HEARTBEAT_SECONDS et expire après PRESENCE_TTL sans nouvelles (onglet tué,
+réseau coupé, close jamais reçu). Chaque processus suit ses connexions en
+mémoire.
+
+PRESENCE_STORE:
+- 'memory' (défaut avec CHANNEL_LAYER=memory): un seul processus, l'état
+  local est l'état global;
+- 'cache' (défaut sinon): chaque processus publie son état dans le cache
+  'presence' (Redis), sous une des PRESENCE_MAX_WORKERS entrées réservée par
+  add() et expirant après PRESENCE_TTL (processus tué: ses utilisateurs
+  disparaissent). Les lectures réunissent l'état local et celui des autres
+  processus; seul le processus de plus petite entrée (meneur) diffuse les
+  deltas et écrit is_online / last_seen.
+
+Une tâche de fond par processus:
+- toutes les BROADCAST_SECONDS, au plus un presence_update par salon modifié,
+  avec le delta coalescé (arrivées / départs depuis la dernière diffusion);
+- toutes les FLUSH_SECONDS, is_online / last_seen écrits en base en deux
+  UPDATE groupés au lieu d'une écriture par événement.
+"""
+import asyncio
+import os
+import socket
+import threading
+import time
+import uuid
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from . import codec
+from .models import UserProfile
+
+HEARTBEAT_SECONDS = 25
+PRESENCE_TTL = 75
+BROADCAST_SECONDS = 2
+FLUSH_SECONDS = 15
+SLOT_PREFIX = 'presence:worker:'
+
+
+class PresenceConnection:
+    __slots__ = ('user_id', 'room_id', 'expires_at')
+
+    def __init__(self, user_id, room_id, expires_at):
+        self.user_id = user_id
+        self.room_id = room_id
+        self.expires_at = expires_at
+
+
+class PresenceTracker:
+
+    def __init__(self, ttl=PRESENCE_TTL, store=None, worker_id=None):
+        self.ttl = ttl
+        self._store = store
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._connections = {}       # channel_name -> PresenceConnection
+        self._user_connections = {}  # user_id -> nombre de connexions
+        self._room_users = {}        # room_id -> {user_id: nombre de connexions}
+        self._usernames = {}         # utilisateurs connectés à ce processus
+        self._room_groups = {}       # room_id -> groupe du ChatConsumer
+        self._broadcast_users = {}   # room_id -> {user_id: username} lors de la dernière diffusion
+        self._dirty_rooms = set()
+        self._seen = set()           # actifs depuis le dernier flush
+        self._gone = set()           # passés hors ligne depuis le dernier flush
+        # État des autres processus (PRESENCE_STORE='cache')
+        self._slot = None
+        self._leader = True
+        self._other_users = {}       # user_id -> username
+        self._other_rooms = {}       # room_id -> {user_id: username}
+        self._other_groups = {}
+        self._flushed_users = set()  # en ligne lors du dernier flush
+        self._lock = threading.Lock()
+        self._task = None
+
+    @property
+    def shared(self):
+        return self._store is not None or settings.PRESENCE_STORE == 'cache'
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = caches['presence']
+        return self._store
+
+    # ---------- Événements des consumers ----------
+    def connect(self, channel_name, user_id, username, room_id=None, group=None):
+        with self._lock:
+            if channel_name in self._connections:
+                self._remove(channel_name)
+            self._connections[channel_name] = PresenceConnection(
+                user_id, room_id, time.monotonic() + self.ttl
+            )
+            self._usernames[user_id] = username
+            self._user_connections[user_id] = self._user_connections.get(user_id, 0) + 1
+            self._gone.discard(user_id)
+            self._seen.add(user_id)
+            if room_id is not None:
+                if group:
+                    self._room_groups[room_id] = group
+                users = self._room_users.setdefault(room_id, {})
+                if user_id not in users:
+                    self._dirty_rooms.add(room_id)
+                users[user_id] = users.get(user_id, 0) + 1
+
+    def heartbeat(self, channel_name):
+        """Prolonge la connexion. Renvoie False si elle avait déjà expiré."""
+        with self._lock:
+            connection = self._connections.get(channel_name)
+            if connection is None:
+                return False
+            connection.expires_at = time.monotonic() + self.ttl
+            self._seen.add(connection.user_id)
+            return True
+
+    def disconnect(self, channel_name):
+        with self._lock:
+            self._remove(channel_name)
+
+    def _remove(self, channel_name):
+        connection = self._connections.pop(channel_name, None)
+        if connection is None:
+            return
+        user_id = connection.user_id
+        remaining = self._user_connections.get(user_id, 1) - 1
+        if remaining > 0:
+            self._user_connections[user_id] = remaining
+        else:
+            self._user_connections.pop(user_id, None)
+            self._usernames.pop(user_id, None)
+            self._seen.discard(user_id)
+            self._gone.add(user_id)
+
+        users = self._room_users.get(connection.room_id)
+        if users is not None:
+            remaining = users.get(user_id, 1) - 1
+            if remaining > 0:
+                users[user_id] = remaining
+            else:
+                users.pop(user_id, None)
+                self._dirty_rooms.add(connection.room_id)
+                if not users:
+                    del self._room_users[connection.room_id]
+
+    def expire(self, now=None):
+        """Supprime les connexions sans heartbeat depuis PRESENCE_TTL."""
+        now = now or time.monotonic()
+        with self._lock:
+            expired = [name for name, c in self._connections.items() if c.expires_at < now]
+            for channel_name in expired:
+                self._remove(channel_name)
+        return len(expired)
+
+    # ---------- Lecture ----------
+    def online_count(self, room_id):
+        return len(self.online_user_ids(room_id))
+
+    def online_user_ids(self, room_id):
+        return set(self._room_users.get(room_id, ())) | self._other_rooms.get(room_id, {}).keys()
+
+    def is_online(self, user_id):
+        return user_id in self._user_connections or user_id in self._other_users
+
+    def _room_members(self, room_id):
+        members = dict(self._other_rooms.get(room_id, {}))
+        for user_id in self._room_users.get(room_id, ()):
+            members[user_id] = self._usernames[user_id]
+        return members
+
+    # ---------- État partagé entre processus ----------
+    def snapshot(self):
+        with self._lock:
+            return {
+                'worker': self.worker_id,
+                'users': dict(self._usernames),
+                'rooms': {
+                    room_id: {user_id: self._usernames[user_id] for user_id in users}
+                    for room_id, users in self._room_users.items()
+                },
+                'groups': {
+                    room_id: group for room_id, group in self._room_groups.items()
+                    if room_id in self._room_users
+                },
+            }
+
+    async def publish(self):
+        """Publie l'état local et relit celui des autres processus (PRESENCE_STORE='cache')."""
+        store = self.store
+        snapshot = self.snapshot()
+        keys = [f'{SLOT_PREFIX}{i}' for i in range(settings.PRESENCE_MAX_WORKERS)]
+        found = await store.aget_many(keys)
+        if self._slot is not None and found.get(keys[self._slot], {}).get('worker') == self.worker_id:
+            await store.aset(keys[self._slot], snapshot, timeout=self.ttl)
+        else:
+            # Première publication, ou entrée expirée (processus bloqué) puis reprise
+            self._slot = None
+            for i, key in enumerate(keys):
+                if key not in found and await store.aadd(key, snapshot, timeout=self.ttl):
+                    self._slot = i
+                    break
+            else:
+                print("ERREUR présence: aucune entrée libre (PRESENCE_MAX_WORKERS)")
+
+        others = {
+            int(key[len(SLOT_PREFIX):]): state for key, state in found.items()
+            if state.get('worker') != self.worker_id
+        }
+        users, rooms, groups = {}, {}, {}
+        for state in others.values():
+            users.update(state['users'])
+            groups.update(state['groups'])
+            for room_id, members in state['rooms'].items():
+                rooms.setdefault(room_id, {}).update(members)
+        with self._lock:
+            self._other_users, self._other_rooms, self._other_groups = users, rooms, groups
+            self._leader = self._slot is not None and all(self._slot < i for i in others)
+
+    # ---------- Diffusion coalescée ----------
+    def collect_deltas(self):
+        """Renvoie les deltas des salons modifiés depuis la dernière diffusion."""
+        with self._lock:
+            dirty, self._dirty_rooms = self._dirty_rooms, set()
+            if self.shared:
+                # Les changements des autres processus ne passent pas par _dirty_rooms
+                dirty = set(self._room_users) | set(self._other_rooms) | set(self._broadcast_users)
+            deltas = []
+            for room_id in dirty:
+                current = self._room_members(room_id)
+                previous = self._broadcast_users.get(room_id, {})
+                joined, left = current.keys() - previous.keys(), previous.keys() - current.keys()
+                if current:
+                    self._broadcast_users[room_id] = current
+                else:
+                    self._broadcast_users.pop(room_id, None)
+                group = self._room_groups.get(room_id) or self._other_groups.get(room_id)
+                if group and (joined or left):
+                    deltas.append((group, codec.framed({'type': 'presence_update', 'room_id': room_id}, {
+                        'type': 'presence',
+                        'online_count': len(current),
+                        'joined': sorted(current[u] for u in joined),
+                        'left': sorted(previous[u] for u in left),
+                    })))
+            # Tous les processus suivent l'état diffusé; seul le meneur envoie
+            return deltas if self._leader else []
+
+    async def broadcast(self):
+        channel_layer = get_channel_layer()
+        for group, event in self.collect_deltas():
+            await channel_layer.group_send(group, event)
+
+    # ---------- Écriture groupée en base ----------
+    def flush(self):
+        """is_online / last_seen en deux UPDATE au plus (contexte synchrone)."""
+        with self._lock:
+            seen, self._seen = self._seen, set()
+            gone, self._gone = self._gone, set()
+            if self.shared:
+                online = set(self._user_connections) | self._other_users.keys()
+                if self._leader:
+                    seen, gone = online, self._flushed_users - online
+                else:
+                    seen, gone = set(), set()
+                self._flushed_users = online
+        now = timezone.now()
+        if seen:
+            UserProfile.objects.filter(user_id__in=seen).update(is_online=True, last_seen=now)
+        if gone:
+            UserProfile.objects.filter(user_id__in=gone).update(is_online=False, last_seen=now)
+
+    # ---------- Tâche de fond ----------
+    def ensure_running(self):
+        """Démarre la tâche de fond sur la boucle courante si nécessaire."""
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self.run())
+
+    async def run(self):
+        last_flush = time.monotonic()
+        while True:
+            await asyncio.sleep(BROADCAST_SECONDS)
+            try:
+                self.expire()
+                if self.shared:
+                    await self.publish()
+                await self.broadcast()
+                if time.monotonic() - last_flush >= FLUSH_SECONDS:
+                    last_flush = time.monotonic()
+                    await database_sync_to_async(self.flush)()
+            except Exception as e:
+                print(f"ERREUR présence: {e}")
+
+
+presence = PresenceTracker()
+
+
+class PresenceMixin:
+    """
+    Pour les consumers: presence_room_id / presence_group désignent le salon
+    suivi (None pour une présence globale: notifications, messages privés).
+    """
+    presence_room_id = None
+    presence_group = None
+
+    def presence_connect(self):
+        presence.connect(
+            self.channel_name, self.user.id, self.user.username,
+            self.presence_room_id, self.presence_group,
+        )
+        presence.ensure_running()
+
+    def presence_heartbeat(self):
+        # Connexion expirée (onglet en veille) mais toujours ouverte: on la réenregistre
+        if not presence.heartbeat(self.channel_name):
+            self.presence_connect()
+
+    def presence_disconnect(self):
+        presence.disconnect(self.channel_name)
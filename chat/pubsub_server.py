@@ -0,0 +1,186 @@
+"""
+Serveur local minimal compatible avec le protocole Redis (RESP2), limité à
+PUBLISH / SUBSCRIBE (RESP3 négocié par HELLO, utilisé par redis-py >= 6). Suffisant pour channels_redis.pubsub.RedisPubSubChannelLayer:
+permet de lancer plusieurs processus Daphne en développement ou en test
+sans installer Redis. Pas de persistance, pas de clés, pas de Lua.
+
+    python manage.py pubsub_server --port 6379
+"""
+import asyncio
+
+
+class RespError(Exception):
+    pass
+
+
+def encode(value):
+    """Encode une réponse (str -> bulk string, int -> integer, list -> array, dict -> map RESP3)."""
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    if isinstance(value, (list, tuple)):
+        return b'*%d\r\n' % len(value) + b''.join(encode(item) for item in value)
+    if isinstance(value, dict):
+        return b'%%%d\r\n' % len(value) + b''.join(
+            encode(key) + encode(item) for key, item in value.items()
+        )
+    raise TypeError(f'Type non supporté: {type(value)!r}')
+
+
+def encode_push(items, protocol):
+    """Messages pub/sub: tableau en RESP2, push ('>') en RESP3."""
+    frame = encode(list(items))
+    return b'>' + frame[1:] if protocol == 3 else frame
+
+
+OK = b'+OK\r\n'
+
+
+async def read_command(reader):
+    """Lit une commande (tableau de bulk strings, ou commande inline)."""
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        return line.strip().split()
+    count = int(line[1:])
+    args = []
+    for _ in range(count):
+        header = await reader.readline()
+        if not header.startswith(b'$'):
+            raise RespError('bulk string attendu')
+        length = int(header[1:])
+        data = await reader.readexactly(length + 2)
+        args.append(data[:-2])
+    return args
+
+
+class PubSubServer:
+
+    def __init__(self, host='127.0.0.1', port=6379):
+        self.host = host
+        self.port = port
+        self.subscribers = {}  # canal -> {writer: protocole}
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    # ---------- Commandes ----------
+    def publish(self, channel, message):
+        writers = self.subscribers.get(channel, {})
+        frames = {}
+        for writer, protocol in list(writers.items()):
+            if writer.is_closing():
+                del writers[writer]
+                continue
+            if protocol not in frames:
+                frames[protocol] = encode_push([b'message', channel, message], protocol)
+            writer.write(frames[protocol])
+        return len(writers)
+
+    def subscribe(self, writer, protocol, channels, subscribed):
+        frames = []
+        for channel in channels:
+            self.subscribers.setdefault(channel, {})[writer] = protocol
+            subscribed.add(channel)
+            frames.append(encode_push([b'subscribe', channel, len(subscribed)], protocol))
+        return b''.join(frames)
+
+    def unsubscribe(self, writer, protocol, channels, subscribed):
+        channels = channels or list(subscribed)
+        if not channels:
+            return encode_push([b'unsubscribe', None, 0], protocol)
+        frames = []
+        for channel in channels:
+            self._remove(writer, channel)
+            subscribed.discard(channel)
+            frames.append(encode_push([b'unsubscribe', channel, len(subscribed)], protocol))
+        return b''.join(frames)
+
+    def hello(self, args):
+        """HELLO [2|3]: renvoie (protocole, réponse)."""
+        protocol = int(args[1]) if len(args) > 1 else 2
+        if protocol not in (2, 3):
+            return None, b'-NOPROTO unsupported protocol version\r\n'
+        info = {
+            'server': 'redis', 'version': '7.0.0', 'proto': protocol,
+            'id': 0, 'mode': 'standalone', 'role': 'master', 'modules': [],
+        }
+        reply = encode(info) if protocol == 3 else encode(
+            [item for pair in info.items() for item in pair]
+        )
+        return protocol, reply
+
+    def _remove(self, writer, channel):
+        writers = self.subscribers.get(channel)
+        if writers is not None:
+            writers.pop(writer, None)
+            if not writers:
+                del self.subscribers[channel]
+
+    async def handle_client(self, reader, writer):
+        subscribed = set()
+        protocol = 2
+        try:
+            while True:
+                try:
+                    args = await read_command(reader)
+                except (RespError, ValueError) as e:
+                    writer.write(b'-ERR %s\r\n' % str(e).encode())
+                    break
+                if args is None:
+                    break
+                if not args:
+                    continue
+                name = args[0].upper()
+
+                if name == b'PUBLISH' and len(args) == 3:
+                    writer.write(encode(self.publish(args[1], args[2])))
+                elif name == b'SUBSCRIBE' and len(args) > 1:
+                    writer.write(self.subscribe(writer, protocol, args[1:], subscribed))
+                elif name == b'UNSUBSCRIBE':
+                    writer.write(self.unsubscribe(writer, protocol, args[1:], subscribed))
+                elif name == b'HELLO':
+                    negotiated, reply = self.hello(args)
+                    protocol = negotiated or protocol
+                    writer.write(reply)
+                elif name == b'PING':
+                    if subscribed and protocol == 2:
+                        writer.write(encode([b'pong', args[1] if len(args) > 1 else b'']))
+                    else:
+                        writer.write(encode(args[1]) if len(args) > 1 else b'+PONG\r\n')
+                elif name == b'ECHO' and len(args) == 2:
+                    writer.write(encode(args[1]))
+                elif name in (b'CLIENT', b'SELECT', b'FLUSHDB', b'FLUSHALL'):
+                    writer.write(OK)
+                elif name == b'QUIT':
+                    writer.write(OK)
+                    break
+                else:
+                    writer.write(b'-ERR unknown command \'%s\'\r\n' % args[0])
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self._remove(writer, channel)
+            writer.close()
@@ -0,0 +1,167 @@
+"""
+Garde-fou des index: exécute les chemins chauds (vues home, room_detail,
+private_chat, endpoints unread, helpers des consumers), passe chaque requête
+à EXPLAIN QUERY PLAN et signale les régressions:
+- SCAN d'une table entière (hors listes complètes voulues, voir allowed_scans);
+- tri en mémoire (TEMP B-TREE FOR ORDER BY) d'une table de messages.
+
+Pas d'ANALYZE: comme en production, le planificateur n'a pas de statistiques.
+Vérifié par chat/tests/test_query_plans.py (manage.py test) et affiché par
+`python manage.py check_query_plans`.
+"""
+import inspect
+import re
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import Client
+
+from chat import media
+from chat.consumers import ChatConsumer, PrivateChatConsumer, NotificationConsumer
+from chat.models import Room, Message, PrivateMessage, Block, HiddenConversation, UserProfile
+from chat.unread import unread_counters
+
+# Tables dont les lectures doivent suivre l'ordre d'un index
+SORTED_TABLES = {'chat_message', 'chat_privatemessage', 'chat_archivesegment'}
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+
+SCAN_RE = re.compile(r'^SCAN (\w+)')
+SEARCH_RE = re.compile(r'^(?:SEARCH|SCAN) (\w+)')
+
+
+class QueryPlanError(Exception):
+    pass
+
+
+def sync_helper(consumer, name):
+    """Fonction synchrone derrière un helper @database_sync_to_async."""
+    return inspect.getattr_static(type(consumer), name).func
+
+
+class PlanRecorder:
+    """execute_wrapper: garde (sql, params) des requêtes exécutées."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(EXPLAINED) and not many:
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+class QueryPlanChecker:
+    """Données de test puis scénarios, sur la base courante (déjà migrée)."""
+
+    def run(self):
+        self.setup_data()
+        return [self.check_scenario(name, run, allowed) for name, run, allowed in self.scenarios()]
+
+    # ---------- Données ----------
+    def setup_data(self):
+        self.alice = User.objects.create_user('alice', password='plans')
+        self.bob = User.objects.create_user('bob', password='plans')
+        self.carol = User.objects.create_user('carol', password='plans')
+        for user in (self.alice, self.bob, self.carol):
+            UserProfile.objects.get_or_create(user=user)
+        self.room = Room.objects.create(name='General', created_by=self.alice)
+        self.room.members.add(self.alice, self.bob)
+        other = Room.objects.create(name='Autre', created_by=self.carol)
+        other.members.add(self.carol)
+        for i in range(30):
+            Message.objects.create(room=self.room, user=self.bob if i % 2 else self.alice, content=f'message {i}')
+            PrivateMessage.objects.create(sender=self.bob, receiver=self.alice, content=f'privé {i}')
+            PrivateMessage.objects.create(sender=self.alice, receiver=self.carol, content=f'privé {i}')
+        Message.objects.create(room=self.room, user=self.alice, content='fichier', file='blobs/aa/salon.pdf')
+        PrivateMessage.objects.create(sender=self.alice, receiver=self.carol, content='fichier', file='blobs/aa/prive.pdf')
+        HiddenConversation.objects.create(user=self.bob, room=self.room)
+        Block.objects.create(blocker=self.carol, blocked=self.bob)
+
+    # ---------- Scénarios ----------
+    def scenarios(self):
+        """(nom, fonction, tables dont le parcours complet est voulu)."""
+        client = Client()
+        client.force_login(self.alice)
+
+        def get(url):
+            return lambda: self.expect_ok(client.get(url), url)
+
+        chat = ChatConsumer()
+        chat.user, chat.room_name, chat.room = self.alice, 'general', self.room
+        private = PrivateChatConsumer()
+        private.user, private.other_username = self.alice, 'bob'
+        notification = NotificationConsumer()
+        notification.user = self.alice
+        last_message = Message.objects.filter(room=self.room).last()
+        own_private = PrivateMessage.objects.filter(sender=self.alice).last()
+
+        return [
+            # home liste aussi tous les salons et tous les utilisateurs (modales)
+            ('view:home', get('/home'), {'chat_room', 'auth_user'}),
+            # Liste des utilisateurs à ajouter au salon
+            ('view:room_detail', get('/room/general/'), {'auth_user'}),
+            ('view:room_messages', get('/room/general/messages/'), set()),
+            ('view:room_members', get('/room/general/members/'), set()),
+            ('view:private_chat', get('/private/bob/'), set()),
+            ('view:private_messages', get('/private/bob/messages/'), set()),
+            ('view:private_unread_count', get('/private/unread-count/'), set()),
+            # Renvoie tous les salons par construction
+            ('view:rooms_unread_count', get('/rooms/unread-count/'), {'chat_room'}),
+            ('view:check_block_status', get('/check-block-status/bob/'), set()),
+            ('consumer:chat.get_room', lambda: sync_helper(chat, 'get_room')(chat), set()),
+            ('consumer:chat.get_unread_messages', lambda: sync_helper(chat, 'get_unread_messages')(chat), set()),
+            ('consumer:chat.mark_message_as_read',
+             lambda: sync_helper(chat, 'mark_message_as_read')(chat, last_message.id), set()),
+            ('consumer:chat.get_message', lambda: sync_helper(chat, '_get_message_by_id')(chat, last_message.id), set()),
+            ('consumer:chat.hide_conversation', lambda: sync_helper(chat, 'hide_conversation_for_user')(chat), set()),
+            ('consumer:chat.save_message',
+             lambda: Message.bulk_insert([Message(room=self.room, user=self.alice, content='lot')]), set()),
+            # Reprise après reconnexion, tampon en mémoire manquant (streams.py)
+            ('consumer:chat.load_frames_after',
+             lambda: sync_helper(chat, 'load_frames_after')(chat, last_message.seq - 10, last_message.seq), set()),
+            ('consumer:private.load_peer_state', lambda: sync_helper(private, 'load_peer_state')(private), set()),
+            ('consumer:private.save_message',
+             lambda: PrivateMessage.bulk_insert([PrivateMessage(sender=self.alice, receiver=self.bob, content='lot')]),
+             set()),
+            ('consumer:private.delete_message',
+             lambda: sync_helper(private, 'delete_message')(private, own_private.id), set()),
+            ('consumer:notification.get_room_ids',
+             lambda: sync_helper(notification, 'get_room_ids')(notification), set()),
+            ('unread:load', lambda: unread_counters.load(self.room.id, force=True), set()),
+            ('profile:unread_private_count', lambda: self.alice.profile.unread_private_count(self.bob), set()),
+            ('media:can_access room', lambda: media.can_access(self.bob, 'blobs/aa/salon.pdf'), set()),
+            ('media:can_access private', lambda: media.can_access(self.bob, 'blobs/aa/prive.pdf'), set()),
+            # Fichier absent des messages en base: recherche dans les archives
+            ('media:can_access archived', lambda: media.can_access(self.bob, 'blobs/aa/archive.pdf'), set()),
+        ]
+
+    def expect_ok(self, response, url):
+        if response.status_code != 200:
+            raise QueryPlanError(f"{url}: HTTP {response.status_code}")
+
+    # ---------- Analyse ----------
+    def check_scenario(self, name, run, allowed_scans):
+        recorder = PlanRecorder()
+        with connection.execute_wrapper(recorder):
+            run()
+
+        plans, violations = [], []
+        with connection.cursor() as cursor:
+            for sql, params in recorder.queries:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = [row[3] for row in cursor.fetchall()]
+                plans.append({'sql': sql, 'plan': plan})
+                for problem in self.problems(plan, allowed_scans):
+                    violations.append({'problem': problem, 'sql': sql, 'plan': plan})
+        return {'scenario': name, 'queries': len(plans), 'violations': violations, 'plans': plans}
+
+    def problems(self, plan, allowed_scans):
+        problems = []
+        tables = [m.group(1) for m in map(SEARCH_RE.match, plan) if m]
+        for line in plan:
+            match = SCAN_RE.match(line)
+            if match and 'VIRTUAL TABLE' not in line and match.group(1) not in allowed_scans:
+                problems.append(f'parcours complet de {match.group(1)}')
+        if tables and tables[0] in SORTED_TABLES and 'USE TEMP B-TREE FOR ORDER BY' in plan:
+            problems.append(f'tri en mémoire de {tables[0]}')
+        return problems
@@ -0,0 +1,157 @@
+"""
+Limitation de débit des actions WebSocket, par utilisateur et par salon.
+
+Seau à jetons sous sa forme GCRA: une clé ne stocke qu'un instant (TAT, date
+à laquelle le seau sera de nouveau plein). Une action est acceptée si le seau
+contient encore un jeton (TAT - maintenant <= (burst - 1) / rate), puis le
+TAT avance d'un intervalle (1 / rate). Une clé dont le TAT est passé
+équivaut à un seau plein: elle est oubliée.
+
+RATE_LIMITS: {action: {'user': (par seconde, burst), 'room': (...)}}, la règle
+'default' s'applique aux actions absentes. Une action doit passer tous les
+seaux de sa règle; aucun n'est débité si l'un d'eux refuse.
+
+RATE_LIMIT_STORE:
+- 'memory' (défaut): par processus, comme unread.py et presence.py. Les
+  clés sont rangées par dernier accès et purgées depuis la plus ancienne:
+  mémoire en O(1) par clé active;
+- 'cache': cache Django (CACHES), partagé entre workers s'il l'est (Redis,
+  Memcached). Lecture puis écriture sans verrou: des requêtes simultanées
+  sur la même clé peuvent dépasser la limite de quelques unités.
+"""
+import math
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import codec
+from .metrics import WS_RATE_LIMITED
+
+CACHE_PREFIX = 'ratelimit:'
+EPSILON = 1e-9
+
+
+class MemoryStore:
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self):
+        # Appelé depuis la boucle asyncio du processus: pas de verrou
+        self._tats = OrderedDict()
+
+    async def get_many(self, keys):
+        return {key: self._tats[key] for key in keys if key in self._tats}
+
+    async def set_many(self, tats, now):
+        for key, tat in tats.items():
+            self._tats[key] = tat
+            self._tats.move_to_end(key)
+        self.evict(now)
+
+    def evict(self, now):
+        # Les clés les plus anciennes d'abord; s'arrête au premier seau non plein
+        while self._tats:
+            key, tat = next(iter(self._tats.items()))
+            if tat > now:
+                break
+            del self._tats[key]
+
+    def __len__(self):
+        return len(self._tats)
+
+
+class CacheStore:
+    clock = staticmethod(time.time)
+
+    async def get_many(self, keys):
+        found = await cache.aget_many([CACHE_PREFIX + key for key in keys])
+        return {key[len(CACHE_PREFIX):]: tat for key, tat in found.items()}
+
+    async def set_many(self, tats, now):
+        # Expiration = seau de nouveau plein
+        for key, tat in tats.items():
+            await cache.aset(CACHE_PREFIX + key, tat, timeout=math.ceil(tat - now) + 1)
+
+
+class RateLimiter:
+
+    def __init__(self, rules=None, store=None):
+        self._rules = rules
+        self._store = store
+
+    @property
+    def rules(self):
+        if self._rules is None:
+            self._rules = settings.RATE_LIMITS
+        return self._rules
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = CacheStore() if settings.RATE_LIMIT_STORE == 'cache' else MemoryStore()
+        return self._store
+
+    async def hit(self, action, **idents):
+        """
+        Débite un jeton de chaque seau de la règle de l'action (idents: scope -> id,
+        ex. user=3, room=12). Renvoie None si l'action passe, sinon
+        (scope refusé, secondes avant le prochain jeton).
+        """
+        rule = self.rules.get(action, self.rules.get('default', {}))
+        keys = {
+            scope: f'{action}:{scope}:{ident}'
+            for scope, ident in idents.items() if ident is not None and scope in rule
+        }
+        if not keys:
+            return None
+        store = self.store
+        now = store.clock()
+        stored = await store.get_many(list(keys.values()))
+        tats = {}
+        for scope, key in keys.items():
+            rate, burst = rule[scope]
+            interval = 1 / rate
+            tat = max(stored.get(key, now), now)
+            excess = tat - now - interval * (burst - 1)
+            # Tolérance: la somme des intervalles flottants ne doit pas coûter le dernier jeton
+            if excess > EPSILON:
+                return scope, excess
+            tats[key] = tat + interval
+        await store.set_many(tats, now)
+        return None
+
+
+rate_limiter = RateLimiter()
+
+
+class RateLimitMixin:
+    """
+    Pour les consumers (avec MetricsMixin, dont metrics_actions borne les noms
+    d'actions): rate_limit_room() désigne le seau 'room' (None: pas de seau
+    de salon). throttled() renvoie True, après avoir envoyé une trame
+    d'erreur, si l'action doit être ignorée.
+    """
+
+    def rate_limit_room(self):
+        return None
+
+    async def throttled(self, action):
+        # Actions inconnues regroupées (metrics_actions): clés et labels bornés
+        if action not in self.metrics_actions:
+            action = 'other'
+        refused = await rate_limiter.hit(action, user=self.user.id, room=self.rate_limit_room())
+        if refused is None:
+            return False
+        scope, retry_after = refused
+        WS_RATE_LIMITED.inc(type(self).__name__, action, scope)
+        await self.send(text_data=codec.dumps({
+            'type': 'error',
+            'code': 'rate_limited',
+            'action': action,
+            'scope': scope,
+            'retry_after': round(retry_after, 2),
+            'message': "Trop d'envois, réessayez dans quelques secondes." if scope == 'user'
+                       else "Ce salon est très actif, réessayez dans quelques secondes.",
+        }))
+        return True
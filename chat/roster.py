@@ -0,0 +1,119 @@
+"""
+Liste des membres d'un salon: snapshot en cache + deltas versionnés.
+
+Tout changement d'appartenance (signal m2m_changed: consumer, vue ou admin)
+incrémente Room.members_version, invalide le snapshot et diffuse un
+members_update qui ne contient que le delta (joined / left / removed) et la
+nouvelle version. Un client qui constate un saut de version recharge le
+snapshot complet via room/<nom>/members/.
+
+Le snapshot est mis en cache par (salon, version): une entrée périmée ne peut
+jamais être servie, même avec un cache local à chaque processus.
+"""
+import contextvars
+from contextlib import contextmanager
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import Room
+from .notifications import notify_members_update
+
+SNAPSHOT_TTL = 300
+
+_change_reason = contextvars.ContextVar('roster_change_reason', default=None)
+
+
+@contextmanager
+def change_reason(kind, actor=None):
+    """
+    Précise la nature des changements faits dans le bloc ('added' ou 'removed',
+    par actor) pour le delta diffusé par le signal. Par défaut: 'joined' / 'left'.
+    """
+    token = _change_reason.set((kind, actor))
+    try:
+        yield
+    finally:
+        _change_reason.reset(token)
+
+
+def current_reason():
+    return _change_reason.get() or (None, None)
+
+
+def snapshot_key(room_id, version):
+    return f'chat:roster:{room_id}:{version}'
+
+
+def member_data(user):
+    profile = getattr(user, 'profile', None)
+    return {
+        'id': user.id,
+        'username': user.username,
+        'avatar_url': profile.avatar.url if profile and profile.avatar else None,
+    }
+
+
+def roster_snapshot(room):
+    """Snapshot {'version', 'count', 'members'} de la version courante du salon."""
+    key = snapshot_key(room.id, room.members_version)
+    snapshot = cache.get(key)
+    if snapshot is None:
+        members = [member_data(user) for user in room.members.select_related('profile').order_by('username')]
+        snapshot = {
+            'version': room.members_version,
+            'count': len(members),
+            'members': members,
+        }
+        cache.set(key, snapshot, SNAPSHOT_TTL)
+    return snapshot
+
+
+def bump_version(room_id):
+    """Incrémente la version, invalide l'ancien snapshot et renvoie le salon à jour."""
+    Room.objects.filter(pk=room_id).update(members_version=F('members_version') + 1)
+    room = Room.objects.only('id', 'name', 'members_version').get(pk=room_id)
+    cache.delete(snapshot_key(room_id, room.members_version - 1))
+    return room
+
+
+def _message(kind, usernames, actor):
+    names = ', '.join(usernames)
+    if kind == 'removed':
+        return f"{names} a été retiré du salon par {actor}." if actor else f"{names} a été retiré du salon."
+    if kind == 'added':
+        return f"{names} a été ajouté au salon par {actor}." if actor else f"{names} a été ajouté au salon."
+    if kind == 'left':
+        return f"{names} a quitté le salon."
+    return f"{names} a rejoint le salon."
+
+
+def members_changed(room_id, user_ids, joined, reason=None, actor=None):
+    """
+    Appelé par le signal, dans la transaction de l'ajout / retrait: la version
+    est incrémentée avec le changement lui-même, le delta part après le commit.
+    user_ids=None signifie une remise à zéro (clear): les clients resynchronisent.
+    """
+    room = bump_version(room_id)
+    event = {
+        'type': 'members_update',
+        'version': room.members_version,
+        'joined': [],
+        'left': [],
+        'removed': [],
+        'resync': user_ids is None,
+    }
+    if user_ids:
+        if joined:
+            users = User.objects.filter(pk__in=user_ids).select_related('profile').order_by('username')
+            event['joined'] = [member_data(user) for user in users]
+            usernames = [member['username'] for member in event['joined']]
+            kind = 'added' if reason == 'added' else 'joined'
+        else:
+            usernames = list(User.objects.filter(pk__in=user_ids).order_by('username').values_list('username', flat=True))
+            kind = 'removed' if reason == 'removed' else 'left'
+            event[kind] = usernames
+        event['message'] = _message(kind, usernames, actor)
+    transaction.on_commit(lambda: notify_members_update(room.name, event))
@@ -8,4 +8,6 @@ websocket_urlpatterns = [
 
     re_path(r'ws/chat/private/(?P<username>\w+)/$', consumers.PrivateChatConsumer.as_asgi()),
 
+    re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
+
 ]
\ No newline at end of file
@@ -0,0 +1,180 @@
+"""
+Recherche plein texte des messages (salons et privés) avec SQLite FTS5.
+
+Deux tables FTS5 à contenu externe (chat_message_fts, chat_privatemessage_fts)
+indexent la colonne content; des triggers SQL les tiennent à jour. Les triggers
+couvrent aussi bulk_create (écriture par lots), les update() et delete() de
+QuerySet, que les signaux ne voient pas.
+
+Certaines migrations SQLite reconstruisent une table (copie + renommage) et
+perdent ses triggers: ensure_index(), branché sur post_migrate, les recrée et
+reconstruit l'index si nécessaire.
+
+Les messages archivés (archive.py) sont supprimés de la base, donc de l'index:
+la recherche ne porte que sur les messages encore en base.
+"""
+import html
+import re
+
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+
+from .models import Message, PrivateMessage
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+SNIPPET_TOKENS = 12
+
+# Marqueurs internes du snippet, remplacés par <mark> après échappement HTML
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+# Migration qui crée l'index: avant elle (ou après son annulation), rien à maintenir
+INDEX_MIGRATION = ('chat', '0016_message_search_index')
+
+INDEXED_TABLES = {
+    'chat_message': 'chat_message_fts',
+    'chat_privatemessage': 'chat_privatemessage_fts',
+}
+
+
+def index_sql(table, fts):
+    """DDL de la table FTS et de ses triggers (idempotent)."""
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"content, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF content ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, content) VALUES ('delete', old.id, old.content); "
+        f"INSERT INTO {fts}(rowid, content) VALUES (new.id, new.content); END",
+    ]
+
+
+def is_available(using='default'):
+    return connections[using].vendor == 'sqlite'
+
+
+def ensure_index(using='default', rebuild=False):
+    """
+    Crée les tables FTS / triggers manquants. Reconstruit l'index d'une table
+    si un de ses objets manquait (ou si rebuild=True). Renvoie les tables reconstruites.
+    """
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return []
+    rebuilt = []
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        for table, fts in INDEXED_TABLES.items():
+            if table not in existing:
+                continue
+            expected = {fts, f'{fts}_ai', f'{fts}_ad', f'{fts}_au'}
+            missing = not expected <= existing
+            for statement in index_sql(table, fts):
+                cursor.execute(statement)
+            if missing or rebuild:
+                cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+                rebuilt.append(fts)
+    return rebuilt
+
+
+def build_match(query):
+    """
+    Transforme la saisie libre en expression FTS5 sûre: chaque mot devient une
+    phrase entre guillemets (ET implicite), le dernier est un préfixe.
+    Renvoie None si la saisie ne contient aucun mot.
+    """
+    words = re.findall(r'\w+', query or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight(snippet):
+    """Échappe le snippet puis remplace les marqueurs par <mark>."""
+    return html.escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def match_ids(model, query):
+    """Sous-requête des ids correspondant à query (pour filter(pk__in=...))."""
+    fts = INDEXED_TABLES[model._meta.db_table]
+    return RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", [build_match(query)])
+
+
+# Classement seul: les snippets ne sont calculés que pour la page (SNIPPET_SQL)
+SEARCH_SQL = """
+SELECT 'room' AS kind, m.id AS id, bm25(chat_message_fts) AS score
+FROM chat_message_fts
+JOIN chat_message m ON m.id = chat_message_fts.rowid
+WHERE chat_message_fts MATCH %s
+  AND m.room_id IN (SELECT room_id FROM chat_room_members WHERE user_id = %s)
+UNION ALL
+SELECT 'private' AS kind, p.id AS id, bm25(chat_privatemessage_fts) AS score
+FROM chat_privatemessage_fts
+JOIN chat_privatemessage p ON p.id = chat_privatemessage_fts.rowid
+WHERE chat_privatemessage_fts MATCH %s
+  AND (p.sender_id = %s OR p.receiver_id = %s)
+ORDER BY score, id DESC
+LIMIT %s OFFSET %s
+"""
+
+SNIPPET_SQL = (
+    "SELECT rowid, snippet({fts}, 0, '" + _MARK_START + "', '" + _MARK_END + "', '…', "
+    + str(SNIPPET_TOKENS) + ") FROM {fts} WHERE {fts} MATCH %s AND rowid IN ({ids})"
+)
+
+
+def snippets(cursor, fts, match, ids):
+    if not ids:
+        return {}
+    cursor.execute(SNIPPET_SQL.format(fts=fts, ids=', '.join(['%s'] * len(ids))), [match, *ids])
+    return dict(cursor.fetchall())
+
+
+def search_messages(user, query, limit=DEFAULT_LIMIT, offset=0):
+    """
+    Messages des salons dont user est membre et de ses conversations privées,
+    classés par pertinence (bm25). Renvoie (résultats, has_more).
+    Chaque résultat: {'kind', 'score', 'snippet' (HTML échappé avec <mark>), 'message'}.
+    """
+    match = build_match(query)
+    if match is None:
+        return [], False
+
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_SQL, [match, user.id, match, user.id, user.id, limit + 1, offset])
+        rows = cursor.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        room_ids = [row[1] for row in rows if row[0] == 'room']
+        private_ids = [row[1] for row in rows if row[0] == 'private']
+        excerpts = {
+            'room': snippets(cursor, 'chat_message_fts', match, room_ids),
+            'private': snippets(cursor, 'chat_privatemessage_fts', match, private_ids),
+        }
+
+    # Deux requêtes pour charger les messages de la page
+    objects = {
+        'room': Message.objects.select_related('room', 'user', 'user__profile').in_bulk(room_ids),
+        'private': PrivateMessage.objects.select_related('sender', 'receiver').in_bulk(private_ids),
+    }
+
+    results = []
+    for kind, pk, score in rows:
+        message = objects[kind].get(pk)
+        if message is None:
+            continue
+        results.append({
+            'kind': kind,
+            'score': score,
+            'snippet': highlight(excerpts[kind].get(pk, message.content)),
+            'message': message,
+        })
+    return results, has_more
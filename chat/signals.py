@@ -0,0 +1,69 @@
+"""
+Signaux: notifications temps réel à la création des messages, aux
+changements d'appartenance aux salons et aux blocages. Les envois partent
+après le commit, comme la génération des miniatures (thumbnails.py).
+"""
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Room, Message, PrivateMessage, Block
+from . import notifications, roster, thumbnails
+
+
+@receiver(post_save, sender=Message)
+def message_created(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: notifications.notify_room_message(instance))
+        if instance.image:
+            transaction.on_commit(lambda: thumbnails.schedule(instance))
+
+
+@receiver(post_save, sender=PrivateMessage)
+def private_message_created(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: notifications.notify_private_message(instance))
+        if instance.image:
+            transaction.on_commit(lambda: thumbnails.schedule(instance))
+
+
+@receiver(post_save, sender=Block)
+def block_created(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: notifications.notify_block_changed(
+            instance.blocker_id, instance.blocked_id, True
+        ))
+
+
+@receiver(post_delete, sender=Block)
+def block_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: notifications.notify_block_changed(
+        instance.blocker_id, instance.blocked_id, False
+    ))
+
+
+@receiver(m2m_changed, sender=Room.members.through)
+def room_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'post_clear' and not reverse:
+        # Membres inconnus: nouvelle version sans delta, les clients resynchronisent
+        roster.members_changed(instance.pk, None, False)
+        return
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    joined = action == 'post_add'
+    # reverse=False: instance est le salon, pk_set des utilisateurs (et inversement)
+    pairs = [(pk, instance.pk) for pk in pk_set] if not reverse else [(instance.pk, pk) for pk in pk_set]
+
+    # Version de la liste incrémentée dans la même transaction que le changement
+    reason, actor = roster.current_reason()
+    rooms = {}
+    for user_id, room_id in pairs:
+        rooms.setdefault(room_id, []).append(user_id)
+    for room_id, user_ids in rooms.items():
+        roster.members_changed(room_id, user_ids, joined, reason, actor)
+
+    def send():
+        for user_id, room_id in pairs:
+            notifications.notify_membership(user_id, room_id, joined)
+
+    transaction.on_commit(send)
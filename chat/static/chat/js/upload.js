@@ -0,0 +1,107 @@
+// ================== Envoi de fichiers par morceaux ==================
+// API de chat/uploads.py: POST de démarrage, PUT de chaque morceau à l'offset
+// confirmé par le serveur, puis POST de finalisation (le serveur crée et
+// diffuse le message). L'id de l'envoi est gardé dans localStorage: après une
+// coupure ou un rechargement de la page, l'envoi du même fichier reprend à
+// l'offset connu du serveur au lieu de repartir de zéro.
+(function(){
+    const MAX_RETRIES = 5;
+
+    function sleep(ms){ return new Promise(resolve=>setTimeout(resolve, ms)); }
+
+    function resumeKey(file, target){
+        return ['chunked-upload', target, file.name, file.size, file.lastModified].join(':');
+    }
+
+    // Renvoie {status, data}; rejette seulement sur erreur réseau
+    function call(url, options){
+        return fetch(url, options).then(res=>res.json().catch(()=>({})).then(data=>({status: res.status, data: data})));
+    }
+
+    async function start(file, options){
+        const formData = new FormData();
+        formData.append('filename', file.name);
+        formData.append('size', file.size);
+        if(options.room) formData.append('room', options.room);
+        if(options.receiverUsername) formData.append('receiver_username', options.receiverUsername);
+        if(options.content) formData.append('content', options.content);
+        const res = await call(options.url, {
+            method: 'POST', headers: {'X-CSRFToken': options.csrfToken}, body: formData
+        });
+        if(res.status !== 201) throw new Error(res.data.message || 'Envoi refusé');
+        return res.data;
+    }
+
+    async function uploadFile(file, options){
+        const key = resumeKey(file, options.room || options.receiverUsername);
+        const progress = options.onProgress || function(){};
+        let state = null;
+
+        // Reprise d'un envoi interrompu
+        const previousId = localStorage.getItem(key);
+        if(previousId){
+            try{
+                const res = await call(options.url + previousId + '/', {method: 'GET'});
+                if(res.status === 200) state = res.data;
+            }catch(err){ /* réseau: on retente plus bas */ }
+            if(!state) localStorage.removeItem(key);
+        }
+        if(!state){
+            state = await start(file, options);
+            localStorage.setItem(key, state.upload_id);
+        }
+
+        const uploadUrl = options.url + state.upload_id + '/';
+        let offset = state.offset;
+        let retries = 0;
+        progress(offset, file.size);
+
+        while(offset < file.size){
+            const chunk = file.slice(offset, Math.min(offset + state.chunk_size, file.size));
+            let res;
+            try{
+                res = await call(uploadUrl, {
+                    method: 'PUT',
+                    headers: {'X-CSRFToken': options.csrfToken, 'Upload-Offset': String(offset),
+                              'Content-Type': 'application/octet-stream'},
+                    body: chunk
+                });
+            }catch(err){
+                res = null;
+            }
+            if(res && res.status === 200){
+                offset = res.data.offset;
+                retries = 0;
+                progress(offset, file.size);
+                continue;
+            }
+            if(res && res.status === 409){
+                // Le serveur a un autre offset (réponse perdue, autre onglet): on le suit
+                offset = res.data.offset;
+                continue;
+            }
+            if(res && res.status < 500 && res.status !== 400){
+                localStorage.removeItem(key);
+                throw new Error(res.data.message || 'Envoi refusé');
+            }
+            if(++retries > MAX_RETRIES){
+                throw new Error('Connexion perdue, réessayez pour reprendre l\'envoi');
+            }
+            await sleep(Math.min(1000 * 2 ** retries, 15000));
+            // Morceau partiellement reçu: on repart de l'offset confirmé
+            try{
+                const status = await call(uploadUrl, {method: 'GET'});
+                if(status.status === 200) offset = status.data.offset;
+            }catch(err){ /* réseau toujours coupé */ }
+        }
+
+        const res = await call(uploadUrl + 'finalize/', {
+            method: 'POST', headers: {'X-CSRFToken': options.csrfToken}
+        });
+        localStorage.removeItem(key);
+        if(res.status !== 200) throw new Error(res.data.message || 'Envoi refusé');
+        return res.data;
+    }
+
+    window.chunkedUpload = uploadFile;
+})();
@@ -0,0 +1,94 @@
+"""
+Stockage des fichiers par contenu (STORAGES['default']).
+
+Le nom enregistré est blobs/<aa>/<sha256>.<ext>, quel que soit le nom
+d'origine ou l'upload_to du champ: le même contenu partagé dans plusieurs
+salons, conversations ou avatars n'est écrit qu'une fois. Chaque contenu a
+une ligne Blob (taille, compteur de références, voir blobs.py).
+
+Le SHA-256 est calculé avant toute écriture: en mémoire pour les petits
+fichiers, en relisant le fichier temporaire pour les gros (TemporaryUploadedFile,
+fichier partiel de uploads.py, qui fournit déjà son hash). Si le blob
+existe, rien n'est écrit et le fichier temporaire est abandonné; sinon il est
+déplacé (ou écrit) sous un nom temporaire puis renommé: un lecteur ne voit
+jamais un blob incomplet.
+"""
+import hashlib
+import os
+import uuid
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+BLOB_PREFIX = 'blobs'
+HASH_BLOCK = 1024 * 1024
+MAX_EXTENSION = 10
+
+
+def content_hash(content):
+    """SHA-256 d'un File Django, lu par blocs (sans tout charger en mémoire)."""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    if hasattr(content, 'temporary_file_path'):
+        with open(content.temporary_file_path(), 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b''):
+                hasher.update(block)
+    else:
+        for chunk in content.chunks(HASH_BLOCK):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def blob_name(digest, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if len(extension) > MAX_EXTENSION or not extension[1:].isalnum():
+        extension = ''
+    return f'{BLOB_PREFIX}/{digest[:2]}/{digest}{extension}'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Même nom = même contenu: jamais de suffixe _abc123
+        return name
+
+    def _save(self, name, content):
+        from .models import Blob
+
+        digest = content_hash(content)
+        name = blob_name(digest, name)
+        now = timezone.now()
+
+        if not self.exists(name):
+            self._write(name, content)
+        # Doublon ou nouveau contenu: le blob est (ré)utilisé maintenant, ce qui
+        # le protège du ramasse-miettes jusqu'à l'enregistrement du message
+        if not Blob.objects.filter(pk=name).update(last_used_at=now):
+            Blob.objects.get_or_create(
+                name=name, defaults={'sha256': digest, 'size': content.size, 'last_used_at': now}
+            )
+        if not self.exists(name):
+            # Supprimé par le ramasse-miettes entre les deux vérifications
+            self._write(name, content)
+        return name
+
+    def _write(self, name, content):
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f'{full_path}.{uuid.uuid4().hex}.tmp'
+        if hasattr(content, 'temporary_file_path') and os.path.exists(content.temporary_file_path()):
+            # Déplacement (rename sur le même disque), pas de recopie
+            file_move_safe(content.temporary_file_path(), tmp_path)
+        else:
+            with open(tmp_path, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+        if self.file_permissions_mode is not None:
+            os.chmod(tmp_path, self.file_permissions_mode)
+        # Deux envois simultanés du même contenu écrivent les mêmes octets
+        os.replace(tmp_path, full_path)
@@ -0,0 +1,77 @@
+"""
+Flux numérotés des salons: reprise après reconnexion.
+
+Chaque trame 'message' d'un salon porte son seq (Message.seq, croissant par
+salon, index unique (room, seq)). Le client retient le dernier seq reçu et,
+à chaque (re)connexion, envoie {'action': 'resume', 'after_seq': n}: il
+reçoit en une seule trame 'resumed' les messages après n, pris
+- dans le tampon circulaire du salon (en mémoire, par processus, comme
+  unread.py), alimenté par les trames chat_message que reçoivent les
+  connexions du processus. Le tampon reste contigu: un seq manquant le vide;
+- sinon par une requête sur l'index (room, seq), jusqu'à RESUME_MAX_MESSAGES;
+- au-delà, trame 'resync' (dernière page, voir outbound.py).
+"""
+import itertools
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+from . import codec
+
+
+class RoomStreams:
+
+    def __init__(self, size=None, max_rooms=None):
+        self._size = size
+        self._max_rooms = max_rooms
+        # room_id -> deque([seq, message_id, trame]); salons par dernière activité
+        self._rooms = OrderedDict()
+
+    def _buffer(self, room_id):
+        entries = self._rooms.get(room_id)
+        if entries is None:
+            entries = self._rooms[room_id] = deque(maxlen=self._size or settings.ROOM_STREAM_SIZE)
+            if len(self._rooms) > (self._max_rooms or settings.ROOM_STREAM_MAX_ROOMS):
+                self._rooms.popitem(last=False)
+        else:
+            self._rooms.move_to_end(room_id)
+        return entries
+
+    def record(self, room_id, seq, message_id, frame):
+        """Trame diffusée: appelée par chaque connexion du salon, enregistrée une fois."""
+        entries = self._buffer(room_id)
+        if entries:
+            last = entries[-1][0]
+            if seq <= last:
+                return
+            if seq != last + 1:
+                entries.clear()
+        entries.append([seq, message_id, frame])
+
+    def forget(self, room_id, message_id):
+        """Message supprimé: n'est plus rejoué."""
+        for entry in self._rooms.get(room_id, ()):
+            if entry[1] == message_id:
+                entry[2] = None
+
+    def frames_after(self, room_id, after_seq, last_seq):
+        """Trames de after_seq < seq <= last_seq, ou None si le tampon ne couvre pas l'intervalle."""
+        if after_seq >= last_seq:
+            return []
+        entries = self._rooms.get(room_id)
+        if not entries or entries[0][0] > after_seq + 1 or entries[-1][0] < last_seq:
+            return None
+        start = max(after_seq + 1 - entries[0][0], 0)
+        return [
+            frame for seq, _, frame in itertools.islice(entries, start, None)
+            if frame is not None and seq <= last_seq
+        ]
+
+
+room_streams = RoomStreams()
+
+
+def resumed_frame(frames, **fields):
+    """Trame 'resumed': champs + liste des trames de messages, sans les réencoder."""
+    head = codec.dumps({'type': 'resumed', **fields})
+    return head[:-1] + ',"messages":[' + ','.join(frames) + ']}'
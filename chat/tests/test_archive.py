@@ -0,0 +1,163 @@
+import gzip
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from chat import archive, history
+from chat.models import (
+    ArchivedFile, ArchiveSegment, Blob, Conversation, HiddenConversation, Message, PrivateMessage, Room,
+)
+
+NOW = datetime(2026, 3, 15, tzinfo=dt_timezone.utc)
+# m0-m1 en janvier, m2-m4 en février (archivés à 30 jours), m5-m6 récents
+TIMESTAMPS = [
+    datetime(2026, 1, 20, tzinfo=dt_timezone.utc) + timedelta(minutes=i) for i in range(2)
+] + [
+    datetime(2026, 2, 3, tzinfo=dt_timezone.utc) + timedelta(minutes=i) for i in range(3)
+] + [
+    datetime(2026, 3, 14, tzinfo=dt_timezone.utc) + timedelta(minutes=i) for i in range(2)
+]
+
+
+@override_settings(MEDIA_ACCEL_REDIRECT='', PRIVATE_RETENTION_DAYS=30)
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=f'{root}/media', ARCHIVE_ROOT=f'{root}/archives')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        archive._cache.clear()
+        self.addCleanup(archive._cache.clear)
+
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.room = Room.objects.create(name='general', created_by=self.alice, retention_days=30, is_private=True)
+        self.room.members.add(self.alice, self.bob)
+        self.file_name = default_storage.save('doc.pdf', ContentFile(b'%PDF-1.4 x', name='doc.pdf'))
+        for i, timestamp in enumerate(TIMESTAMPS):
+            message = Message.objects.create(
+                room=self.room, user=self.alice, content=f'm{i}', file=self.file_name if i == 0 else None,
+            )
+            Message.objects.filter(pk=message.pk).update(timestamp=timestamp)
+
+    def archive_room(self):
+        return archive.archive_room(self.room, now=NOW, batch_size=2)
+
+    def contents(self, page):
+        return [message.content for message in page]
+
+    def test_archive_in_batches_one_segment_per_month(self):
+        self.assertEqual(archive.archive_room(self.room, now=NOW, dry_run=True), 5)
+        self.assertEqual(self.archive_room(), 5)
+        self.assertEqual(self.contents(Message.objects.order_by('seq')), ['m5', 'm6'])
+        # Lots [m0 m1] [m2 m3] [m4]: le dernier s'ajoute au fichier de février
+        segments = list(ArchiveSegment.objects.order_by('first_ts'))
+        self.assertEqual([(s.path, s.count) for s in segments], [
+            (f'rooms/{self.room.id}/2026-01.ndjson.gz', 2),
+            (f'rooms/{self.room.id}/2026-02.ndjson.gz', 2),
+            (f'rooms/{self.room.id}/2026-02.ndjson.gz', 1),
+        ])
+        self.assertEqual(segments[2].offset, segments[1].length)
+        self.assertEqual([r['content'] for r in archive.read_segment(segments[2])], ['m4'])
+        self.assertEqual(self.archive_room(), 0)
+
+    def test_history_walks_across_archive_boundary(self):
+        self.archive_room()
+        seen, before = [], None
+        while True:
+            page, has_more = history.room_history(self.room, self.bob, before=before, limit=2)
+            seen = page + seen
+            if not has_more:
+                break
+            before = (page[0].timestamp, page[0].id)
+        self.assertEqual(self.contents(seen), [f'm{i}' for i in range(7)])
+        self.assertEqual([m.seq for m in seen], list(range(1, 8)))
+        self.assertEqual([getattr(m, 'archived', False) for m in seen], [True] * 5 + [False] * 2)
+
+        page, has_more = history.room_history(self.room, self.bob, after=(seen[0].timestamp, seen[0].id), limit=3)
+        self.assertEqual((self.contents(page), has_more), (['m1', 'm2', 'm3'], True))
+        page, has_more = history.room_history(self.room, self.bob, after=(page[-1].timestamp, page[-1].id), limit=3)
+        self.assertEqual((self.contents(page), has_more), (['m4', 'm5', 'm6'], False))
+
+    def test_hidden_at_filters_archived_messages(self):
+        self.archive_room()
+        HiddenConversation.objects.create(user=self.bob, room=self.room)
+        HiddenConversation.objects.filter(user=self.bob).update(hidden_at=TIMESTAMPS[3] + timedelta(seconds=30))
+        page, has_more = history.room_history(self.room, self.bob, limit=10)
+        self.assertEqual((self.contents(page), has_more), (['m4', 'm5', 'm6'], False))
+        page, _ = history.room_history(self.room, self.alice, limit=10)
+        self.assertEqual(len(page), 7)
+
+    def test_segments_are_cached(self):
+        self.archive_room()
+        first, second = ArchiveSegment.objects.order_by('first_ts')[:2]
+        with mock.patch.object(archive, 'CACHED_SEGMENTS', 1), \
+                mock.patch('chat.archive.gzip.decompress', wraps=gzip.decompress) as decompress:
+            archive.read_segment(first)
+            archive.read_segment(first)
+            self.assertEqual(decompress.call_count, 1)
+            # Taille 1: le second segment évince le premier
+            archive.read_segment(second)
+            archive.read_segment(first)
+            self.assertEqual(decompress.call_count, 3)
+
+    def test_read_before_and_after_rehydrate(self):
+        self.archive_room()
+        segments = archive.room_segments(self.room.id)
+        page = archive.read_before(segments, archive.rehydrate_room, limit=2)
+        self.assertEqual(self.contents(page), ['m3', 'm4'])
+        self.assertEqual(page[0].user, self.alice)
+        self.assertFalse(page[0]._state.adding)
+        page = archive.read_after(segments, archive.rehydrate_room, (TIMESTAMPS[0], 0), limit=2)
+        self.assertEqual(self.contents(page), ['m0', 'm1'])
+        self.assertEqual(page[0].file.name, self.file_name)
+        self.assertEqual(history.serialize_room_message(page[0])['archived'], True)
+
+    def test_archived_file_keeps_blob_and_access(self):
+        self.archive_room()
+        self.assertEqual(list(ArchivedFile.objects.values_list('name', flat=True)), [self.file_name])
+        # La référence de l'archive remplace celle du message supprimé
+        self.assertEqual(Blob.objects.get(pk=self.file_name).ref_count, 1)
+
+        self.client.force_login(self.bob)
+        response = self.client.get(f'/media/{self.file_name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 x')
+        self.client.force_login(User.objects.create_user('carol', password='x'))
+        self.assertEqual(self.client.get(f'/media/{self.file_name}').status_code, 404)
+
+    def test_search_excludes_archived_messages(self):
+        self.archive_room()
+        self.client.force_login(self.bob)
+        data = self.client.get('/search/', {'q': 'm0'}).json()
+        self.assertEqual((data['results'], data['includes_archived']), ([], False))
+
+    def test_archive_private_keeps_last_message_and_fixes_unread(self):
+        for i in range(4):
+            message = PrivateMessage.objects.create(sender=self.alice, receiver=self.bob, content=f'p{i}')
+            PrivateMessage.objects.filter(pk=message.pk).update(timestamp=TIMESTAMPS[i])
+        pair_key = PrivateMessage.make_pair_key(self.alice, self.bob)
+        self.assertEqual(Conversation.objects.get(pair_key=pair_key).unread_for(self.bob), 4)
+
+        self.assertEqual(archive.archive_private(pair_key, now=NOW, batch_size=2), 3)
+        # Le dernier message reste en base pour l'aperçu de la boîte de réception
+        self.assertEqual(list(PrivateMessage.objects.values_list('content', flat=True)), ['p3'])
+        self.assertEqual(Conversation.objects.get(pair_key=pair_key).unread_for(self.bob), 1)
+
+        page, has_more = history.private_history(self.bob, self.alice, limit=10)
+        self.assertEqual(([m.content for m in page], has_more), (['p0', 'p1', 'p2', 'p3'], False))
+        self.assertEqual([m.is_read for m in page[:3]], [True] * 3)
+        self.assertTrue(PrivateMessage.objects.get().is_read)
+        self.assertEqual(Conversation.objects.get(pair_key=pair_key).unread_for(self.bob), 0)
+
+        archive.delete_private_archive(pair_key)
+        self.assertFalse(ArchiveSegment.objects.filter(pair_key=pair_key).exists())
+        self.assertFalse(list(archive.unreferenced_files(min_age_hours=0)))
@@ -0,0 +1,53 @@
+import asyncio
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase
+
+from chat.batching import MessageBatcher
+from chat.models import Message, Room
+
+
+class MessageBatcherTests(TransactionTestCase):
+    """Écritures dans les threads de database_sync_to_async: TransactionTestCase."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.room = Room.objects.create(name='general', created_by=self.alice)
+
+    def batcher(self, **kwargs):
+        batcher = MessageBatcher(enabled=True, **kwargs)
+        self.addCleanup(lambda: batcher._task and batcher._task.cancel())
+        return batcher
+
+    def message(self, content, user=None):
+        return Message(room=self.room, user=user or self.alice, content=content)
+
+    async def test_bad_row_does_not_sink_the_batch(self):
+        batcher = self.batcher(window_ms=50, max_rows=10)
+        bad = Message(room=self.room, user_id=None, content='bad')
+        results = await asyncio.gather(
+            batcher.save(self.message('a')), batcher.save(bad), batcher.save(self.message('b')),
+            return_exceptions=True,
+        )
+        # Lot annulé puis chaque ligne réessayée seule
+        self.assertIsInstance(results[1], Exception)
+        self.assertTrue(results[0].pk and results[2].pk)
+        contents = [m.content async for m in Message.objects.order_by('seq')]
+        self.assertEqual(contents, ['a', 'b'])
+
+    async def test_max_rows_flushes_before_window(self):
+        batcher = self.batcher(window_ms=60_000, max_rows=2)
+        saved = await asyncio.wait_for(
+            asyncio.gather(batcher.save(self.message('a')), batcher.save(self.message('b'))), 5
+        )
+        self.assertEqual([m.seq for m in saved], [1, 2])
+
+    def test_flush_pending_sync_at_shutdown(self):
+        batcher = MessageBatcher(enabled=True)
+        # File laissée par une boucle déjà arrêtée (atexit)
+        batcher._pending.extend((self.message(c), None) for c in ('a', 'b'))
+        batcher.flush_pending_sync()
+        self.assertEqual(list(Message.objects.order_by('seq').values_list('content', flat=True)), ['a', 'b'])
+        self.assertFalse(batcher._pending)
+        batcher.flush_pending_sync()
+        self.assertEqual(Message.objects.count(), 2)
@@ -0,0 +1,94 @@
+import json
+from unittest import mock
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase, override_settings
+
+from chat import codec
+from chat.consumers import ChatConsumer
+from chat.metrics import WS_RECEIVE_DURATION
+from chat.models import Room
+from chat.outbound import WRITER_ERROR_CLOSE_CODE, make_resume_token
+from chat.routing import websocket_urlpatterns
+
+application = URLRouter(websocket_urlpatterns)
+
+
+async def drain(communicator, timeout=0.3):
+    frames = []
+    while not await communicator.receive_nothing(timeout=timeout):
+        frames.append(json.loads(await communicator.receive_from()))
+    return frames
+
+
+@override_settings(RATE_LIMITS={})
+class ConsumerTestCase(TransactionTestCase):
+    """Consumers réels via WebsocketCommunicator (helpers en threads: TransactionTestCase)."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.room = Room.objects.create(name='general', created_by=self.alice)
+        self.room.members.add(self.alice, self.bob)
+
+    async def connect(self, user, path='/ws/chat/room/general/'):
+        communicator = WebsocketCommunicator(application, path)
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await drain(communicator)
+        return communicator
+
+
+class MetricsLabelTests(ConsumerTestCase):
+
+    async def test_frames_decoded_once_and_labelled(self):
+        before = {label: WS_RECEIVE_DURATION.count('ChatConsumer', label)
+                  for label in ('heartbeat', 'other', 'invalid')}
+        communicator = await self.connect(self.alice)
+        with mock.patch('chat.codec.loads', wraps=codec.loads) as loads:
+            await communicator.send_to(text_data=json.dumps({'action': 'heartbeat'}))
+            await communicator.send_to(text_data=json.dumps({'action': 'inconnue'}))
+            await communicator.send_to(text_data='{pas du json')
+            await communicator.send_to(text_data='[1]')
+            frames = await drain(communicator)
+        self.assertEqual(loads.call_count, 4)
+        self.assertEqual(frames.count({'type': 'error', 'message': 'invalid json'}), 2)
+        self.assertIn({'type': 'error', 'message': 'invalid json'}, frames)
+        for label in ('heartbeat', 'other', 'invalid'):
+            expected = before[label] + (2 if label == 'invalid' else 1)
+            self.assertEqual(WS_RECEIVE_DURATION.count('ChatConsumer', label), expected, label)
+        await communicator.disconnect()
+
+
+class PrivateChatConsumerTests(ConsumerTestCase):
+
+    async def test_malformed_frame_keeps_connection_open(self):
+        communicator = await self.connect(self.alice, '/ws/chat/private/bob/')
+        for text in ('{pas du json', '[1]', '"hi"', '3'):
+            await communicator.send_to(text_data=text)
+            self.assertEqual(await drain(communicator), [{'type': 'error', 'message': 'invalid json'}])
+        await communicator.send_to(text_data=json.dumps({'type': 'message', 'message': 'salut'}))
+        frames = await drain(communicator)
+        self.assertEqual([f.get('message') for f in frames if f.get('type') == 'message'], ['salut'])
+        await communicator.disconnect()
+
+
+class OutboundWriterTests(ConsumerTestCase):
+
+    async def test_writer_error_closes_connection(self):
+        path = '/ws/chat/room/general/'
+        # Reprise après 'slow_consumer': la trame resync est construite par la tâche d'écriture
+        communicator = WebsocketCommunicator(application, f'{path}?resume={make_resume_token(self.alice.id, path)}')
+        communicator.scope['user'] = self.alice
+        with mock.patch.object(ChatConsumer, 'outbound_snapshot', side_effect=RuntimeError('boom')):
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            while True:
+                output = await communicator.receive_output(timeout=2)
+                if output['type'] == 'websocket.close':
+                    break
+        self.assertEqual(output['code'], WRITER_ERROR_CLOSE_CODE)
+        await communicator.disconnect()
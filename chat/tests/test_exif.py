@@ -0,0 +1,97 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from chat import imaging, thumbnails, uploads
+from chat.models import Blob, Message, Room
+
+ORIENTATION = 0x0112
+
+
+def jpeg_with_exif(orientation=6):
+    image = Image.new('RGB', (40, 20), (200, 30, 30))
+    exif = Image.Exif()
+    exif[ORIENTATION] = orientation
+    exif[0x010F] = 'Appareil'
+    output = io.BytesIO()
+    image.save(output, format='JPEG', exif=exif)
+    return output.getvalue()
+
+
+class StripExifTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media, UPLOAD_TEMP_DIR=f'{media}/uploads_tmp')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.alice = User.objects.create_user('alice', password='x')
+        self.room = Room.objects.create(name='general', created_by=self.alice)
+
+    def assertCleanBlob(self, name):
+        with default_storage.open(name, 'rb') as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertFalse(image.getexif())
+            # Orientation appliquée aux pixels
+            self.assertEqual(image.size, (20, 40))
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertIn(digest, name)
+        self.assertEqual(Blob.objects.get(pk=name).size, len(data))
+
+    def test_strip_exif_without_metadata_returns_none(self):
+        output = io.BytesIO()
+        Image.new('RGB', (4, 4)).save(output, format='PNG')
+        self.assertIsNone(imaging.strip_exif(output.getvalue()))
+
+    def test_single_upload_is_stripped_before_hashing(self):
+        self.client.force_login(self.alice)
+        response = self.client.post('/upload/', {
+            'room': 'general', 'file': SimpleUploadedFile('photo.jpg', jpeg_with_exif(), 'image/jpeg'),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertCleanBlob(Message.objects.get().image.name)
+
+    def test_chunked_upload_is_stripped_before_hashing(self):
+        data = jpeg_with_exif()
+        upload = uploads.start_upload(self.alice, 'photo.jpg', len(data), room=self.room)
+        uploads.write_chunk(upload, 0, io.BytesIO(data), len(data))
+        message = uploads.finalize_upload(upload)
+        self.assertCleanBlob(message.image.name)
+
+    def test_thumbnails_leave_original_untouched(self):
+        source = os.path.join(default_storage.location, 'photo.jpg')
+        with open(source, 'wb') as f:
+            f.write(jpeg_with_exif())
+        before = open(source, 'rb').read()
+        result = imaging.render_variants(source, os.path.join(default_storage.location, 'thumbs', 'photo'), (10,))
+        self.assertEqual((result['width'], result['height'], result['sizes']), (20, 40, [10]))
+        self.assertEqual(open(source, 'rb').read(), before)
+
+    def test_stored_image_stripped_into_new_blob(self):
+        # Image stockée avant le retrait à l'envoi
+        data = jpeg_with_exif()
+        old_name = default_storage.save('photo.jpg', SimpleUploadedFile('photo.jpg', data))
+        message = Message.objects.create(room=self.room, user=self.alice, content='x', image=old_name)
+        Message.objects.filter(pk=message.pk).update(image_variants={'200': {}})
+
+        new_name = thumbnails.strip_stored_image(old_name)
+        self.assertNotEqual(new_name, old_name)
+        self.assertCleanBlob(new_name)
+        message.refresh_from_db()
+        self.assertEqual((message.image.name, message.image_variants), (new_name, None))
+        self.assertEqual(Blob.objects.get(pk=old_name).ref_count, 0)
+        self.assertEqual(Blob.objects.get(pk=new_name).ref_count, 1)
+        # L'ancien blob n'a pas été réécrit
+        with default_storage.open(old_name, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertIsNone(thumbnails.strip_stored_image(new_name))
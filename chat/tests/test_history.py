@@ -0,0 +1,79 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chat.history import clamp_limit, decode_cursor, encode_cursor, paginate, MAX_PAGE_SIZE
+from chat.models import Message, PrivateMessage, Room
+
+
+class CursorTests(TestCase):
+
+    def test_round_trip_is_exact(self):
+        ts = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc)
+        self.assertEqual(encode_cursor(ts, 42), '1772368215123456-42')
+        self.assertEqual(decode_cursor(encode_cursor(ts, 42)), (ts, 42))
+
+    def test_invalid_cursor_is_ignored(self):
+        for cursor in (None, '', 'abc', '12', '12-x', 'x-12'):
+            self.assertIsNone(decode_cursor(cursor))
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(clamp_limit('10'), 10)
+        self.assertEqual(clamp_limit('0'), 1)
+        self.assertEqual(clamp_limit('100000'), MAX_PAGE_SIZE)
+        self.assertEqual(clamp_limit('abc', default=7), 7)
+
+
+class KeysetPaginationTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.room = Room.objects.create(name='general', created_by=self.alice)
+        for i in range(7):
+            Message.objects.create(room=self.room, user=self.alice, content=f'm{i}')
+        # Horodatages identiques: l'id départage
+        Message.objects.filter(room=self.room, content__in=['m2', 'm3', 'm4']).update(
+            timestamp=Message.objects.get(room=self.room, content='m2').timestamp
+        )
+        self.queryset = Message.objects.filter(room=self.room)
+
+    def contents(self, page):
+        return [msg.content for msg in page]
+
+    def test_latest_page_then_scrollback(self):
+        page, has_more = paginate(self.queryset, limit=3)
+        self.assertEqual((self.contents(page), has_more), (['m4', 'm5', 'm6'], True))
+        page, has_more = paginate(self.queryset, before=(page[0].timestamp, page[0].id), limit=3)
+        self.assertEqual((self.contents(page), has_more), (['m1', 'm2', 'm3'], True))
+        page, has_more = paginate(self.queryset, before=(page[0].timestamp, page[0].id), limit=3)
+        self.assertEqual((self.contents(page), has_more), (['m0'], False))
+
+    def test_after_cursor(self):
+        first = self.queryset.get(content='m1')
+        page, has_more = paginate(self.queryset, after=(first.timestamp, first.id), limit=3)
+        self.assertEqual((self.contents(page), has_more), (['m2', 'm3', 'm4'], True))
+        page, has_more = paginate(self.queryset, after=(page[-1].timestamp, page[-1].id), limit=3)
+        self.assertEqual((self.contents(page), has_more), (['m5', 'm6'], False))
+
+    def test_room_messages_view_walks_history(self):
+        self.client.force_login(self.alice)
+        seen, before = [], ''
+        while True:
+            data = self.client.get(f'/room/general/messages/?limit=2&before={before}').json()
+            seen = [m['message'] for m in data['messages']] + seen
+            if not data['has_more']:
+                break
+            before = data['before_cursor']
+        self.assertEqual(seen, [f'm{i}' for i in range(7)])
+
+    def test_private_history_marks_only_returned_page_read(self):
+        for i in range(4):
+            PrivateMessage.objects.create(sender=self.bob, receiver=self.alice, content=f'p{i}')
+        self.client.force_login(self.alice)
+        data = self.client.get('/private/bob/messages/?limit=2').json()
+        self.assertEqual([m['message'] for m in data['messages']], ['p2', 'p3'])
+        self.assertTrue(data['has_more'])
+        read = PrivateMessage.objects.filter(is_read=True).values_list('content', flat=True)
+        self.assertEqual(sorted(read), ['p2', 'p3'])
@@ -0,0 +1,74 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from chat.media import IMMUTABLE_CACHE, REVALIDATE_CACHE
+from chat.models import Message, Room
+from chat.thumbnails import variant_base
+
+DATA = b'%PDF-1.4\n' + b'x' * 1000
+
+
+@override_settings(MEDIA_ACCEL_REDIRECT='')
+class ServeMediaTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.alice = User.objects.create_user('alice', password='x')
+        room = Room.objects.create(name='general', created_by=self.alice)
+        self.name = default_storage.save('doc.pdf', ContentFile(DATA, name='doc.pdf'))
+        Message.objects.create(room=room, user=self.alice, content='x', file=self.name)
+        self.client.force_login(self.alice)
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', headers=headers)
+
+    def test_blob_etag_is_content_hash_and_cached_immutable(self):
+        response = self.get(self.name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), DATA)
+        self.assertEqual(response['ETag'], f'"{hashlib.sha256(DATA).hexdigest()}"')
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE)
+
+        # Même ETag après un touch: le contenu n'a pas changé
+        os.utime(default_storage.path(self.name), (1, 1))
+        response = self.get(self.name, if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_thumbnail_is_revalidated(self):
+        # Écrite par le pool de thumbnails.py, hors du stockage par contenu
+        thumbnail = f'{variant_base(self.name)}_200.jpg'
+        os.makedirs(os.path.dirname(default_storage.path(thumbnail)))
+        with open(default_storage.path(thumbnail), 'wb') as f:
+            f.write(b'jpeg')
+        response = self.get(thumbnail)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], REVALIDATE_CACHE)
+        self.assertRegex(response['ETag'], r'^"[0-9a-f]+-[0-9a-f]+"$')
+
+    def test_range_and_if_range(self):
+        etag = f'"{hashlib.sha256(DATA).hexdigest()}"'
+        response = self.get(self.name, range='bytes=0-3', if_range=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), DATA[:4])
+        self.assertEqual(response['Content-Range'], f'bytes 0-3/{len(DATA)}')
+
+        response = self.get(self.name, range='bytes=0-3', if_range='"autre"')
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(self.get(self.name, range=f'bytes={len(DATA)}-').status_code, 416)
+
+    def test_unknown_user_gets_404(self):
+        self.client.force_login(User.objects.create_user('bob', password='x'))
+        Room.objects.filter(name='general').update(is_private=True)
+        self.assertEqual(self.get(self.name).status_code, 404)
@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+
+class MetricsAccessTests(TestCase):
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_loopback_refused_outside_debug(self):
+        # Derrière un proxy toutes les requêtes arrivent de 127.0.0.1
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret', DEBUG=True)
+    def test_token_or_staff(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
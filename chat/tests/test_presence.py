@@ -0,0 +1,99 @@
+import time
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from chat.models import UserProfile
+from chat.presence import SLOT_PREFIX, PresenceTracker
+
+
+@override_settings(PRESENCE_STORE='memory')
+class LocalPresenceTests(TestCase):
+
+    def test_usernames_forgotten_on_expiry(self):
+        tracker = PresenceTracker(ttl=10)
+        tracker.connect('c1', 1, 'alice', room_id=7, group='g7')
+        tracker.connect('c2', 1, 'alice', room_id=7, group='g7')
+        tracker.disconnect('c1')
+        self.assertEqual(tracker._usernames, {1: 'alice'})
+        self.assertEqual(tracker.expire(time.monotonic() + 60), 1)
+        self.assertEqual(tracker._usernames, {})
+        self.assertFalse(tracker.is_online(1))
+
+    def test_left_username_broadcast_after_expiry(self):
+        tracker = PresenceTracker(ttl=10)
+        tracker.connect('c1', 1, 'alice', room_id=7, group='g7')
+        tracker.collect_deltas()
+        tracker.expire(time.monotonic() + 60)
+        [(group, event)] = tracker.collect_deltas()
+        self.assertEqual(group, 'g7')
+        self.assertIn('"left":["alice"]', event['frame'])
+
+
+@override_settings(PRESENCE_STORE='cache', PRESENCE_MAX_WORKERS=4)
+class SharedPresenceTests(TestCase):
+    """Deux trackers sur le même cache simulent deux processus."""
+
+    def setUp(self):
+        self.store = caches['default']
+        self.store.clear()
+        self.first = PresenceTracker(store=self.store, worker_id='w1')
+        self.second = PresenceTracker(store=self.store, worker_id='w2')
+
+    def publish(self):
+        for tracker in (self.first, self.second, self.first):
+            async_to_sync(tracker.publish)()
+
+    def test_online_count_spans_processes(self):
+        self.first.connect('a', 1, 'alice', room_id=7, group='g7')
+        self.second.connect('b', 2, 'bob', room_id=7, group='g7')
+        self.second.connect('c', 1, 'alice', room_id=7, group='g7')
+        self.publish()
+        for tracker in (self.first, self.second):
+            self.assertEqual(tracker.online_count(7), 2)
+            self.assertEqual(tracker.online_user_ids(7), {1, 2})
+            self.assertTrue(tracker.is_online(2))
+
+    def test_only_leader_broadcasts(self):
+        self.first.connect('a', 1, 'alice', room_id=7, group='g7')
+        self.second.connect('b', 2, 'bob', room_id=7, group='g7')
+        self.publish()
+        self.assertTrue(self.first._leader)
+        self.assertFalse(self.second._leader)
+        self.assertEqual(self.second.collect_deltas(), [])
+        [(group, event)] = self.first.collect_deltas()
+        self.assertEqual(group, 'g7')
+        self.assertIn('"joined":["alice","bob"]', event['frame'])
+
+    def test_flush_keeps_user_connected_elsewhere_online(self):
+        alice = User.objects.create_user('alice', password='x')
+        profile = UserProfile.objects.get_or_create(user=alice)[0]
+        self.first.connect('a', alice.id, 'alice')
+        self.second.connect('b', alice.id, 'alice')
+        self.publish()
+        self.first.flush()
+        self.second.flush()
+        self.first.disconnect('a')
+        self.publish()
+        self.first.flush()
+        self.second.flush()
+        profile.refresh_from_db()
+        self.assertTrue(profile.is_online)
+
+        self.second.disconnect('b')
+        self.publish()
+        self.first.flush()
+        profile.refresh_from_db()
+        self.assertFalse(profile.is_online)
+
+    def test_dead_process_expires_with_its_entry(self):
+        self.second.connect('b', 2, 'bob', room_id=7, group='g7')
+        self.publish()
+        self.assertEqual(self.first.online_count(7), 1)
+        # Processus tué: plus de publication, l'entrée expire après PRESENCE_TTL
+        self.store.delete(f'{SLOT_PREFIX}{self.second._slot}')
+        async_to_sync(self.first.publish)()
+        self.assertEqual(self.first.online_count(7), 0)
+        self.assertFalse(self.first.is_online(2))
@@ -0,0 +1,28 @@
+from django.test import TestCase
+
+from chat.query_plans import QueryPlanChecker
+
+
+class QueryPlanTests(TestCase):
+    """Chaque requête des chemins chauds passe par un index (EXPLAIN QUERY PLAN)."""
+
+    def test_hot_paths_use_indexes(self):
+        checker = QueryPlanChecker()
+        checker.setup_data()
+        for name, run, allowed_scans in checker.scenarios():
+            with self.subTest(scenario=name):
+                scenario = checker.check_scenario(name, run, allowed_scans)
+                self.assertTrue(scenario['queries'], "aucune requête enregistrée")
+                self.assertEqual(
+                    [f"{v['problem']}: {v['sql']} -> {' | '.join(v['plan'])}" for v in scenario['violations']],
+                    [],
+                )
+
+    def test_full_scan_and_memory_sort_are_detected(self):
+        checker = QueryPlanChecker()
+        self.assertEqual(checker.problems(['SCAN chat_message'], set()), ['parcours complet de chat_message'])
+        self.assertEqual(checker.problems(['SCAN auth_user'], {'auth_user'}), [])
+        self.assertEqual(
+            checker.problems(['SEARCH chat_message USING INDEX x (room_id=?)', 'USE TEMP B-TREE FOR ORDER BY'], set()),
+            ['tri en mémoire de chat_message'],
+        )
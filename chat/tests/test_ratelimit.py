@@ -0,0 +1,100 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+
+from chat.ratelimit import CacheStore, MemoryStore, RateLimiter, rate_limiter
+from chat.tests.test_consumers import ConsumerTestCase, drain
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class GCRATests(SimpleTestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = MemoryStore()
+        self.store.clock = self.clock
+        self.limiter = RateLimiter({
+            'message': {'user': (2, 3), 'room': (10, 4)},
+            'default': {'user': (1, 1)},
+        }, self.store)
+
+    def hit(self, action='message', **idents):
+        return async_to_sync(self.limiter.hit)(action, **idents)
+
+    def test_burst_then_refill_at_rate(self):
+        for _ in range(3):
+            self.assertIsNone(self.hit(user=1))
+        scope, retry_after = self.hit(user=1)
+        self.assertEqual(scope, 'user')
+        self.assertAlmostEqual(retry_after, 0.5)
+        # Un jeton toutes les 1 / rate secondes
+        self.clock.now += 0.5
+        self.assertIsNone(self.hit(user=1))
+        self.assertIsNotNone(self.hit(user=1))
+
+    def test_refused_action_debits_no_bucket(self):
+        for user in (1, 2, 3, 4):
+            self.assertIsNone(self.hit(user=user, room=9))
+        # Salon plein: l'utilisateur 5 est refusé et son seau n'est pas débité
+        self.assertEqual(self.hit(user=5, room=9)[0], 'room')
+        self.clock.now += 0.1
+        for _ in range(3):
+            self.assertIsNone(self.hit(user=5))
+
+    def test_users_and_default_rule_are_independent(self):
+        for _ in range(3):
+            self.hit(user=1)
+        self.assertIsNone(self.hit(user=2))
+        self.assertIsNone(self.hit('typing', user=1))
+        self.assertEqual(self.hit('typing', user=1)[0], 'user')
+        # Identifiant absent ou portée sans règle: pas de seau
+        self.assertIsNone(self.hit('typing', room=3))
+
+    def test_full_buckets_are_evicted(self):
+        self.hit(user=1)
+        self.hit(user=2, room=9)
+        self.assertEqual(len(self.store), 3)
+        self.clock.now += 10
+        self.hit(user=3)
+        self.assertEqual(len(self.store), 1)
+
+
+class CacheStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_buckets_shared_through_cache(self):
+        rules = {'message': {'user': (1, 2)}}
+        first, second = RateLimiter(rules, CacheStore()), RateLimiter(rules, CacheStore())
+        self.assertIsNone(async_to_sync(first.hit)('message', user=1))
+        self.assertIsNone(async_to_sync(second.hit)('message', user=1))
+        self.assertEqual(async_to_sync(first.hit)('message', user=1)[0], 'user')
+
+
+@override_settings(RATE_LIMITS={'message': {'user': (0.01, 2)}, 'default': {'user': (5, 20)}})
+class ThrottledConsumerTests(ConsumerTestCase):
+
+    async def test_rate_limited_frame(self):
+        # Règles lues une fois: le limiteur global relit celles du test
+        rate_limiter._rules, rate_limiter._store = None, MemoryStore()
+        self.addCleanup(setattr, rate_limiter, '_rules', None)
+        communicator = await self.connect(self.alice)
+        for i in range(3):
+            await communicator.send_to(text_data=json.dumps({'action': 'message', 'message': f'm{i}'}))
+        frames = await drain(communicator)
+        self.assertEqual(len([f for f in frames if f['type'] == 'message']), 2)
+        [error] = [f for f in frames if f['type'] == 'error']
+        self.assertEqual((error['code'], error['action'], error['scope']), ('rate_limited', 'message', 'user'))
+        self.assertGreater(error['retry_after'], 0)
+        await communicator.disconnect()
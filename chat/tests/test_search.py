@@ -0,0 +1,63 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+
+from chat import search
+from chat.models import Message, PrivateMessage, Room
+
+
+class BuildMatchTests(TestCase):
+
+    def test_operators_are_quoted(self):
+        # Guillemets, OR et * de la saisie ne deviennent pas des opérateurs FTS5
+        self.assertEqual(search.build_match('"a" OR b*'), '"a" "OR" "b"*')
+        self.assertEqual(search.build_match('NEAR(x y)'), '"NEAR" "x" "y"*')
+        self.assertIsNone(search.build_match('"* -'))
+
+
+class SearchMessagesTests(TestCase):
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.carol = User.objects.create_user('carol', password='x')
+        self.room = Room.objects.create(name='general', created_by=self.alice)
+        self.room.members.add(self.alice, self.bob)
+        Message.objects.create(room=self.room, user=self.alice, content='<b>réunion</b> demain')
+        PrivateMessage.objects.create(sender=self.alice, receiver=self.bob, content='réunion privée')
+
+    def kinds(self, user, query='reunion'):
+        results, _ = search.search_messages(user, query)
+        return sorted(result['kind'] for result in results)
+
+    def test_membership_and_participants_filter(self):
+        self.assertEqual(self.kinds(self.bob), ['private', 'room'])
+        # Ni membre du salon, ni participant de la conversation
+        self.assertEqual(self.kinds(self.carol), [])
+        self.room.members.add(self.carol)
+        self.assertEqual(self.kinds(self.carol), ['room'])
+
+    def test_snippet_is_escaped(self):
+        [result] = [r for r in search.search_messages(self.alice, 'réu')[0] if r['kind'] == 'room']
+        self.assertEqual(result['snippet'], '&lt;b&gt;<mark>réunion</mark>&lt;/b&gt; demain')
+
+    def test_search_view(self):
+        self.client.force_login(self.bob)
+        data = self.client.get('/search/', {'q': '"réunion"'}).json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(len(data['results']), 2)
+        self.assertEqual(self.client.get('/search/', {'q': ' '}).status_code, 400)
+
+    def test_ensure_index_recreates_triggers(self):
+        # Comme après une migration qui reconstruit chat_message (copie + renommage)
+        with connection.cursor() as cursor:
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER chat_message_fts_{suffix}')
+        Message.objects.create(room=self.room, user=self.bob, content='réunion perdue')
+        self.assertEqual(len(search.search_messages(self.bob, 'perdue')[0]), 0)
+
+        self.assertEqual(search.ensure_index(), ['chat_message_fts'])
+        self.assertEqual(len(search.search_messages(self.bob, 'perdue')[0]), 1)
+        Message.objects.filter(content='réunion perdue').update(content='réunion retrouvée')
+        self.assertEqual(len(search.search_messages(self.bob, 'retrouvée')[0]), 1)
+        self.assertEqual(search.ensure_index(), [])
@@ -0,0 +1,120 @@
+import json
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from chat.models import Message
+from chat.streams import RoomStreams, room_streams
+from chat.tests.test_consumers import ConsumerTestCase, drain
+
+
+class RoomStreamsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.streams = RoomStreams(size=4, max_rooms=2)
+
+    def record(self, room_id, *seqs):
+        for seq in seqs:
+            self.streams.record(room_id, seq, seq, f'{{"seq":{seq}}}')
+
+    def test_frames_after_covered_range(self):
+        self.record(1, 1, 2, 3)
+        self.assertEqual(self.streams.frames_after(1, 1, 3), ['{"seq":2}', '{"seq":3}'])
+        self.assertEqual(self.streams.frames_after(1, 3, 3), [])
+        # Messages plus récents que le tampon: None (base)
+        self.assertIsNone(self.streams.frames_after(1, 1, 4))
+
+    def test_ring_buffer_keeps_last_entries(self):
+        self.record(1, 1, 2, 3, 4, 5, 6)
+        self.assertIsNone(self.streams.frames_after(1, 1, 6))
+        self.assertEqual(len(self.streams.frames_after(1, 2, 6)), 4)
+
+    def test_gap_clears_buffer(self):
+        self.record(1, 1, 2, 3, 5, 6)
+        self.assertIsNone(self.streams.frames_after(1, 3, 6))
+        self.assertEqual(self.streams.frames_after(1, 4, 6), ['{"seq":5}', '{"seq":6}'])
+        # Trame en retard ou en double: ignorée
+        self.record(1, 4, 6)
+        self.assertEqual(self.streams.frames_after(1, 4, 6), ['{"seq":5}', '{"seq":6}'])
+
+    def test_forgotten_message_not_replayed(self):
+        self.record(1, 1, 2, 3)
+        self.streams.forget(1, 2)
+        self.assertEqual(self.streams.frames_after(1, 0, 3), ['{"seq":1}', '{"seq":3}'])
+
+    def test_least_recent_room_dropped(self):
+        self.record(1, 1)
+        self.record(2, 1)
+        self.record(1, 2)
+        self.record(3, 1)
+        self.assertEqual(list(self.streams._rooms), [1, 3])
+
+
+class ResumeTests(ConsumerTestCase):
+
+    def setUp(self):
+        super().setUp()
+        room_streams._rooms.clear()
+        self.buffer_results = []
+
+    def frames_after(self, *args):
+        result = RoomStreams.frames_after(room_streams, *args)
+        self.buffer_results.append(result)
+        return result
+
+    async def resume(self, communicator, after_seq):
+        with mock.patch.object(room_streams, 'frames_after', self.frames_after):
+            await communicator.send_to(text_data=json.dumps({'action': 'resume', 'after_seq': after_seq}))
+            return [f for f in await drain(communicator) if f['type'] != 'presence']
+
+    async def post_missed_messages(self):
+        """alice écrit 6 messages; bob, déconnecté après le 3e, en manque 3 dont un supprimé."""
+        alice = await self.connect(self.alice)
+        bob = await self.connect(self.bob)
+        for i in range(6):
+            await alice.send_to(text_data=json.dumps({'action': 'message', 'message': f'm{i}'}))
+            if i == 2:
+                await drain(bob)
+                await bob.disconnect()
+        await drain(alice)
+        deleted = await Message.objects.aget(seq=5)
+        await alice.send_to(text_data=json.dumps({'action': 'delete_message', 'message_id': deleted.id}))
+        await drain(alice)
+        return alice
+
+    async def test_resume_from_ring_buffer(self):
+        alice = await self.post_missed_messages()
+        bob = await self.connect(self.bob)
+        [frame] = await self.resume(bob, 3)
+        self.assertIsNotNone(self.buffer_results[-1])
+        self.assertEqual(frame['type'], 'resumed')
+        self.assertEqual([m['seq'] for m in frame['messages']], [4, 6])
+        self.assertEqual(frame['last_seq'], 6)
+
+        [frame] = await self.resume(bob, 6)
+        self.assertEqual(frame['messages'], [])
+        for communicator in (alice, bob):
+            await communicator.disconnect()
+
+    async def test_resume_from_database(self):
+        alice = await self.post_missed_messages()
+        # Autre processus ou redémarrage: tampon vide
+        room_streams._rooms.clear()
+        bob = await self.connect(self.bob)
+        [frame] = await self.resume(bob, 3)
+        self.assertIsNone(self.buffer_results[-1])
+        self.assertEqual([m['seq'] for m in frame['messages']], [4, 6])
+        self.assertEqual([m['message'] for m in frame['messages']], ['m3', 'm5'])
+
+        with override_settings(RESUME_MAX_MESSAGES=2):
+            [frame] = await self.resume(bob, 0)
+        self.assertEqual(frame['type'], 'resync')
+        for communicator in (alice, bob):
+            await communicator.disconnect()
+
+    async def test_invalid_after_seq(self):
+        communicator = await self.connect(self.bob)
+        for after_seq in ('x', -1, True):
+            self.assertEqual(await self.resume(communicator, after_seq),
+                             [{'type': 'error', 'message': 'invalid after_seq'}])
+        await communicator.disconnect()
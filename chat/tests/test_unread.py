@@ -0,0 +1,120 @@
+import importlib
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.test import TestCase, TransactionTestCase
+
+from chat.models import Message, Room, RoomReadState
+from chat.unread import UnreadCounterStore
+
+backfill = importlib.import_module('chat.migrations.0011_backfill_room_read_state')
+
+
+class UnreadCountTests(TestCase):
+    """Non lus = Room.last_seq - RoomReadState.last_read_seq."""
+
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='x')
+        self.bob = User.objects.create_user('bob', password='x')
+        self.room = Room.objects.create(name='general', created_by=self.alice)
+
+    def post(self, user, content='salut'):
+        return Message.objects.create(room=self.room, user=user, content=content)
+
+    def unread(self, user):
+        self.room.refresh_from_db()
+        return self.room.unread_count_for_user(user)
+
+    def test_seq_increments_per_room(self):
+        other = Room.objects.create(name='autre', created_by=self.alice)
+        first, second = self.post(self.alice), self.post(self.bob)
+        elsewhere = Message.objects.create(room=other, user=self.alice, content='x')
+        self.assertEqual((first.seq, second.seq, elsewhere.seq), (1, 2, 1))
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.last_seq, 2)
+
+    def test_unread_is_room_seq_minus_read_seq(self):
+        for _ in range(3):
+            self.post(self.alice)
+        self.assertEqual(self.unread(self.bob), 3)
+        RoomReadState.mark_read(self.bob, self.room, 2)
+        self.assertEqual(self.unread(self.bob), 1)
+        # Le marqueur ne recule jamais
+        RoomReadState.mark_read(self.bob, self.room, 1)
+        self.assertEqual(self.unread(self.bob), 1)
+        RoomReadState.mark_read(self.bob, self.room)
+        self.assertEqual(self.unread(self.bob), 0)
+
+    def test_own_message_read_when_caught_up(self):
+        self.post(self.alice)
+        self.assertEqual(self.unread(self.alice), 0)
+        RoomReadState.mark_read(self.bob, self.room)
+        self.post(self.bob)
+        self.assertEqual(self.unread(self.bob), 0)
+
+    def test_own_message_does_not_mark_earlier_messages_read(self):
+        self.post(self.alice)
+        self.post(self.alice)
+        self.post(self.bob)
+        # bob n'avait rien lu: les deux messages d'alice restent non lus
+        self.assertEqual(self.unread(self.bob), 3)
+
+    def test_bulk_insert_matches_save(self):
+        RoomReadState.mark_read(self.bob, self.room, 0)
+        Message.bulk_insert([
+            Message(room=self.room, user=self.bob, content='1'),
+            Message(room=self.room, user=self.bob, content='2'),
+            Message(room=self.room, user=self.alice, content='3'),
+            Message(room=self.room, user=self.bob, content='4'),
+        ])
+        # bob suit ses deux premiers messages, pas celui d'alice;
+        # alice n'avait rien lu, son message n'y change rien
+        self.assertEqual(self.unread(self.bob), 2)
+        self.assertEqual(self.unread(self.alice), 4)
+
+    def test_counter_store_follows_database_rules(self):
+        store = UnreadCounterStore()
+        store.record_message(self.room.id, 1, self.alice.id)
+        store.record_message(self.room.id, 2, self.bob.id)
+        store.record_message(self.room.id, 2, self.bob.id)  # autre connexion du processus
+        self.assertEqual(store.count(self.room.id, self.alice.id), 1)
+        self.assertEqual(store.count(self.room.id, self.bob.id), 2)
+        store.mark_read(self.room.id, self.bob.id)
+        store.record_message(self.room.id, 3, self.bob.id)
+        self.assertEqual(store.count(self.room.id, self.bob.id), 0)
+
+
+class MessageReadMigrationTests(TransactionTestCase):
+    """0011: les lignes MessageRead deviennent un marqueur par (utilisateur, salon)."""
+
+    def setUp(self):
+        self.old_apps = MigrationLoader(connection).project_state(
+            ('chat', '0011_backfill_room_read_state')
+        ).apps
+        self.MessageRead = self.old_apps.get_model('chat', 'MessageRead')
+        with connection.schema_editor() as editor:
+            editor.create_model(self.MessageRead)
+
+    def tearDown(self):
+        with connection.schema_editor() as editor:
+            editor.delete_model(self.MessageRead)
+
+    def test_collapse_message_reads(self):
+        alice = User.objects.create_user('alice', password='x')
+        bob = User.objects.create_user('bob', password='x')
+        room = Room.objects.create(name='general', created_by=alice)
+        other = Room.objects.create(name='autre', created_by=alice)
+        messages = [Message.objects.create(room=room, user=alice, content=str(i)) for i in range(4)]
+        Message.objects.create(room=other, user=bob, content='x')
+        RoomReadState.objects.all().delete()
+        for message in messages[:3]:
+            self.MessageRead.objects.create(user_id=bob.id, message_id=message.id)
+
+        backfill.collapse_message_reads(self.old_apps, None)
+
+        watermarks = {
+            (state.user_id, state.room_id): state.last_read_seq for state in RoomReadState.objects.all()
+        }
+        # Plus grand seq lu, ou envoyé par l'utilisateur
+        self.assertEqual(watermarks, {(bob.id, room.id): 3, (alice.id, room.id): 4, (bob.id, other.id): 1})
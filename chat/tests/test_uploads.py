@@ -0,0 +1,112 @@
+import hashlib
+import io
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from chat import uploads
+from chat.models import ChunkedUpload, Message, Room
+
+DATA = b'%PDF-1.4\n' + bytes(range(256)) * 4
+
+
+class ChunkedUploadTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=media, UPLOAD_TEMP_DIR=f'{media}/uploads_tmp')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.alice = User.objects.create_user('alice', password='x')
+        self.room = Room.objects.create(name='general', created_by=self.alice)
+
+    def start(self, **kwargs):
+        return uploads.start_upload(self.alice, 'doc.pdf', len(DATA), room=self.room, **kwargs)
+
+    def write(self, upload, offset, end):
+        return uploads.write_chunk(upload, offset, io.BytesIO(DATA[offset:end]), end - offset)
+
+    def test_chunks_must_follow_confirmed_offset(self):
+        upload = self.start()
+        self.assertEqual(self.write(upload, 0, 400), 400)
+        with self.assertRaises(uploads.UploadError) as error:
+            self.write(upload, 200, 600)
+        self.assertEqual((error.exception.status, error.exception.offset), (409, 400))
+        # Reprise depuis un autre objet (autre requête): hash recalculé depuis le disque
+        uploads._forget_hasher(upload)
+        self.assertEqual(self.write(ChunkedUpload.objects.get(pk=upload.pk), 400, len(DATA)), len(DATA))
+
+    def test_interrupted_chunk_keeps_received_bytes(self):
+        upload = self.start()
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.write_chunk(upload, 0, io.BytesIO(DATA[:100]), 300)
+        self.assertEqual((error.exception.status, error.exception.offset), (400, 100))
+        self.assertEqual(ChunkedUpload.objects.get(pk=upload.pk).received, 100)
+
+    def test_chunk_past_announced_size_is_refused(self):
+        upload = self.start()
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.write_chunk(upload, 0, io.BytesIO(DATA + b'x'), len(DATA) + 1)
+        self.assertEqual(error.exception.status, 400)
+
+    def test_finalize_creates_message_and_removes_upload(self):
+        upload = self.start(sha256=hashlib.sha256(DATA).hexdigest())
+        self.write(upload, 0, len(DATA))
+        message = uploads.finalize_upload(upload)
+        self.assertIsInstance(message, Message)
+        self.assertTrue(message.file.name.endswith('.pdf'))
+        with message.file.open('rb') as f:
+            self.assertEqual(f.read(), DATA)
+        self.assertFalse(ChunkedUpload.objects.filter(pk=upload.pk).exists())
+
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.finalize_upload(upload)
+        self.assertEqual(error.exception.status, 409)
+
+    def test_finalize_incomplete_upload(self):
+        upload = self.start()
+        self.write(upload, 0, 100)
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.finalize_upload(upload)
+        self.assertEqual((error.exception.status, error.exception.offset), (409, 100))
+
+    def test_concurrent_finalize_gets_409(self):
+        upload = self.start()
+        self.write(upload, 0, len(DATA))
+        # Une autre requête a déjà réservé l'envoi
+        ChunkedUpload.objects.filter(pk=upload.pk).update(status=ChunkedUpload.FINALIZING)
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.finalize_upload(ChunkedUpload.objects.get(pk=upload.pk))
+        self.assertEqual(error.exception.status, 409)
+        self.assertFalse(Message.objects.exists())
+
+    def test_no_chunk_while_finalizing(self):
+        upload = self.start()
+        self.write(upload, 0, 100)
+        ChunkedUpload.objects.filter(pk=upload.pk).update(status=ChunkedUpload.FINALIZING)
+        with self.assertRaises(uploads.UploadError) as error:
+            self.write(ChunkedUpload.objects.get(pk=upload.pk), 100, 200)
+        self.assertEqual(error.exception.status, 409)
+
+    def test_bad_checksum_rejects_upload(self):
+        upload = self.start(sha256='0' * 64)
+        self.write(upload, 0, len(DATA))
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.finalize_upload(upload)
+        self.assertEqual(error.exception.status, 422)
+        self.assertFalse(ChunkedUpload.objects.filter(pk=upload.pk).exists())
+
+    def test_refused_finalize_can_be_retried(self):
+        upload = self.start()
+        self.write(upload, 0, len(DATA))
+        self.room.is_private = True
+        self.room.save()
+        with self.assertRaises(uploads.UploadError) as error:
+            uploads.finalize_upload(upload)
+        self.assertEqual(error.exception.status, 403)
+        self.assertEqual(ChunkedUpload.objects.get(pk=upload.pk).status, ChunkedUpload.UPLOADING)
+        self.room.members.add(self.alice)
+        self.assertIsInstance(uploads.finalize_upload(upload), Message)
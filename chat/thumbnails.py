@@ -0,0 +1,145 @@
+"""
+Miniatures des images partagées, générées hors du fil des requêtes.
+
+À la création d'un message avec image (signal post_save, après commit),
+schedule() confie le travail à un ProcessPoolExecutor (THUMBNAIL_WORKERS
+processus, démarrés à la première image): décodage et redimensionnement
+Pillow ne prennent ni le GIL du serveur ni un worker HTTP. Le pool écrit
+<dossier>/thumbs/<nom>_<taille>.webp / .jpg (imaging.render_variants) sans
+modifier l'original: l'EXIF est retiré avant le stockage (uploads.py).
+
+Au retour (thread de rappel du pool), les dimensions et les noms des
+miniatures sont enregistrés sur le message, puis un événement image_ready
+est diffusé sur le groupe du salon ou de la conversation: les clients
+remplacent l'original affiché par la miniature.
+
+Les images déjà en base se traitent avec `python manage.py generate_thumbnails`
+(--strip-metadata: EXIF des images stockées avant son retrait à l'envoi).
+"""
+import multiprocessing
+import os
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import connection
+
+from . import imaging, notifications
+from .models import Message, PrivateMessage
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: pas de fork d'un processus qui a des threads (serveur ASGI)
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def variant_base(image_name):
+    """chat_images/photo.jpg -> chat_images/thumbs/photo (nom de stockage)."""
+    directory, filename = os.path.split(image_name)
+    return os.path.join(directory, 'thumbs', os.path.splitext(filename)[0])
+
+
+def submit(message, executor=None):
+    """Envoie l'image de message au pool. Renvoie le Future, ou None si rien à faire."""
+    if not message.image:
+        return None
+    try:
+        source = default_storage.path(message.image.name)
+        target = default_storage.path(variant_base(message.image.name))
+    except NotImplementedError:
+        # Stockage distant: pas de chemin local à traiter
+        return None
+    return (executor or get_executor()).submit(
+        imaging.render_variants, source, target, tuple(settings.THUMBNAIL_SIZES)
+    )
+
+
+def schedule(message):
+    """Appelé après commit: une erreur ici ne doit pas faire échouer l'envoi."""
+    global _executor
+    try:
+        future = submit(message)
+    except BrokenProcessPool as e:
+        # Un processus du pool est mort: le prochain appel en recrée un
+        with _executor_lock:
+            _executor = None
+        print(f"Erreur miniatures {message.image.name}: {e}")
+        return None
+    except Exception as e:
+        print(f"Erreur miniatures {message.image.name}: {e}")
+        return None
+    if future is not None:
+        model, pk, image_name = type(message), message.pk, message.image.name
+        future.add_done_callback(lambda f: _on_done(model, pk, image_name, f))
+    return future
+
+
+def _on_done(model, pk, image_name, future):
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"Erreur miniatures {image_name}: {e}")
+        return
+    try:
+        message = store(model, pk, image_name, result)
+        if message is not None:
+            notifications.broadcast_image_ready(message)
+    except Exception as e:
+        print(f"Erreur enregistrement miniatures {image_name}: {e}")
+    finally:
+        # Thread du pool: la connexion ne doit pas rester ouverte entre deux images
+        connection.close()
+
+
+def store(model, pk, image_name, result):
+    """Enregistre dimensions et miniatures. Renvoie le message à jour (None s'il a disparu)."""
+    base = variant_base(image_name)
+    variants = {
+        str(size): {'webp': f'{base}_{size}.webp', 'jpeg': f'{base}_{size}.jpg'}
+        for size in result['sizes']
+    }
+    updated = model.objects.filter(pk=pk, image=image_name).update(
+        image_width=result['width'], image_height=result['height'], image_variants=variants,
+    )
+    if not updated:
+        return None
+    related = ('room', 'user') if model is Message else ('sender', 'receiver')
+    return model.objects.select_related(*related).get(pk=pk)
+
+
+def strip_stored_image(image_name, executor=None):
+    """
+    Image stockée avec son EXIF: la version sans EXIF devient un nouveau blob
+    et les messages qui l'affichaient pointent dessus (compteurs de
+    références ajustés par les triggers, miniatures à régénérer). L'ancien
+    blob n'est jamais réécrit; le ramasse-miettes le supprime une fois sans
+    référence. Renvoie le nouveau nom, ou None si rien à retirer.
+    """
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    tmp_path = os.path.join(settings.UPLOAD_TEMP_DIR, f'{uuid.uuid4().hex}.strip')
+    try:
+        source = default_storage.path(image_name)
+        if not (executor or get_executor()).submit(imaging.strip_exif, source, tmp_path).result():
+            return None
+        with open(tmp_path, 'rb') as f:
+            name = default_storage.save(image_name, File(f, name=os.path.basename(image_name)))
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    for model in (Message, PrivateMessage):
+        model.objects.filter(image=image_name).update(image=name, image_variants=None)
+    return name
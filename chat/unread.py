@@ -0,0 +1,127 @@
+"""
+Compteurs de messages non lus des salons, maintenus en mémoire (par processus).
+
+La base reste la source de vérité (Room.last_seq et RoomReadState): un salon est
+chargé depuis la base au premier accès puis rechargé toutes les
+RECONCILE_SECONDS. Entre deux rechargements, un envoi fait avancer last_seq et
+un mark_read fait avancer le marqueur du lecteur, sans aucune requête:
+non lus = last_seq - marqueur de lecture.
+"""
+import threading
+import time
+
+from .models import Room, RoomReadState
+
+RECONCILE_SECONDS = 60
+
+
+class RoomUnreadState:
+    """État d'un salon: dernier seq connu et marqueurs de lecture par utilisateur"""
+    __slots__ = ('last_seq', 'read_seqs', 'loaded_at')
+
+    def __init__(self, last_seq=0, read_seqs=None, loaded_at=0.0):
+        self.last_seq = last_seq
+        self.read_seqs = read_seqs or {}
+        self.loaded_at = loaded_at
+
+
+class UnreadCounterStore:
+
+    def __init__(self, reconcile_seconds=RECONCILE_SECONDS):
+        self.reconcile_seconds = reconcile_seconds
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    # ---------- Chargement / réconciliation (synchrone, accède à la base) ----------
+    def load(self, room_id, force=False):
+        """
+        Charge (ou recharge si périmé) l'état du salon depuis la base.
+        À appeler depuis un contexte synchrone (database_sync_to_async).
+        """
+        state = self._rooms.get(room_id)
+        if state and not force and time.monotonic() - state.loaded_at < self.reconcile_seconds:
+            return state
+
+        last_seq = Room.objects.values_list('last_seq', flat=True).filter(pk=room_id).first() or 0
+        read_seqs = dict(
+            RoomReadState.objects.filter(room_id=room_id).values_list('user_id', 'last_read_seq')
+        )
+        with self._lock:
+            state = self._rooms.get(room_id)
+            if state is None:
+                state = self._rooms[room_id] = RoomUnreadState()
+            # Les valeurs en mémoire peuvent être plus récentes que la lecture
+            state.last_seq = max(state.last_seq, last_seq)
+            for user_id, seq in read_seqs.items():
+                state.read_seqs[user_id] = max(state.read_seqs.get(user_id, 0), seq)
+            state.loaded_at = time.monotonic()
+        return state
+
+    def load_many(self, room_ids):
+        """Charge plusieurs salons en deux requêtes (connexion aux notifications)."""
+        now = time.monotonic()
+        stale = [
+            room_id for room_id in room_ids
+            if room_id not in self._rooms or now - self._rooms[room_id].loaded_at >= self.reconcile_seconds
+        ]
+        if not stale:
+            return
+        last_seqs = dict(Room.objects.filter(pk__in=stale).values_list('pk', 'last_seq'))
+        read_seqs = {}
+        for room_id, user_id, seq in RoomReadState.objects.filter(
+            room_id__in=stale
+        ).values_list('room_id', 'user_id', 'last_read_seq'):
+            read_seqs.setdefault(room_id, {})[user_id] = seq
+
+        with self._lock:
+            for room_id in stale:
+                state = self._rooms.get(room_id)
+                if state is None:
+                    state = self._rooms[room_id] = RoomUnreadState()
+                state.last_seq = max(state.last_seq, last_seqs.get(room_id, 0))
+                for user_id, seq in read_seqs.get(room_id, {}).items():
+                    state.read_seqs[user_id] = max(state.read_seqs.get(user_id, 0), seq)
+                state.loaded_at = now
+
+    def forget(self, room_id):
+        with self._lock:
+            self._rooms.pop(room_id, None)
+
+    # ---------- Mises à jour incrémentales (mémoire uniquement) ----------
+    def _state(self, room_id):
+        state = self._rooms.get(room_id)
+        if state is None:
+            # Jamais chargé dans ce processus: sera réconcilié au prochain load()
+            state = self._rooms[room_id] = RoomUnreadState()
+        return state
+
+    def record_message(self, room_id, seq, sender_id):
+        """
+        Nouveau message: +1 pour tout le monde, sauf l'auteur s'il avait tout lu
+        (comme RoomReadState.mark_own_message). Idempotent.
+        Un auteur en retard compte donc aussi son propre message jusqu'à sa lecture.
+        """
+        with self._lock:
+            state = self._state(room_id)
+            state.last_seq = max(state.last_seq, seq)
+            read_seq = state.read_seqs.get(sender_id, 0)
+            if read_seq >= seq - 1:
+                state.read_seqs[sender_id] = max(read_seq, seq)
+
+    def mark_read(self, room_id, user_id, seq=None):
+        """Avance le marqueur de user_id (jusqu'au dernier message si seq est None)."""
+        with self._lock:
+            state = self._state(room_id)
+            if seq is None:
+                seq = state.last_seq
+            state.read_seqs[user_id] = max(state.read_seqs.get(user_id, 0), seq)
+
+    # ---------- Lecture ----------
+    def count(self, room_id, user_id):
+        state = self._rooms.get(room_id)
+        if state is None:
+            return 0
+        return max(state.last_seq - state.read_seqs.get(user_id, 0), 0)
+
+
+unread_counters = UnreadCounterStore()
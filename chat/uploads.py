@@ -0,0 +1,383 @@
+"""
+Envoi de fichiers par morceaux, avec reprise (API: views.chunked_upload_*).
+
+1. start_upload(): crée un ChunkedUpload (taille annoncée, destination) et
+   un fichier UPLOAD_TEMP_DIR/<id>.part vide;
+2. write_chunk(): écrit un morceau à l'offset donné, qui doit être
+   l'offset confirmé (upload.received). Le corps est lu par blocs de
+   READ_BLOCK octets et écrit directement sur disque: mémoire bornée quelle
+   que soit la taille du fichier. Après une coupure, le client redemande
+   l'offset (GET) et renvoie la suite;
+3. finalize_upload(): réserve l'envoi (status 'finalizing' par un UPDATE
+   conditionnel: une finalisation concurrente reçoit 409), vérifie taille
+   et SHA-256, détecte le vrai type MIME depuis les premiers octets, retire
+   l'EXIF des images (avant le hash du stockage), déplace le fichier vers
+   le stockage (sans copie), crée le Message / PrivateMessage et le diffuse
+   sur les groupes existants (notifications.broadcast_*).
+
+Le SHA-256 est calculé au fil de l'eau; l'état du hash est gardé en mémoire
+(LRU par processus). Si le morceau suivant arrive sur un autre worker ou
+après un redémarrage, le hash est recalculé depuis le fichier partiel.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from . import imaging, notifications, thumbnails
+from .models import ChunkedUpload, Message, PrivateMessage, RelationshipState
+
+READ_BLOCK = 64 * 1024
+SNIFF_BYTES = 512
+HASHER_CACHE_SIZE = 256
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+IMAGE_MIME_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/webp'}
+
+# Signatures en tête de fichier -> type MIME (les plus longues d'abord)
+MAGIC_NUMBERS = [
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'\x1f\x8b', 'application/gzip'),
+    (b'OggS', 'audio/ogg'),
+    (b'ID3', 'audio/mpeg'),
+    (b'\xff\xfb', 'audio/mpeg'),
+]
+
+# Formats bureautiques: des archives zip, distinguées par l'extension
+ZIP_EXTENSIONS = {
+    '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    '.xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    '.pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    '.odt': 'application/vnd.oasis.opendocument.text',
+    '.ods': 'application/vnd.oasis.opendocument.spreadsheet',
+}
+
+
+class UploadError(Exception):
+    """Refus à renvoyer au client: status HTTP et, si utile, l'offset confirmé."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+
+# ---------- Type MIME ----------
+def sniff_mime(head, filename=''):
+    """Type MIME d'après les premiers octets (jamais d'après le client)."""
+    for signature, mime in MAGIC_NUMBERS:
+        if head.startswith(signature):
+            return mime
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp':
+        return 'video/mp4'
+    if head.startswith(b'PK\x03\x04'):
+        extension = os.path.splitext(filename)[1].lower()
+        return ZIP_EXTENSIONS.get(extension, 'application/zip')
+    if head and b'\x00' not in head:
+        try:
+            head.decode('utf-8')
+            return 'text/plain'
+        except UnicodeDecodeError as e:
+            # Caractère multi-octets coupé par la limite de lecture
+            if e.start >= len(head) - 3 and len(head) == SNIFF_BYTES:
+                return 'text/plain'
+    return 'application/octet-stream'
+
+
+def is_image(mime):
+    return mime in IMAGE_MIME_TYPES
+
+
+# ---------- Métadonnées des images ----------
+def strip_exif(source, target=None):
+    """imaging.strip_exif dans le pool de thumbnails.py: Pillow hors du GIL du serveur."""
+    return thumbnails.get_executor().submit(imaging.strip_exif, source, target).result()
+
+
+def without_metadata(file):
+    """
+    Image envoyée en une fois (views.upload_file) sans EXIF, avant que le
+    stockage n'en calcule le hash: un blob n'est jamais réécrit. Renvoie le
+    fichier à enregistrer.
+    """
+    if hasattr(file, 'temporary_file_path'):
+        # Fichier temporaire de la requête (pas encore un blob): réécrit sur place
+        if strip_exif(file.temporary_file_path(), file.temporary_file_path()):
+            file.size = os.path.getsize(file.temporary_file_path())
+        return file
+    stripped = strip_exif(file.read())
+    file.seek(0)
+    return file if stripped is None else ContentFile(stripped, name=file.name)
+
+
+# ---------- Fichiers partiels ----------
+def part_path(upload):
+    return os.path.join(settings.UPLOAD_TEMP_DIR, f'{upload.pk}.part')
+
+
+def _remove_part(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def clean_filename(filename):
+    name = os.path.basename((filename or '').replace('\\', '/')).strip()
+    root, extension = os.path.splitext(name)
+    return root[:200 - len(extension[:20])] + extension[:20]
+
+
+class _PartFile(File):
+    """
+    Fichier partiel complet: le stockage le déplace (file_move_safe) au lieu
+    de le recopier, comme un TemporaryUploadedFile.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+# ---------- Hash incrémental ----------
+_hashers = OrderedDict()  # upload id -> (offset, hasher)
+_hashers_lock = threading.Lock()
+
+
+def _hasher_at(upload, offset):
+    """Hash des offset premiers octets: depuis le cache, sinon relu sur disque."""
+    with _hashers_lock:
+        cached = _hashers.pop(upload.pk, None)
+    if cached is not None and cached[0] == offset:
+        return cached[1]
+    hasher = hashlib.sha256()
+    remaining = offset
+    with open(part_path(upload), 'rb') as f:
+        while remaining:
+            block = f.read(min(READ_BLOCK, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def _remember_hasher(upload, offset, hasher):
+    with _hashers_lock:
+        _hashers[upload.pk] = (offset, hasher)
+        while len(_hashers) > HASHER_CACHE_SIZE:
+            _hashers.popitem(last=False)
+
+
+def _forget_hasher(upload):
+    with _hashers_lock:
+        _hashers.pop(upload.pk, None)
+
+
+# ---------- Destination ----------
+def check_destination(user, room=None, receiver=None):
+    if room is not None:
+        if room.is_private and not room.members.filter(pk=user.pk).exists():
+            raise UploadError("Vous n'êtes pas membre de ce salon", 403)
+    elif receiver is not None:
+        if receiver.pk == user.pk:
+            raise UploadError("Destinataire invalide", 400)
+        if not RelationshipState.load_one(user, receiver).can_send_messages:
+            raise UploadError("Impossible d'envoyer le fichier. Communication bloquée.", 403)
+    else:
+        raise UploadError("Paramètre manquant", 400)
+
+
+# ---------- Étapes ----------
+def start_upload(user, filename, size, room=None, receiver=None, content='', sha256=''):
+    filename = clean_filename(filename)
+    if not filename:
+        raise UploadError("Nom de fichier manquant")
+    if size <= 0:
+        raise UploadError("Fichier vide")
+    if size > settings.UPLOAD_MAX_SIZE:
+        raise UploadError(f"Fichier trop volumineux (max {settings.UPLOAD_MAX_SIZE} octets)", 413)
+    sha256 = (sha256 or '').lower()
+    if sha256 and not SHA256_RE.match(sha256):
+        raise UploadError("SHA-256 invalide")
+    check_destination(user, room, receiver)
+
+    upload = ChunkedUpload.objects.create(
+        user=user, room=room, receiver=receiver, filename=filename,
+        size=size, content=content or '', expected_sha256=sha256,
+    )
+    os.makedirs(settings.UPLOAD_TEMP_DIR, exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    return upload
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Écrit length octets lus dans stream à partir de offset. Renvoie le nouvel
+    offset confirmé. Si le client coupe en cours de route, les octets reçus
+    sont conservés (l'offset avance d'autant) avant de lever l'erreur.
+    """
+    if length is None:
+        raise UploadError("Content-Length requis", 411, upload.received)
+    if length > settings.UPLOAD_MAX_CHUNK_SIZE:
+        raise UploadError(f"Morceau trop gros (max {settings.UPLOAD_MAX_CHUNK_SIZE} octets)", 413, upload.received)
+    if upload.status != ChunkedUpload.UPLOADING:
+        raise UploadError("Envoi en cours de finalisation", 409, upload.received)
+    if offset != upload.received:
+        # Le client a perdu la réponse du morceau précédent: il repart de l'offset confirmé
+        raise UploadError("Offset inattendu", 409, upload.received)
+    if offset + length > upload.size:
+        raise UploadError("Le morceau dépasse la taille annoncée", 400, upload.received)
+
+    try:
+        f = open(part_path(upload), 'r+b')
+    except FileNotFoundError:
+        raise UploadError("Envoi expiré", 410)
+
+    hasher = _hasher_at(upload, offset)
+    written = 0
+    with f:
+        f.seek(offset)
+        while written < length:
+            try:
+                block = stream.read(min(READ_BLOCK, length - written))
+            except UnreadablePostError:
+                break  # client déconnecté
+            if not block:
+                break
+            f.write(block)
+            hasher.update(block)
+            written += len(block)
+        # Un essai précédent interrompu a pu écrire au-delà
+        f.truncate()
+
+    new_offset = offset + written
+    # Mise à jour conditionnelle: deux envois concurrents du même morceau
+    # ne peuvent pas avancer l'offset deux fois
+    updated = ChunkedUpload.objects.filter(
+        pk=upload.pk, received=offset, status=ChunkedUpload.UPLOADING,
+    ).update(
+        received=new_offset, updated_at=timezone.now()
+    )
+    if not updated:
+        _forget_hasher(upload)
+        upload.refresh_from_db(fields=['received'])
+        raise UploadError("Offset inattendu", 409, upload.received)
+    upload.received = new_offset
+    _remember_hasher(upload, new_offset, hasher)
+
+    if written < length:
+        raise UploadError("Morceau incomplet", 400, new_offset)
+    return new_offset
+
+
+def finalize_upload(upload):
+    """Crée et diffuse le message. Renvoie le Message ou PrivateMessage."""
+    # Une seule requête passe: les finalisations concurrentes reçoivent 409
+    claimed = ChunkedUpload.objects.filter(
+        pk=upload.pk, status=ChunkedUpload.UPLOADING, received=F('size'),
+    ).update(status=ChunkedUpload.FINALIZING, updated_at=timezone.now())
+    try:
+        upload.refresh_from_db()
+    except ChunkedUpload.DoesNotExist:
+        raise UploadError("Envoi déjà finalisé", 409)
+    if not claimed:
+        if upload.status == ChunkedUpload.FINALIZING:
+            raise UploadError("Envoi en cours de finalisation", 409, upload.received)
+        raise UploadError("Envoi incomplet", 409, upload.received)
+    try:
+        return _finalize_claimed(upload)
+    except Exception:
+        # Refus ou erreur: l'envoi redevient finalisable (s'il existe encore)
+        ChunkedUpload.objects.filter(pk=upload.pk).update(status=ChunkedUpload.UPLOADING)
+        raise
+
+
+def _finalize_claimed(upload):
+    check_destination(upload.user, upload.room, upload.receiver)
+
+    digest = _hasher_at(upload, upload.received).hexdigest()
+    if upload.expected_sha256 and digest != upload.expected_sha256:
+        abort_upload(upload)
+        raise UploadError("Somme de contrôle invalide, fichier rejeté", 422)
+
+    with open(part_path(upload), 'rb') as f:
+        mime = sniff_mime(f.read(SNIFF_BYTES), upload.filename)
+    field = 'image' if is_image(mime) else 'file'
+    if field == 'image' and strip_exif(part_path(upload), part_path(upload)):
+        # Contenu modifié: le stockage recalcule le hash
+        digest = None
+    content = upload.content or (
+        f'Image partagée: {upload.filename}' if field == 'image' else f'Fichier partagé: {upload.filename}'
+    )
+
+    name = upload.filename
+    if field == 'image' and mimetypes.guess_type(name)[0] != mime:
+        # Extension cohérente avec le contenu réel (servi d'après l'extension)
+        name = os.path.splitext(name)[0] + mimetypes.guess_extension(mime)
+
+    path = part_path(upload)
+    with open(path, 'rb') as f:
+        part = _PartFile(f, name=name)
+        # Hash déjà calculé: le stockage par contenu (storage.py) ne relit pas le fichier
+        if digest:
+            part.sha256 = digest
+        data = {field: part}
+        with transaction.atomic():
+            if upload.room_id:
+                message = Message.objects.create(room=upload.room, user=upload.user, content=content, **data)
+                transaction.on_commit(lambda: notifications.broadcast_room_message(message))
+            else:
+                message = PrivateMessage.objects.create(
+                    sender=upload.user, receiver=upload.receiver, content=content, **data
+                )
+                transaction.on_commit(lambda: notifications.broadcast_private_message(message))
+            upload.delete()
+    _forget_hasher(upload)
+    # Contenu déjà stocké (doublon): le fichier partiel n'a pas été déplacé
+    _remove_part(path)
+    return message
+
+
+def abort_upload(upload):
+    _forget_hasher(upload)
+    _remove_part(part_path(upload))
+    upload.delete()
+
+
+def expire_uploads(now=None):
+    """
+    Supprime les envois sans activité depuis UPLOAD_EXPIRY_HOURS, et les
+    fichiers partiels orphelins aussi anciens. Renvoie le nombre d'envois supprimés.
+    """
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.UPLOAD_EXPIRY_HOURS)
+    expired = 0
+    for upload in ChunkedUpload.objects.filter(updated_at__lt=cutoff).iterator():
+        abort_upload(upload)
+        expired += 1
+
+    if os.path.isdir(settings.UPLOAD_TEMP_DIR):
+        known = {str(pk) for pk in ChunkedUpload.objects.values_list('pk', flat=True)}
+        for entry in os.scandir(settings.UPLOAD_TEMP_DIR):
+            upload_id = entry.name.removesuffix('.part')
+            if (entry.name.endswith('.part') and upload_id not in known
+                    and entry.stat().st_mtime < cutoff.timestamp()):
+                os.remove(entry.path)
+    return expired
@@ -9,10 +9,19 @@ path('', views.welcome, name='welcome'),
     path('logout/', views.user_logout, name='logout'),
     path('room/create/', views.create_room, name='create_room'),
     path('room/<str:room_name>/', views.room_detail, name='room_detail'),
+    path('room/<str:room_name>/messages/', views.room_messages, name='room_messages'),
+    path('room/<str:room_name>/members/', views.room_members, name='room_members'),
     path("room/<str:room_name>/join/", views.join_room, name="join_room"),
     path('private/unread-count/', views.private_unread_count, name='private_unread_count'),
     path('private/<str:username>/', views.private_chat, name='private_chat'),
+    path('private/<str:username>/messages/', views.private_messages, name='private_messages'),
+    path('search/', views.search, name='search'),
+    path('metrics', views.metrics, name='metrics'),
+    path('media/<path:name>', views.serve_media, name='serve_media'),
     path('upload/', views.upload_file, name='upload_file'),
+    path('upload/chunked/', views.chunked_upload_start, name='chunked_upload_start'),
+    path('upload/chunked/<uuid:upload_id>/', views.chunked_upload, name='chunked_upload'),
+    path('upload/chunked/<uuid:upload_id>/finalize/', views.chunked_upload_finalize, name='chunked_upload_finalize'),
     path('chat/new/', views.choose_user_chat, name='choose_user_chat'),
     path('delete_private_message/<int:message_id>/', views.delete_private_message, name='delete_private_message'),
     path('delete_message/<int:message_id>/', views.delete_message, name='delete_message'),
@@ -4,14 +4,38 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse
 from django.views.decorators.http import require_POST, require_http_methods
-from .models import Room, Message, PrivateMessage, UserProfile, Block, Report, HiddenConversation, MessageRead
+from .models import Room, Message, PrivateMessage, UserProfile, Block, Report, HiddenConversation, RoomReadState, Conversation, RelationshipState, ChunkedUpload
 from .forms import UserProfileForm
-from django.db.models import Q, Max
+from .history import (
+    room_history, private_history, decode_cursor, clamp_limit, encode_cursor,
+    serialize_room_message, serialize_private_message
+)
+from .notifications import notify_room_read
+from .roster import roster_snapshot
+from . import search as message_search
+from . import uploads
+from . import media
+from . import archive
+from .codec import JsonResponse
+from .metrics import registry as metrics_registry
+from django.conf import settings
+from django.db.models import Q, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 
+def with_read_seq(rooms, user):
+    """
+    Annote chaque salon avec `read_seq` (marqueur de lecture de `user`),
+    pour calculer les non lus sans requête supplémentaire par salon.
+    """
+    read_seq = RoomReadState.objects.filter(
+        room=OuterRef('pk'), user=user
+    ).values('last_read_seq')[:1]
+    return rooms.annotate(read_seq=Coalesce(Subquery(read_seq), 0))
+
 
 
 def register(request):
@@ -67,50 +91,41 @@ def home(request):
     user_rooms = Room.objects.filter(members=request.user).distinct()
 
     # Ajouter le timestamp du dernier message dans chaque room
-    user_rooms = user_rooms.annotate(
+    user_rooms = with_read_seq(user_rooms, request.user).annotate(
         last_message_time=Max('messages__timestamp')
     ).order_by('-last_message_time')  # trie par dernier message reçu/envoi
 
-    # Préparer rooms_data pour les messages non lus
+    # Préparer rooms_data pour les messages non lus (last_seq - read_seq)
     rooms_data = []
     for room in user_rooms:
-        unread_count = room.unread_count_for_user(request.user)
         rooms_data.append({
             'id': room.id,
             'name': room.name,
-            'unread_count': unread_count
+            'unread_count': max(room.last_seq - room.read_seq, 0)
         })
 
     # -------------------------
     # Chats privés
     # -------------------------
-    # Récupérer tous les utilisateurs avec qui il y a eu un échange
-    user_chats = User.objects.filter(
-        id__in=[
-            *PrivateMessage.objects.filter(sender=request.user).values_list('receiver_id', flat=True),
-            *PrivateMessage.objects.filter(receiver=request.user).values_list('sender_id', flat=True)
-        ]
-    ).distinct().exclude(id=request.user.id)
-
+    # Boîte de réception: une requête, déjà triée par dernier message,
+    # avec non lus et date du dernier message dénormalisés
+    # Blocages / signalements de tous les contacts: deux requêtes au total
     private_chats = []
-    for user in user_chats:
-        if not request.user.profile.should_hide_conversation(user):
-            unread_count = request.user.profile.unread_private_count(user)
-
-            # Récupérer le dernier message entre les deux
-            last_msg = PrivateMessage.objects.filter(
-                Q(sender=request.user, receiver=user) | Q(sender=user, receiver=request.user)
-            ).order_by('-timestamp').first()
-
+    conversations = list(Conversation.inbox(request.user))
+    relationships = RelationshipState.load(
+        request.user, [conversation.peer_of(request.user) for conversation in conversations]
+    )
+    for conversation in conversations:
+        user = conversation.peer_of(request.user)
+        relationship = relationships[user.id]
+        if not relationship.should_hide_conversation:
             private_chats.append({
                 'user': user,
-                'unread_count': unread_count,
-                'last_message_time': last_msg.timestamp if last_msg else None
+                'relationship': relationship,
+                'unread_count': conversation.unread_for(request.user),
+                'last_message_time': conversation.last_message_at
             })
 
-    # Trier les chats privés par dernier message
-    private_chats.sort(key=lambda x: x['last_message_time'] or 0, reverse=True)
-
     # -------------------------
     # Tous les salons disponibles (pour modal)
     # -------------------------
@@ -139,43 +154,84 @@ def choose_user_chat(request):
 @login_required
 def room_detail(request, room_name):
     room = Room.objects.filter(name__iexact=room_name).first()
-    hidden = HiddenConversation.objects.filter(user=request.user, room=room).first()
 
-    # Récupération des messages
-    if hidden:
-        messages_list = list(
-            Message.objects.filter(room=room, timestamp__gt=hidden.hidden_at)
-            .order_by('timestamp')  # ordre normal
-        )
-    else:
-        messages_list = list(Message.objects.filter(room=room).order_by('timestamp'))
+    # Récupération des messages: seulement la fenêtre la plus récente,
+    # le reste est chargé à la demande (défilement vers le haut)
+    messages_list, has_more = room_history(room, request.user)
 
-    # Marquer comme lus
-    for msg in messages_list:
-        MessageRead.objects.get_or_create(message=msg, user=request.user)
+    # Marquer comme lus: un seul upsert du marqueur de lecture
+    RoomReadState.mark_read(request.user, room, room.last_seq)
+    notify_room_read(request.user.id, room.id, room.last_seq)
 
     # -----------------------------
-    # Liste des membres actuels
+    # Liste des membres actuels (snapshot en cache, voir roster.py)
     # -----------------------------
-    members_list = room.members.all()
+    roster = roster_snapshot(room)
+    members_list = roster['members']
 
     # -----------------------------
     # Liste des utilisateurs non membres (disponibles à ajouter)
     # -----------------------------
     # Exclut les membres existants + l'utilisateur actuel
-    membre_contact = User.objects.exclude(id__in=members_list.values_list('id', flat=True))\
+    membre_contact = User.objects.exclude(id__in=[member['id'] for member in members_list])\
                                  .exclude(id=request.user.id)
 
     context = {
         'room': room,
         'messages': messages_list,
+        'has_more': has_more,
+        'history_cursor': encode_cursor(messages_list[0].timestamp, messages_list[0].id) if messages_list else '',
         'members_list': members_list,
+        'members_version': roster['version'],
         'membre_contact': membre_contact,  # pour modal "Ajouter membre"
     }
 
     return render(request, 'chat/room.html', context)
 
 
+@login_required
+def room_members(request, room_name):
+    """
+    Snapshot de la liste des membres (en cache par version). Les clients
+    l'appellent quand ils détectent un saut de version dans members_update.
+    """
+    room = Room.objects.filter(name__iexact=room_name).first()
+    if not room:
+        return JsonResponse({'status': 'error', 'message': 'Salon introuvable'}, status=404)
+    if room.is_private and not room.members.filter(id=request.user.id).exists():
+        return JsonResponse({'status': 'error', 'message': 'Accès refusé'}, status=403)
+    return JsonResponse({'status': 'success', **roster_snapshot(room)})
+
+
+@login_required
+def room_messages(request, room_name):
+    """
+    API d'historique paginé d'un salon.
+    GET ?before=<curseur>&limit=50  -> messages plus anciens (défilement)
+    GET ?after=<curseur>&limit=50   -> messages plus récents
+    """
+    room = Room.objects.filter(name__iexact=room_name).first()
+    if not room:
+        return JsonResponse({'status': 'error', 'message': 'Salon introuvable'}, status=404)
+    if room.is_private and not room.members.filter(id=request.user.id).exists():
+        return JsonResponse({'status': 'error', 'message': 'Accès refusé'}, status=403)
+
+    messages_list, has_more = room_history(
+        room, request.user,
+        before=decode_cursor(request.GET.get('before')),
+        after=decode_cursor(request.GET.get('after')),
+        limit=clamp_limit(request.GET.get('limit'))
+    )
+    data = [serialize_room_message(msg) for msg in messages_list]
+    return JsonResponse({
+        'status': 'success',
+        'messages': data,
+        'has_more': has_more,
+        'before_cursor': data[0]['cursor'] if data else None,
+        'after_cursor': data[-1]['cursor'] if data else None,
+    })
+
+
 
 @login_required
 def create_room(request):
@@ -211,38 +267,26 @@ def create_room(request):
 @login_required
 def private_chat(request, username):
     other_user = get_object_or_404(User, username=username)
-    profile = request.user.profile
-    is_blocking = profile.is_blocking(other_user)
-    is_blocked_by = profile.is_blocked_by(other_user)
-    has_reported = profile.has_reported(other_user)
-    should_hide = profile.should_hide_conversation(other_user)
+    relationship = RelationshipState.load_one(request.user, other_user)
+    should_hide = relationship.should_hide_conversation
 
     if should_hide:
         messages.warning(request, f'Cette conversation avec {username} a été masquée.')
         return redirect('home')
 
-    messages_sent = PrivateMessage.objects.filter(
-        sender=request.user,
-        receiver=other_user
-    )
-    messages_received = PrivateMessage.objects.filter(
-        sender=other_user,
-        receiver=request.user
-    )
-
-    all_messages = sorted(
-        list(messages_sent) + list(messages_received),
-        key=lambda x: x.timestamp
-    )
-
-    messages_received.filter(is_read=False).update(is_read=True)
+    # Une seule requête ordonnée sur les deux sens de la conversation,
+    # limitée à la fenêtre la plus récente (le reste via private_messages)
+    all_messages, has_more = private_history(request.user, other_user)
 
     context = {
         'other_user': other_user,
         'messages': all_messages,
-        'is_blocking': is_blocking,
-        'is_blocked_by': is_blocked_by,
-        'has_reported': has_reported,
+        'has_more': has_more,
+        'history_cursor': encode_cursor(all_messages[0].timestamp, all_messages[0].id) if all_messages else '',
+        'relationship': relationship,
+        'is_blocking': relationship.is_blocking,
+        'is_blocked_by': relationship.is_blocked_by,
+        'has_reported': relationship.has_reported,
         'should_hide': should_hide
     }
 
@@ -250,12 +294,87 @@ def private_chat(request, username):
 
     return render(request, 'chat/private_chat.html', context)
 
+
+@login_required
+def private_messages(request, username):
+    """
+    API d'historique paginé d'une conversation privée.
+    GET ?before=<curseur>&limit=50  -> messages plus anciens
+    GET ?after=<curseur>&limit=50   -> messages plus récents
+    """
+    other_user = User.objects.filter(username=username).first()
+    if not other_user:
+        return JsonResponse({'status': 'error', 'message': 'Utilisateur introuvable'}, status=404)
+    if RelationshipState.load_one(request.user, other_user).should_hide_conversation:
+        return JsonResponse({'status': 'error', 'message': 'Conversation masquée'}, status=403)
+
+    messages_list, has_more = private_history(
+        request.user, other_user,
+        before=decode_cursor(request.GET.get('before')),
+        after=decode_cursor(request.GET.get('after')),
+        limit=clamp_limit(request.GET.get('limit'))
+    )
+    data = [serialize_private_message(msg) for msg in messages_list]
+    return JsonResponse({
+        'status': 'success',
+        'messages': data,
+        'has_more': has_more,
+        'before_cursor': data[0]['cursor'] if data else None,
+        'after_cursor': data[-1]['cursor'] if data else None,
+    })
+
+
+@login_required
+def search(request):
+    """
+    Recherche plein texte dans les salons dont l'utilisateur est membre et ses
+    conversations privées, classée par pertinence. Les messages archivés
+    n'y figurent pas (includes_archived=False, voir archive.py).
+    GET ?q=<texte>&limit=20&offset=0
+    """
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'status': 'error', 'message': 'Recherche vide'}, status=400)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', message_search.DEFAULT_LIMIT)), message_search.MAX_LIMIT))
+        offset = max(0, int(request.GET.get('offset', 0)))
+    except (TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'Paramètres invalides'}, status=400)
+
+    results, has_more = message_search.search_messages(request.user, query, limit=limit, offset=offset)
+    data = []
+    for result in results:
+        msg = result['message']
+        if result['kind'] == 'room':
+            item = serialize_room_message(msg)
+            item['room'] = msg.room.name
+        else:
+            item = serialize_private_message(msg)
+            item['peer'] = msg.receiver.username if msg.sender_id == request.user.id else msg.sender.username
+        item.update(kind=result['kind'], snippet=result['snippet'], score=round(result['score'], 4))
+        data.append(item)
+    return JsonResponse({
+        'status': 'success',
+        'results': data,
+        'has_more': has_more,
+        'next_offset': offset + limit if has_more else None,
+        'includes_archived': False,
+    })
+
 @login_required
 @require_POST
 def upload_file(request):
     file = request.FILES.get('file')
     if not file:
         return JsonResponse({'status': 'error', 'message': 'Aucun fichier'}, status=400)
+    if file.size > settings.UPLOAD_MAX_SIZE:
+        return JsonResponse({'status': 'error', 'message': 'Fichier trop volumineux'}, status=413)
+
+    # Type réel d'après le contenu (le content_type vient du client)
+    is_image = uploads.is_image(uploads.sniff_mime(file.read(uploads.SNIFF_BYTES), file.name))
+    file.seek(0)
+    if is_image:
+        file = uploads.without_metadata(file)
 
     # === Si c'est un groupe ===
     room_name = request.POST.get('room')
@@ -264,7 +383,7 @@ def upload_file(request):
         if not room:
             return JsonResponse({'status': 'error', 'message': 'Salon introuvable'}, status=404)
         # Crée le message pour le groupe
-        if file.content_type.startswith('image/'):
+        if is_image:
             message = Message.objects.create(room=room, user=request.user,
                                              content=f'Image partagée: {file.name}', image=file)
         else:
@@ -283,7 +402,7 @@ def upload_file(request):
             return JsonResponse({'status': 'error', 'message': 'Utilisateur introuvable'}, status=404)
 
         # Crée le message pour le chat privé
-        if file.content_type.startswith('image/'):
+        if is_image:
             message = PrivateMessage.objects.create(sender=request.user, receiver=receiver,
                                                     content=f'Image partagée: {file.name}', image=file)
         else:
@@ -296,6 +415,117 @@ def upload_file(request):
     return JsonResponse({'status': 'error', 'message': 'Paramètre manquant'}, status=400)
 
 
+# ---------- Envoi par morceaux (voir uploads.py) ----------
+def upload_error(error):
+    data = {'status': 'error', 'message': error.message}
+    if error.offset is not None:
+        data['offset'] = error.offset
+    response = JsonResponse(data, status=error.status)
+    if error.offset is not None:
+        response['Upload-Offset'] = str(error.offset)
+    return response
+
+
+def upload_state(upload, status=200):
+    response = JsonResponse({
+        'status': 'success',
+        'upload_id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+        'max_chunk_size': settings.UPLOAD_MAX_CHUNK_SIZE,
+    }, status=status)
+    response['Upload-Offset'] = str(upload.received)
+    return response
+
+
+@login_required
+@require_POST
+def chunked_upload_start(request):
+    """
+    Démarre un envoi: filename, size, room ou receiver_username, et en option
+    content (légende) et sha256. Renvoie upload_id et la taille de morceau conseillée.
+    """
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Taille invalide'}, status=400)
+
+    room = receiver = None
+    room_name = request.POST.get('room')
+    receiver_username = request.POST.get('receiver_username')
+    if room_name:
+        room = Room.objects.filter(name__iexact=room_name).first()
+        if not room:
+            return JsonResponse({'status': 'error', 'message': 'Salon introuvable'}, status=404)
+    elif receiver_username:
+        receiver = User.objects.filter(username=receiver_username).first()
+        if not receiver:
+            return JsonResponse({'status': 'error', 'message': 'Utilisateur introuvable'}, status=404)
+
+    try:
+        upload = uploads.start_upload(
+            request.user, request.POST.get('filename', ''), size, room=room, receiver=receiver,
+            content=request.POST.get('content', '').strip(), sha256=request.POST.get('sha256', ''),
+        )
+    except uploads.UploadError as e:
+        return upload_error(e)
+    return upload_state(upload, status=201)
+
+
+@login_required
+@require_http_methods(["GET", "PUT", "DELETE"])
+def chunked_upload(request, upload_id):
+    """
+    GET: offset confirmé (reprise après coupure).
+    PUT: corps = octets du morceau, offset dans l'en-tête Upload-Offset (ou ?offset=).
+    DELETE: abandon.
+    """
+    upload = ChunkedUpload.objects.filter(pk=upload_id, user=request.user).first()
+    if upload is None:
+        return JsonResponse({'status': 'error', 'message': 'Envoi introuvable'}, status=404)
+
+    if request.method == 'DELETE':
+        uploads.abort_upload(upload)
+        return JsonResponse({'status': 'success', 'message': 'Envoi annulé'})
+
+    if request.method == 'PUT':
+        try:
+            offset = int(request.headers.get('Upload-Offset', request.GET.get('offset', '')))
+            length = request.headers.get('Content-Length')
+            length = int(length) if length else None
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Offset invalide'}, status=400)
+        try:
+            # Lecture directe du flux: le corps n'est jamais chargé en mémoire
+            uploads.write_chunk(upload, offset, request, length)
+        except uploads.UploadError as e:
+            return upload_error(e)
+
+    return upload_state(upload)
+
+
+@login_required
+@require_POST
+def chunked_upload_finalize(request, upload_id):
+    """Crée le message (diffusé par WebSocket) une fois tous les octets reçus."""
+    upload = ChunkedUpload.objects.filter(pk=upload_id, user=request.user).first()
+    if upload is None:
+        return JsonResponse({'status': 'error', 'message': 'Envoi introuvable'}, status=404)
+    try:
+        message = uploads.finalize_upload(upload)
+    except uploads.UploadError as e:
+        return upload_error(e)
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Fichier uploadé',
+        'id': message.id,
+        'file_url': message.file.url if message.file else '',
+        **message.image_payload(),
+    })
+
+
 @login_required
 def delete_private_message(request, message_id):
     """
@@ -307,6 +537,7 @@ def delete_private_message(request, message_id):
     # Vérifier que l'utilisateur est le propriétaire
     if message_obj.sender == request.user:
         message_obj.delete()
+        Conversation.message_deleted(message_obj)
 
     # Reste sur la page du chat avec l'autre utilisateur
     return redirect('private_chat', username=message_obj.receiver.username)
@@ -533,22 +764,18 @@ def check_block_status(request, username):
     """
     try:
         other_user = get_object_or_404(User, username=username)
-        profile = request.user.profile
 
-        # Récupérer les statuts
-        is_blocking = profile.is_blocking(other_user)
-        is_blocked_by = profile.is_blocked_by(other_user)
-        has_reported = profile.has_reported(other_user)
-        should_hide = profile.should_hide_conversation(other_user)
+        # Récupérer les statuts (deux requêtes)
+        relationship = RelationshipState.load_one(request.user, other_user)
 
         return JsonResponse({
             'success': True,
             'username': username,
-            'is_blocking': is_blocking,
-            'is_blocked_by': is_blocked_by,
-            'has_reported': has_reported,
-            'should_hide_conversation': should_hide,
-            'can_send_messages': not (is_blocking or is_blocked_by)
+            'is_blocking': relationship.is_blocking,
+            'is_blocked_by': relationship.is_blocked_by,
+            'has_reported': relationship.has_reported,
+            'should_hide_conversation': relationship.should_hide_conversation,
+            'can_send_messages': relationship.can_send_messages
         })
 
     except User.DoesNotExist:
@@ -615,7 +842,6 @@ def private_unread_count(request):
     return JsonResponse({'private_chats': chats})
 
 
-from django.http import JsonResponse
 from .models import Room, Message
 
 
@@ -624,13 +850,13 @@ def rooms_unread_count(request):
     rooms_data = []
 
     # Récupérer tous les salons que l'utilisateur peut voir
-    rooms = Room.objects.all()  # ou selon ton filtre (par ex: user.rooms.all())
+    rooms = with_read_seq(Room.objects.all(), user)  # ou selon ton filtre (par ex: user.rooms.all())
     for room in rooms:
         # Compter uniquement les messages non lus pour cet utilisateur
         rooms_data.append({
             "id": room.id,
             "name": room.name,
-            "unread_count": room.unread_count_for_user(user)
+            "unread_count": max(room.last_seq - room.read_seq, 0)
         })
 
     return JsonResponse({"rooms": rooms_data})
@@ -653,6 +879,11 @@ def delete_private_chat(request, user_id):
             receiver=request.user
         ).delete()
 
+        Conversation.objects.filter(
+            pair_key=PrivateMessage.make_pair_key(request.user, other_user)
+        ).delete()
+        archive.delete_private_archive(PrivateMessage.make_pair_key(request.user, other_user))
+
         return JsonResponse({"status": "success"})
 
     except User.DoesNotExist:
@@ -662,14 +893,34 @@ def delete_private_chat(request, user_id):
 def private_unread_count(request):
     user = request.user
     data = []
-    private_chats = PrivateMessage.objects.filter(receiver=user).select_related("sender")
+    # Compteurs dénormalisés de Conversation: une requête, sans lire les messages
+    for conversation in Conversation.objects.filter(Q(user1=user) | Q(user2=user)):
+        count = conversation.unread_for(user)
+        if count:
+            peer_id = conversation.user2_id if conversation.user1_id == user.id else conversation.user1_id
+            data.append({"user_id": peer_id, "count": count})
 
-    unread_map = {}
-    for msg in private_chats.filter(is_read=False):
-        unread_map[msg.sender.id] = unread_map.get(msg.sender.id, 0) + 1
+    return JsonResponse({"private_unread": data})
 
-    for user_id, count in unread_map.items():
-        data.append({"user_id": user_id, "count": count})
 
-    return JsonResponse({"private_unread": data})
+def metrics(request):
+    """
+    Métriques du processus au format texte Prometheus.
+    Accès: jeton METRICS_TOKEN (Authorization: Bearer) ou staff. Derrière un proxy
+    REMOTE_ADDR vaut 127.0.0.1: l'appel local n'est accepté qu'en DEBUG.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        allowed = request.headers.get('Authorization') == f'Bearer {token}'
+    else:
+        allowed = settings.DEBUG and request.META.get('REMOTE_ADDR') in ('127.0.0.1', '::1')
+    if not (allowed or request.user.is_staff):
+        return JsonResponse({'status': 'error', 'message': 'Accès refusé'}, status=403)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, name):
+    """Fichiers de MEDIA_ROOT, après vérification des droits (voir media.py)."""
+    return media.serve(request, name)
 
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -49,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # En tête: mesure toute la chaîne (voir chat/metrics.py)
+    'chat.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -80,12 +83,93 @@ WSGI_APPLICATION = 'chatapp.wsgi.application'
 ASGI_APPLICATION = 'chatapp.asgi.application'
 
 # Channels configuration
-CHANNEL_LAYERS = {
+# CHANNEL_LAYER=memory : un seul processus (défaut, développement)
+# CHANNEL_LAYER=redis : channels_redis (Redis requis, plusieurs processus Daphne)
+# CHANNEL_LAYER=redis_pubsub : PUBLISH/SUBSCRIBE uniquement, fonctionne aussi
+#   avec le serveur local `python manage.py pubsub_server`
+CHANNEL_LAYER = os.environ.get('CHANNEL_LAYER', 'memory')
+CHANNEL_REDIS_URL = os.environ.get('CHANNEL_REDIS_URL', 'redis://127.0.0.1:6379/0')
+
+if CHANNEL_LAYER == 'redis':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_REDIS_URL],
+            },
+        }
+    }
+elif CHANNEL_LAYER == 'redis_pubsub':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_REDIS_URL],
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
+    }
+
+# Présence partagée entre processus (voir chat/presence.py): 'memory' ou 'cache'.
+# Le cache 'presence' exige un vrai Redis: avec le serveur local pubsub_server,
+# définir PRESENCE_CACHE_URL ou lancer un seul processus avec PRESENCE_STORE=memory.
+PRESENCE_STORE = os.environ.get('PRESENCE_STORE', 'memory' if CHANNEL_LAYER == 'memory' else 'cache')
+PRESENCE_CACHE_URL = os.environ.get('PRESENCE_CACHE_URL', CHANNEL_REDIS_URL)
+PRESENCE_MAX_WORKERS = 64  # processus publiant leur présence dans le cache
+
+CACHES = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+if PRESENCE_STORE == 'cache':
+    CACHES['presence'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': PRESENCE_CACHE_URL,
     }
+
+# Écriture différée des messages WebSocket par lots (voir chat/batching.py)
+MESSAGE_WRITE_BEHIND = os.environ.get('MESSAGE_WRITE_BEHIND', '0') == '1'
+MESSAGE_BATCH_WINDOW_MS = int(os.environ.get('MESSAGE_BATCH_WINDOW_MS', '5'))
+MESSAGE_BATCH_MAX_ROWS = int(os.environ.get('MESSAGE_BATCH_MAX_ROWS', '100'))
+
+# Encodeur JSON des trames WebSocket et des réponses JSON (voir chat/codec.py):
+# 'auto' = orjson s'il est installé, sinon json
+JSON_CODEC = os.environ.get('JSON_CODEC', 'auto')
+
+# File d'envoi par connexion WebSocket (voir chat/outbound.py)
+OUTBOUND_QUEUE_SIZE = int(os.environ.get('OUTBOUND_QUEUE_SIZE', '256'))
+OUTBOUND_SLOW_SECONDS = float(os.environ.get('OUTBOUND_SLOW_SECONDS', '10'))
+OUTBOUND_SLOW_POLICY = os.environ.get('OUTBOUND_SLOW_POLICY', 'snapshot')  # ou 'disconnect'
+OUTBOUND_MAX_SNAPSHOTS = 3        # resync successifs avant déconnexion
+OUTBOUND_RESUME_MAX_AGE = 300     # validité du jeton de reprise (secondes)
+
+# Reprise des salons après reconnexion (voir chat/streams.py)
+ROOM_STREAM_SIZE = 256        # messages gardés en mémoire par salon
+ROOM_STREAM_MAX_ROOMS = 1000  # salons suivis par processus
+RESUME_MAX_MESSAGES = 200     # au-delà: dernière page ('resync')
+
+# Limitation de débit des actions WebSocket (voir chat/ratelimit.py):
+# (jetons par seconde, burst) par utilisateur et par salon; 'default' pour les autres actions
+RATE_LIMIT_STORE = os.environ.get('RATE_LIMIT_STORE', 'memory')  # ou 'cache' (partagé via CACHES)
+RATE_LIMITS = {
+    'message': {'user': (2, 10), 'room': (20, 60)},
+    'mark_read': {'user': (2, 10)},
+    'delete_message': {'user': (2, 10)},
+    'add_member': {'user': (0.5, 5)},
+    'remove_member': {'user': (0.5, 5)},
+    'default': {'user': (5, 20)},
 }
 
+# Endpoint /metrics (Prometheus): jeton Bearer exigé s'il est défini,
+# sinon accès réservé au staff (et aux appels locaux en DEBUG)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -139,6 +223,36 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Fichiers des messages et avatars stockés par contenu, dédupliqués (voir chat/storage.py)
+STORAGES = {
+    'default': {'BACKEND': 'chat.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Délai avant suppression d'un blob sans référence (collect_blobs)
+BLOB_GC_GRACE_HOURS = 24
+# Service des médias (chat/media.py): si réglé, le serveur web envoie les
+# fichiers (nginx: location interne '/protected-media/' -> MEDIA_ROOT)
+MEDIA_ACCEL_REDIRECT = os.environ.get('MEDIA_ACCEL_REDIRECT', '')
+MEDIA_ACCEL_HEADER = os.environ.get('MEDIA_ACCEL_HEADER', 'X-Accel-Redirect')  # ou X-Sendfile (Apache)
+
+# Envoi de fichiers par morceaux (voir chat/uploads.py)
+UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', str(100 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = 1024 * 1024          # taille conseillée aux clients
+UPLOAD_MAX_CHUNK_SIZE = 8 * 1024 * 1024  # au-delà, le morceau est refusé
+UPLOAD_TEMP_DIR = MEDIA_ROOT / 'uploads_tmp'
+UPLOAD_EXPIRY_HOURS = 24
+
+# Miniatures des images partagées (voir chat/thumbnails.py)
+THUMBNAIL_SIZES = (320, 960)
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+
+# Archivage des anciens messages hors de la base (voir chat/archive.py).
+# Rétention en jours, 0 = jamais; Room.retention_days remplace la valeur des salons
+ARCHIVE_ROOT = BASE_DIR / 'archives'
+ROOM_RETENTION_DAYS = int(os.environ.get('ROOM_RETENTION_DAYS', '0'))
+PRIVATE_RETENTION_DAYS = int(os.environ.get('PRIVATE_RETENTION_DAYS', '0'))
+ARCHIVE_BATCH_SIZE = 1000  # messages par transaction (et au plus par segment)
+
 # Login settings
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'
@@ -24,6 +24,6 @@ urlpatterns = [
     path('', include('chat.urls')),
 ]
 
+# Les médias passent par chat.views.serve_media (contrôle d'accès), y compris en DEBUG
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)